@@ -0,0 +1,221 @@
+"""请求指标（Prometheus 文本格式）
+
+纯 ASGI 中间件记录每个请求的耗时、状态码、并发数以及请求内的数据库耗时
+（由 app.core.query_profiler 的引擎事件统计），
+/metrics 端点按 Prometheus 文本格式输出，并附带连接池与密码哈希线程池的即时状态。
+
+标签只使用路由模板（如 /api/quests/progress/{quest_id}），未匹配的路径统一记为
+"<unmatched>"，保证标签基数有界。指标保存在进程内，多进程部署时由 Prometheus
+分别抓取各实例。
+"""
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Sequence, Tuple
+import threading
+import time
+
+from starlette.routing import Match
+
+from app.core.query_profiler import profile_queries
+
+# 请求耗时分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 单请求数据库耗时分桶（秒）
+DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+UNMATCHED_ROUTE = "<unmatched>"
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    def dec(self, labels: Tuple[str, ...] = (), amount: float = 1) -> None:
+        self.inc(labels, -amount)
+
+    def set(self, labels: Tuple[str, ...], value: float) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def collect(self) -> Iterable[str]:
+        lines = list(super().collect())
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # 标签 -> [各桶计数..., 总和, 总数]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            slots = self._values.get(labels)
+            if slots is None:
+                slots = self._values[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                slots[index] += 1
+            slots[-2] += value
+            slots[-1] += 1
+
+    def collect(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted((labels, list(slots)) for labels, slots in self._values.items())
+        names = self.labelnames + ("le",)
+        for labels, slots in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, slots):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(names, labels + (_format_value(bound),))} {_format_value(cumulative)}"
+            yield f"{self.name}_bucket{_format_labels(names, labels + ('+Inf',))} {_format_value(slots[-1])}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(slots[-2])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {_format_value(slots[-1])}"
+
+
+REQUESTS_TOTAL = Counter(
+    "http_requests_total", "HTTP 请求总数", ("method", "route", "status"))
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP 请求耗时（秒）", ("method", "route"), LATENCY_BUCKETS)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "正在处理的 HTTP 请求数")
+REQUEST_DB_DURATION = Histogram(
+    "http_request_db_seconds", "单个请求内数据库执行耗时（秒）", ("method", "route"), DB_BUCKETS)
+REQUEST_DB_QUERIES = Counter(
+    "http_request_db_queries_total", "请求内执行的 SQL 语句数", ("method", "route"))
+
+
+def resolve_route(app, scope) -> str:
+    """返回请求匹配到的路由模板"""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", UNMATCHED_ROUTE)
+    return UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """记录请求耗时、状态码、并发数与数据库耗时的 ASGI 中间件"""
+
+    def __init__(self, app, skip_paths: Sequence[str] = ("/metrics",)):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status_holder = [500]
+        recorded = False
+        started = time.perf_counter()
+        profile = None
+
+        def record():
+            nonlocal recorded
+            if recorded:
+                return
+            recorded = True
+            elapsed = time.perf_counter() - started
+            REQUESTS_IN_FLIGHT.dec()
+            route = resolve_route(scope["app"], scope) if "app" in scope else UNMATCHED_ROUTE
+            labels = (scope["method"], route)
+            REQUESTS_TOTAL.inc(labels + (str(status_holder[0]),))
+            REQUEST_DURATION.observe(labels, elapsed)
+            REQUEST_DB_DURATION.observe(labels, profile.db_seconds)
+            REQUEST_DB_QUERIES.inc(labels, profile.statements)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+                if _is_event_stream(message):
+                    # SSE 长连接在响应头发出时即结束统计：耗时只计握手，连接时长不计入并发数与耗时直方图
+                    record()
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            with profile_queries() as profile:
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            record()
+
+
+def _is_event_stream(message) -> bool:
+    for name, value in message.get("headers", ()):
+        if name.lower() == b"content-type":
+            return value.startswith(b"text/event-stream")
+    return False
+
+
+def _sample_lines(name: str, documentation: str, value: float, labels: Dict[str, str] = None, kind: str = "gauge") -> List[str]:
+    labels = labels or {}
+    return [
+        f"# HELP {name} {documentation}",
+        f"# TYPE {name} {kind}",
+        f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {_format_value(value)}",
+    ]
+
+
+def render_metrics(pool_status: dict, password_stats: dict) -> str:
+    """输出全部指标，连接池与密码哈希线程池状态在抓取时即时读取"""
+    lines: List[str] = []
+    for metric in (REQUESTS_TOTAL, REQUEST_DURATION, REQUESTS_IN_FLIGHT, REQUEST_DB_DURATION, REQUEST_DB_QUERIES):
+        lines.extend(metric.collect())
+
+    pool_labels = {"profile": pool_status.get("profile", ""), "pool": pool_status.get("pool", "")}
+    for key, documentation in (
+        ("size", "连接池大小"),
+        ("checked_in", "空闲连接数"),
+        ("checked_out", "已借出连接数"),
+        ("overflow", "溢出连接数"),
+    ):
+        if key in pool_status:
+            lines.extend(_sample_lines(f"db_pool_{key}", documentation, pool_status[key], pool_labels))
+
+    lines.extend(_sample_lines("password_hash_workers", "密码哈希线程数", password_stats["workers"]))
+    lines.extend(_sample_lines("password_hash_queue_depth", "排队等待的密码哈希任务数", password_stats["queued"]))
+    lines.extend(_sample_lines("password_hash_running", "执行中的密码哈希任务数", password_stats["running"]))
+    lines.extend(_sample_lines("password_hash_completed_total", "已完成的密码哈希任务数", password_stats["completed"], kind="counter"))
+    lines.extend(_sample_lines("password_hash_max_wait_seconds", "密码哈希最长排队等待（秒）", password_stats["max_wait_ms"] / 1000))
+    return "\n".join(lines) + "\n"
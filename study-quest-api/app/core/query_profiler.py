@@ -0,0 +1,123 @@
+"""SQL 查询分析与 N+1 检测
+
+引擎上挂载的游标事件把每条语句的耗时记入当前上下文中所有活动的 QueryProfile，
+按语句文本（已参数化，即"语句形状"）计数；同一形状在一次请求中重复执行通常意味着
+逐行查询（N+1）。
+
+- QueryProfilerMiddleware：按请求统计，可在响应头 X-DB-Queries 中输出摘要，
+  重复形状达到阈值时记录告警日志
+- profile_queries() / assert_max_queries(n)：在测试中包住一次请求，断言查询条数上限：
+
+    with assert_max_queries(3):
+        await client.get("/api/quests/user", headers=headers)
+"""
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Sequence, Tuple
+import logging
+import time
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+QUERY_HEADER = "x-db-queries"
+
+# 当前上下文中正在统计的 QueryProfile（支持嵌套：测试外层 + 请求中间件）
+_active_profiles: ContextVar[Tuple["QueryProfile", ...]] = ContextVar("active_query_profiles", default=())
+
+
+class QueryProfile:
+    """一段代码内执行的 SQL 统计"""
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.shapes: Counter = Counter()
+
+    def record(self, statement: str, elapsed: float) -> None:
+        self.statements += 1
+        self.db_seconds += elapsed
+        self.shapes[statement] += 1
+
+    def duplicates(self, min_count: int = 2) -> List[Tuple[str, int]]:
+        """执行次数不少于 min_count 的语句形状，按次数降序"""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= min_count]
+
+    def summary(self) -> str:
+        duplicated = self.duplicates()
+        return (
+            f"count={self.statements}; time_ms={self.db_seconds * 1000:.1f}; "
+            f"duplicates={sum(count - 1 for _, count in duplicated)}"
+        )
+
+
+@contextmanager
+def profile_queries() -> Iterator[QueryProfile]:
+    """统计 with 块内（同一上下文）执行的 SQL"""
+    profile = QueryProfile()
+    token = _active_profiles.set(_active_profiles.get() + (profile,))
+    try:
+        yield profile
+    finally:
+        _active_profiles.reset(token)
+
+
+@contextmanager
+def assert_max_queries(limit: int) -> Iterator[QueryProfile]:
+    """测试辅助：with 块内的 SQL 条数超过 limit 时抛出 AssertionError"""
+    with profile_queries() as profile:
+        yield profile
+    if profile.statements > limit:
+        details = "\n".join(f"  x{count}: {shape}" for shape, count in profile.shapes.most_common())
+        raise AssertionError(f"执行了 {profile.statements} 条 SQL，超过上限 {limit}：\n{details}")
+
+
+def instrument_engine(engine) -> None:
+    """在引擎上挂载游标执行事件（每条语句计时后记入所有活动的 QueryProfile）"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        for profile in _active_profiles.get():
+            profile.record(statement, elapsed)
+
+
+class QueryProfilerMiddleware:
+    """按请求统计 SQL，可选输出响应头，重复语句形状达到阈值时告警"""
+
+    def __init__(self, app, emit_header: bool = False, duplicate_threshold: int = 5, skip_paths: Sequence[str] = ("/metrics",)):
+        self.app = app
+        self.emit_header = emit_header
+        self.duplicate_threshold = duplicate_threshold
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        with profile_queries() as profile:
+            async def send_wrapper(message):
+                if self.emit_header and message["type"] == "http.response.start":
+                    headers = list(message.get("headers", []))
+                    headers.append((QUERY_HEADER.encode("latin-1"), profile.summary().encode("latin-1")))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+
+        suspects = profile.duplicates(self.duplicate_threshold)
+        if suspects:
+            shape, count = suspects[0]
+            logger.warning(
+                "possible N+1 on %s %s: %s; top shape x%d: %s",
+                scope["method"], scope["path"], profile.summary(), count, " ".join(shape.split())[:200],
+            )
+
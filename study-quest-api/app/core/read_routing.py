@@ -0,0 +1,131 @@
+"""只读副本路由
+
+配置 REPLICA_DATABASE_URL 后，只读路由（排行榜、任务列表、统计、历史）通过 get_read_db
+使用副本会话，其余请求仍走主库。以下情况回退到主库：
+
+- 副本复制延迟超过 REPLICA_MAX_LAG 秒，或延迟检查失败（副本不可用）。
+  延迟最多每 REPLICA_LAG_CHECK_INTERVAL 秒在副本上检查一次，并发请求复用上次结果
+- 读己之写：同一令牌的写请求（POST/PUT/PATCH/DELETE 成功响应）之后
+  READ_YOUR_WRITES_WINDOW 秒内，该令牌的读请求固定走主库。标记保存在进程内，
+  多 worker 部署下只对处理写请求的 worker 生效
+"""
+from collections import OrderedDict
+from typing import Optional
+import asyncio
+import logging
+import time
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+# PostgreSQL 备库：WAL 已全部回放时延迟为 0（避免主库空闲时误判），否则为距最后回放事务的秒数
+PG_LAG_SQL = (
+    "SELECT CASE WHEN NOT pg_is_in_recovery() "
+    "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+UNSAFE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+
+class ReplicaLagMonitor:
+    """缓存副本复制延迟，判断副本当前是否可读"""
+
+    def __init__(self, engine: AsyncEngine, max_lag: float, interval: float):
+        self.engine = engine
+        self.max_lag = max_lag
+        self.interval = interval
+        self.lag: Optional[float] = None  # None 表示检查失败
+        self._checked_at = float("-inf")
+        self._lock = asyncio.Lock()
+        self.fallbacks = 0
+
+    async def _measure(self) -> float:
+        async with self.engine.connect() as conn:
+            if conn.dialect.name != "postgresql":
+                return 0.0
+            result = await conn.exec_driver_sql(PG_LAG_SQL)
+            return float(result.scalar_one() or 0)
+
+    async def healthy(self) -> bool:
+        if time.monotonic() - self._checked_at >= self.interval and not self._lock.locked():
+            async with self._lock:
+                try:
+                    self.lag = await self._measure()
+                except Exception as exc:
+                    if self.lag is not None:
+                        logger.warning("只读副本延迟检查失败，回退主库: %s", exc)
+                    self.lag = None
+                self._checked_at = time.monotonic()
+        ok = self.lag is not None and self.lag <= self.max_lag
+        if not ok:
+            self.fallbacks += 1
+        return ok
+
+    def stats(self) -> dict:
+        return {"lag_seconds": self.lag, "max_lag": self.max_lag, "lag_fallbacks": self.fallbacks}
+
+
+class RecentWriters:
+    """令牌 -> 读己之写截止时间（LRU，过期即失效）"""
+
+    def __init__(self, window: float, maxsize: int = 10000):
+        self.window = window
+        self.maxsize = maxsize
+        self._until: "OrderedDict[str, float]" = OrderedDict()
+        self.sticky_reads = 0
+
+    def mark(self, token: str) -> None:
+        self._until[token] = time.monotonic() + self.window
+        self._until.move_to_end(token)
+        while len(self._until) > self.maxsize:
+            self._until.popitem(last=False)
+
+    def is_sticky(self, token: Optional[str]) -> bool:
+        if not token:
+            return False
+        until = self._until.get(token)
+        if until is None:
+            return False
+        if until <= time.monotonic():
+            del self._until[token]
+            return False
+        self.sticky_reads += 1
+        return True
+
+    def stats(self) -> dict:
+        return {"sticky_tokens": len(self._until), "sticky_reads": self.sticky_reads}
+
+
+def bearer_token(headers) -> Optional[str]:
+    """从 ASGI 头列表或 Starlette Headers 中取 Bearer 令牌"""
+    if isinstance(headers, list):
+        value = next((v for k, v in headers if k == b"authorization"), b"").decode("latin-1")
+    else:
+        value = headers.get("authorization", "")
+    scheme, _, token = value.partition(" ")
+    return token if scheme.lower() == "bearer" and token else None
+
+
+class ReadYourWritesMiddleware:
+    """写请求成功后标记其令牌，短时间内该令牌的读请求固定走主库"""
+
+    def __init__(self, app, writers: RecentWriters):
+        self.app = app
+        self.writers = writers
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in UNSAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+        token = bearer_token(scope["headers"])
+        if token is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                self.writers.mark(token)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
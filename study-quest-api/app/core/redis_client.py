@@ -0,0 +1,25 @@
+"""可选的 Redis 连接
+
+redis 库未安装或服务不可用时返回 None，由调用方回退到进程内实现。
+"""
+import logging
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+async def connect_redis(purpose: str):
+    """连接 REDIS_URL 并 ping 一次，失败时记录告警并返回 None"""
+    try:
+        import redis.asyncio as aioredis
+    except ImportError:
+        return None
+    client = aioredis.from_url(settings.redis_url)
+    try:
+        await client.ping()
+    except Exception as exc:
+        logger.warning("Redis 不可用，%s回退到进程内实现: %s", purpose, exc)
+        await client.close()
+        return None
+    return client
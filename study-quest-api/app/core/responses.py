@@ -0,0 +1,38 @@
+"""响应序列化
+
+项目默认使用 orjson 输出 JSON（未安装时回退到标准 JSONResponse）。
+对需要预先序列化的列表（如任务目录缓存），用 TypeAdapter 直接从 ORM 对象按
+from_attributes 校验并由 pydantic-core 生成 JSON 字节，跳过逐字段构造模型与
+jsonable_encoder 的二次遍历。
+"""
+from functools import lru_cache
+from typing import Any, Iterable, List, Type
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, TypeAdapter
+
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse as DefaultJSONResponse
+except ImportError:  # pragma: no cover - orjson 为可选依赖
+    orjson = None
+    DefaultJSONResponse = JSONResponse
+
+
+@lru_cache(maxsize=None)
+def _list_adapter(model: Type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(List[model])
+
+
+def dump_models_json(model: Type[BaseModel], rows: Iterable[Any]) -> bytes:
+    """把 ORM 对象或 Row 映射列表按 model 校验后直接输出 JSON 字节"""
+    adapter = _list_adapter(model)
+    return adapter.dump_json(adapter.validate_python(list(rows), from_attributes=True))
+
+
+def dump_json(content: Any) -> bytes:
+    """序列化已是 JSON 兼容结构的数据（dict/list/Row 映射）"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    import json
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
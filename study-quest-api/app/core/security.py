@@ -1,20 +1,101 @@
 from datetime import datetime, timedelta
-from typing import Optional, Union, Any
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, NamedTuple, Optional, Set, Union, Any
+import asyncio
+import threading
+import time
+from fastapi import Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.config import settings
+from app.database import get_db, User
 
 # 密码加密上下文
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.bcrypt_rounds)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """验证密码"""
+    """验证密码（同步，会阻塞调用线程；请求处理中请使用 verify_password_async）"""
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    """获取密码哈希值"""
+    """获取密码哈希值（同步，会阻塞调用线程；请求处理中请使用 get_password_hash_async）"""
     return pwd_context.hash(password)
 
+def password_needs_rehash(hashed_password: str) -> bool:
+    """哈希的成本因子是否与当前配置不一致"""
+    try:
+        return int(hashed_password.split("$")[2]) != settings.bcrypt_rounds
+    except (IndexError, ValueError):
+        return True
+
+class PasswordHasherPool:
+    """有界线程池：bcrypt 计算期间释放 GIL，放到线程中执行即可不阻塞事件循环"""
+    
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+    
+    def _run(self, submitted_at: float, fn, args):
+        wait = time.perf_counter() - submitted_at
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.total_wait_seconds += wait
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+    
+    async def run(self, fn, *args):
+        with self._lock:
+            self.queued += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), self._run, time.perf_counter(), fn, args)
+    
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "avg_wait_ms": round(self.total_wait_seconds / self.completed * 1000, 2) if self.completed else 0.0,
+                "max_wait_ms": round(self.max_wait_seconds * 1000, 2),
+            }
+    
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+password_pool = PasswordHasherPool(settings.password_hash_workers)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """在线程池中验证密码"""
+    return await password_pool.run(pwd_context.verify, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """在线程池中计算密码哈希"""
+    return await password_pool.run(pwd_context.hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """创建访问令牌"""
     to_encode = data.copy()
@@ -33,4 +114,150 @@ def verify_token(token: str) -> dict:
         payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
         return payload
     except JWTError:
-        raise ValueError("无效的令牌") 
\ No newline at end of file
+        raise ValueError("无效的令牌") 
+
+class TokenPrincipal(NamedTuple):
+    user_id: int
+    role: str
+    is_active: bool
+
+class VerifiedTokenCache:
+    """已验证令牌的 LRU + TTL 缓存：token -> (principal, 过期时间)"""
+    
+    def __init__(self, maxsize: int, ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._tokens_by_user: Dict[int, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, token: str) -> Optional[TokenPrincipal]:
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        principal, expires_at = entry
+        if expires_at <= time.time():
+            self._discard(token)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return principal
+    
+    def put(self, token: str, principal: TokenPrincipal, token_exp: Optional[float] = None) -> None:
+        expires_at = time.time() + self.ttl
+        if token_exp is not None:
+            # 缓存不能比令牌本身活得更久
+            expires_at = min(expires_at, token_exp)
+        self._entries[token] = (principal, expires_at)
+        self._entries.move_to_end(token)
+        self._tokens_by_user.setdefault(principal.user_id, set()).add(token)
+        while len(self._entries) > self.maxsize:
+            oldest = next(iter(self._entries))
+            self._discard(oldest)
+    
+    def _discard(self, token: str) -> None:
+        entry = self._entries.pop(token, None)
+        if entry is not None:
+            tokens = self._tokens_by_user.get(entry[0].user_id)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._tokens_by_user[entry[0].user_id]
+    
+    def invalidate_user(self, user_id: int) -> None:
+        for token in list(self._tokens_by_user.get(user_id, ())):
+            self._discard(token)
+    
+    def clear(self) -> None:
+        self._entries.clear()
+        self._tokens_by_user.clear()
+    
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+token_cache = VerifiedTokenCache(settings.token_cache_size, settings.token_cache_ttl)
+
+def invalidate_user_tokens(user_id: int) -> None:
+    """用户被禁用、改角色或改密码后调用，使其已缓存的令牌重新校验
+
+    目前还没有禁用用户或修改角色的接口；新增此类接口时须在提交后调用。只清理本进程的缓存，
+    其他 worker 在 TOKEN_CACHE_TTL 内仍沿用旧的身份（状态直接改库时同理）。
+    """
+    token_cache.invalidate_user(user_id)
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
+
+# 长连接票据的用途声明（实时推送 / 对战房间）；带 scope 的令牌不能当作访问令牌使用
+EVENT_STREAM_SCOPE = "events"
+BATTLE_SOCKET_SCOPE = "battle"
+
+def create_stream_ticket(user_id: int, access_expires_at: Optional[int], scope: str = EVENT_STREAM_SCOPE) -> str:
+    """签发短时效的长连接票据，stream_exp 记录签发它的访问令牌的过期时间"""
+    return create_access_token(
+        {"sub": str(user_id), "scope": scope, "stream_exp": access_expires_at},
+        expires_delta=timedelta(seconds=settings.live_ticket_seconds),
+    )
+
+def token_deadline(token: str) -> Optional[float]:
+    """令牌（或票据对应的访问令牌）的过期时间戳，长连接到期后应断开"""
+    try:
+        payload = verify_token(token)
+    except ValueError:
+        return None
+    return payload.get("stream_exp") or payload.get("exp")
+
+async def authenticate_token(db: AsyncSession, token: str, scope: Optional[str] = None) -> Optional[TokenPrincipal]:
+    """解析令牌并返回用户身份，令牌无效或用户不存在时返回 None（WebSocket 等非依赖注入场景也可调用）
+
+    scope 为 None 时只接受访问令牌；传入 scope 时只接受该用途的票据，票据不进缓存，每次都查用户状态。
+    """
+    if scope is None:
+        principal = token_cache.get(token)
+        if principal is not None:
+            return principal
+    try:
+        payload = verify_token(token)
+        user_id = int(payload["sub"])
+    except (ValueError, KeyError, TypeError):
+        return None
+    if payload.get("scope") != scope:
+        return None
+    
+    # 未命中时查一次用户状态，之后在 TTL 内复用
+    result = await db.execute(select(User.role, User.is_active).where(User.id == user_id))
+    row = result.first()
+    if row is None:
+        return None
+    principal = TokenPrincipal(user_id=user_id, role=row.role, is_active=bool(row.is_active))
+    if scope is None:
+        token_cache.put(token, principal, payload.get("exp"))
+    return principal
+
+async def get_current_principal(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db)
+) -> TokenPrincipal:
+    """获取当前登录用户（令牌命中缓存时不访问数据库）"""
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="无法验证凭据",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    
+    principal = await authenticate_token(db, token)
+    if principal is None:
+        raise credentials_exception
+    
+    if not principal.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="账户已被禁用"
+        )
+    return principal
+
+async def get_current_user(principal: TokenPrincipal = Depends(get_current_principal)) -> int:
+    """获取当前用户ID"""
+    return principal.user_id
@@ -1,22 +1,22 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from passlib.context import CryptContext
-from datetime import datetime, timedelta
-from typing import Optional
-import jwt
+from sqlalchemy import select, update
+from datetime import timedelta
 
 from app.database import get_db, User
 from app.core.config import settings
-from app.core.security import create_access_token, verify_password
+from app.core.security import (
+    create_access_token,
+    verify_password_async,
+    get_password_hash_async,
+    password_needs_rehash,
+    get_current_user,
+)
 from app.schemas.auth import UserCreate, UserLogin, Token, UserResponse
 
 router = APIRouter()
 
-# 密码加密上下文
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 @router.post("/register", response_model=UserResponse)
 async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     """用户注册"""
@@ -42,7 +42,7 @@ async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
             )
     
     # 创建新用户
-    hashed_password = pwd_context.hash(user_data.password)
+    hashed_password = await get_password_hash_async(user_data.password)
     new_user = User(
         username=user_data.username,
         email=user_data.email,
@@ -55,27 +55,14 @@ async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     await db.commit()
     await db.refresh(new_user)
     
-    return UserResponse(
-        id=new_user.id,
-        username=new_user.username,
-        email=new_user.email,
-        role=new_user.role,
-        nickname=new_user.nickname,
-        avatar=new_user.avatar,
-        level=new_user.level,
-        experience=new_user.experience,
-        gold_coins=new_user.gold_coins,
-        created_at=new_user.created_at
-    )
+    return new_user
 
-@router.post("/login", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
-    """用户登录"""
-    # 查找用户
-    result = await db.execute(select(User).where(User.username == form_data.username))
+async def authenticate_user(db: AsyncSession, username: str, password: str) -> User:
+    """校验用户名密码，必要时透明地按当前成本因子重算哈希"""
+    result = await db.execute(select(User).where(User.username == username))
     user = result.scalar_one_or_none()
     
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not user or not await verify_password_async(password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="用户名或密码错误",
@@ -88,6 +75,24 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
             detail="账户已被禁用"
         )
     
+    if settings.password_rehash_on_login and password_needs_rehash(user.hashed_password):
+        new_hash = await get_password_hash_async(password)
+        # 仅当哈希未被并发修改时才替换
+        await db.execute(
+            update(User)
+            .where(User.id == user.id, User.hashed_password == user.hashed_password)
+            .values(hashed_password=new_hash)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+    
+    return user
+
+@router.post("/login", response_model=Token)
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    """用户登录"""
+    user = await authenticate_user(db, form_data.username, form_data.password)
+    
     # 创建访问令牌
     access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
     access_token = create_access_token(
@@ -106,22 +111,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
 @router.post("/login-json", response_model=Token)
 async def login_json(user_data: UserLogin, db: AsyncSession = Depends(get_db)):
     """JSON格式的用户登录"""
-    # 查找用户
-    result = await db.execute(select(User).where(User.username == user_data.username))
-    user = result.scalar_one_or_none()
-    
-    if not user or not verify_password(user_data.password, user.hashed_password):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="用户名或密码错误",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    
-    if not user.is_active:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="账户已被禁用"
-        )
+    user = await authenticate_user(db, user_data.username, user_data.password)
     
     # 创建访问令牌
     access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
@@ -150,40 +140,4 @@ async def get_current_user_info(current_user_id: int = Depends(get_current_user)
             detail="用户不存在"
         )
     
-    return UserResponse(
-        id=user.id,
-        username=user.username,
-        email=user.email,
-        role=user.role,
-        nickname=user.nickname,
-        avatar=user.avatar,
-        level=user.level,
-        experience=user.experience,
-        gold_coins=user.gold_coins,
-        created_at=user.created_at
-    )
-
-# 依赖注入函数
-async def get_current_user(token: str = Depends(settings.oauth2_scheme), db: AsyncSession = Depends(get_db)):
-    """获取当前用户"""
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="无法验证凭据",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    
-    try:
-        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-    except jwt.PyJWTError:
-        raise credentials_exception
-    
-    result = await db.execute(select(User).where(User.id == int(user_id)))
-    user = result.scalar_one_or_none()
-    
-    if user is None:
-        raise credentials_exception
-    
-    return user.id 
\ No newline at end of file
+    return user
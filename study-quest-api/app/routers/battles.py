@@ -1,41 +1,93 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
-from typing import List
+from sqlalchemy import select
+from typing import List, Optional
 from datetime import datetime
+import asyncio
+import time
 
-from app.database import get_db, User
-from app.core.security import get_current_user
+from app.database import get_db, get_read_db, AsyncSessionLocal, User, Quest
+from app.core.responses import DefaultJSONResponse
+from app.core.config import settings
+from app.core.read_routing import bearer_token
+from app.core.security import (
+    get_current_user, get_current_principal, authenticate_token, TokenPrincipal,
+    oauth2_scheme, verify_token, create_stream_ticket, token_deadline, BATTLE_SOCKET_SCOPE,
+)
+from app.schemas.battle import BattleRoomCreate, BattleRoomResponse
+from app.services.battle_rooms import get_battle_manager
+from app.services.live_updates import notify_reward
+from app.services.leaderboard import GLOBAL_BOARD, get_leaderboard_index, ensure_board, record_experience
+from app.services.rewards import credit_reward, pomodoro_reward, POMODORO_LEVEL_UP_BONUS
 
 router = APIRouter()
 
-@router.get("/leaderboard")
-async def get_leaderboard(
-    subject: str = None,
-    limit: int = 10,
-    db: AsyncSession = Depends(get_db)
-):
-    """获取排行榜"""
-    query = select(User).where(User.is_active == True).order_by(User.experience.desc())
+async def _leaderboard_rows(db: AsyncSession, entries, first_rank: int) -> list:
+    """把索引中的 (user_id, score) 补全为用户信息"""
+    if not entries:
+        return []
+    user_ids = [user_id for user_id, _ in entries]
+    # 只取需要的列，直接使用 Row 而不构造 ORM 对象
+    result = await db.execute(
+        select(User.id, User.username, User.nickname, User.level, User.experience, User.gold_coins)
+        .where(User.id.in_(user_ids))
+    )
+    users = {user.id: user for user in result.all()}
     
-    if subject:
-        # 这里可以根据学科过滤，需要额外的关联表
-        pass
-    
-    result = await db.execute(query.limit(limit))
-    users = result.scalars().all()
-    
-    leaderboard = []
-    for i, user in enumerate(users, 1):
-        leaderboard.append({
-            "rank": i,
+    rows = []
+    for offset, (user_id, score) in enumerate(entries):
+        user = users.get(user_id)
+        if not user:
+            continue
+        rows.append({
+            "rank": first_rank + offset,
+            "user_id": user.id,
             "username": user.nickname or user.username,
             "level": user.level,
             "experience": user.experience,
-            "gold_coins": user.gold_coins
+            "gold_coins": user.gold_coins,
+            "score": score
         })
+    return rows
+
+@router.get("/leaderboard")
+async def get_leaderboard(
+    subject: str = None,
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """获取排行榜（subject 为空时为总经验榜）"""
+    board = subject or GLOBAL_BOARD
+    await ensure_board(db, board)
+    index = await get_leaderboard_index()
+    entries = await index.top(board, limit)
+    # 行内只有基础类型，直接交给 orjson，跳过 jsonable_encoder 的逐项遍历
+    return DefaultJSONResponse(await _leaderboard_rows(db, entries, 1))
+
+@router.get("/leaderboard/me")
+async def get_my_rank(
+    subject: str = None,
+    radius: int = Query(2, ge=0, le=10),
+    current_user_id: int = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """获取我的排名及前后邻居"""
+    board = subject or GLOBAL_BOARD
+    await ensure_board(db, board)
+    index = await get_leaderboard_index()
+    position = await index.rank(board, current_user_id)
     
-    return leaderboard
+    if position is None:
+        return {"rank": None, "score": 0, "neighbours": []}
+    
+    rank, score = position
+    start = max(rank - radius, 0)
+    entries = await index.top(board, rank - start + radius + 1, offset=start)
+    return {
+        "rank": rank + 1,
+        "score": score,
+        "neighbours": await _leaderboard_rows(db, entries, start + 1)
+    }
 
 @router.post("/pomodoro-complete")
 async def complete_pomodoro(
@@ -45,38 +97,154 @@ async def complete_pomodoro(
     db: AsyncSession = Depends(get_db)
 ):
     """完成番茄钟学习"""
-    # 获取用户
-    user_result = await db.execute(select(User).where(User.id == current_user_id))
-    user = user_result.scalar_one_or_none()
+    # 计算奖励
+    experience_gain, gold_gain = pomodoro_reward(duration)
+    
+    reward = await credit_reward(
+        db,
+        current_user_id,
+        experience=experience_gain,
+        gold=gold_gain,
+        reason=f"番茄钟学习：{subject}",
+        level_up_bonus=POMODORO_LEVEL_UP_BONUS,
+        study_subject=subject,
+        study_duration=duration,
+        study_type="pomodoro",
+    )
     
-    if not user:
+    if not reward:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="用户不存在"
         )
     
-    # 计算奖励
-    experience_gain = (duration // 60) * 1  # 每分钟1经验
-    gold_gain = (duration // 60) * 0.4  # 每分钟0.4金币
-    
-    # 更新用户数据
-    user.experience += experience_gain
-    user.gold_coins += int(gold_gain)
-    
-    # 检查是否升级
-    new_level = (user.experience // 100) + 1
-    if new_level > user.level:
-        user.level = new_level
-        # 升级奖励
-        user.gold_coins += 50
-    
     await db.commit()
+    await record_experience(current_user_id, subject, experience_gain)
+    await notify_reward(current_user_id, reward, f"番茄钟学习：{subject}")
     
     return {
         "message": "番茄钟学习完成",
         "experience_gained": experience_gain,
-        "gold_gained": int(gold_gain),
-        "new_level": user.level,
-        "total_experience": user.experience,
-        "total_gold": user.gold_coins
-    } 
\ No newline at end of file
+        "gold_gained": gold_gain,
+        "new_level": reward.level,
+        "total_experience": reward.experience,
+        "total_gold": reward.gold_coins
+    }
+
+@router.post("/rooms", response_model=BattleRoomResponse)
+async def create_battle_room(
+    room_data: BattleRoomCreate,
+    current_user_id: int = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """创建组队对战房间（创建者为房主，需通过 WebSocket 加入）"""
+    if room_data.quest_id is not None:
+        result = await db.execute(select(Quest.id).where(Quest.id == room_data.quest_id))
+        if result.scalar_one_or_none() is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="任务不存在"
+            )
+    
+    manager = await get_battle_manager()
+    room = await manager.create_room(
+        host_id=current_user_id,
+        subject=room_data.subject,
+        questions=[question.model_dump() for question in room_data.questions],
+        question_seconds=room_data.question_seconds,
+        max_players=room_data.max_players,
+        quest_id=room_data.quest_id,
+    )
+    return BattleRoomResponse(
+        room_id=room.room_id,
+        subject=room.subject,
+        host_id=room.host_id,
+        max_players=room.max_players,
+        question_count=len(room.questions),
+        question_seconds=room.question_seconds,
+    )
+
+async def _forward_events(websocket: WebSocket, queue: asyncio.Queue, user_id: int):
+    """把房间事件推送给当前连接（跳过发给其他玩家的私有事件）"""
+    while True:
+        event = await queue.get()
+        if event is None:
+            await websocket.close(code=1013)
+            return
+        target = event.get("to")
+        if target is not None:
+            if target != user_id:
+                continue
+            event = {key: value for key, value in event.items() if key != "to"}
+        await websocket.send_json(event)
+
+@router.post("/ticket")
+async def create_battle_ticket(
+    principal: TokenPrincipal = Depends(get_current_principal),
+    token: str = Depends(oauth2_scheme),
+):
+    """签发对战房间连接票据：浏览器 WebSocket 无法设置请求头，用短时效票据代替访问令牌放在 URL 中"""
+    return {
+        "ticket": create_stream_ticket(principal.user_id, verify_token(token).get("exp"), BATTLE_SOCKET_SCOPE),
+        "expires_in": settings.live_ticket_seconds,
+    }
+
+@router.websocket("/rooms/{room_id}/ws")
+async def battle_room_socket(websocket: WebSocket, room_id: str, ticket: Optional[str] = None):
+    """对战房间连接：客户端发送 start / answer / leave，服务端推送房间、题目、计分板与结算事件
+
+    用 ?ticket= 或 Authorization 头认证，访问令牌到期时断开。
+    """
+    token = ticket or bearer_token(websocket.headers)
+    # 只在握手时访问一次数据库（访问令牌命中缓存时不访问）
+    async with AsyncSessionLocal() as db:
+        principal = await authenticate_token(db, token, BATTLE_SOCKET_SCOPE if ticket else None) if token else None
+        name = None
+        if principal is not None and principal.is_active:
+            result = await db.execute(select(User.nickname, User.username).where(User.id == principal.user_id))
+            row = result.first()
+            name = row and (row.nickname or row.username)
+    if principal is None or not principal.is_active:
+        await websocket.close(code=4401)
+        return
+    
+    await websocket.accept()
+    user_id = principal.user_id
+    deadline = token_deadline(token)
+    manager = await get_battle_manager()
+    queue = manager.broker.subscribe(room_id)
+    sender = asyncio.create_task(_forward_events(websocket, queue, user_id))
+    try:
+        if not await manager.broker.send_command(room_id, {"type": "join", "user_id": user_id, "name": name}):
+            await websocket.send_json({"type": "error", "detail": "房间不存在"})
+            await websocket.close()
+            return
+        while True:
+            try:
+                timeout = None if deadline is None else max(deadline - time.time(), 0)
+                message = await asyncio.wait_for(websocket.receive_json(), timeout)
+            except asyncio.TimeoutError:
+                # 访问令牌已过期：客户端需刷新令牌、重新取票据后重连（对战中可凭同一账号断线重连）
+                await websocket.send_json({"type": "expired"})
+                await websocket.close(code=4401)
+                break
+            except ValueError:
+                await websocket.send_json({"type": "error", "detail": "消息格式错误"})
+                continue
+            kind = message.get("type") if isinstance(message, dict) else None
+            if kind == "leave":
+                break
+            if kind == "start":
+                command = {"type": "start", "user_id": user_id}
+            elif kind == "answer":
+                command = {"type": "answer", "user_id": user_id, "index": message.get("index"), "choice": message.get("choice")}
+            else:
+                await websocket.send_json({"type": "error", "detail": "未知的消息类型"})
+                continue
+            await manager.broker.send_command(room_id, command)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        manager.broker.unsubscribe(room_id, queue)
+        await manager.broker.send_command(room_id, {"type": "leave", "user_id": user_id})
@@ -1,12 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, and_
-from typing import List
-from datetime import datetime
+from sqlalchemy import select, update, and_, func
+from sqlalchemy.orm import contains_eager
+from typing import List, Optional
+from datetime import datetime, timezone
 
-from app.database import get_db, Quest, UserQuest, User
-from app.core.security import get_current_user
-from app.schemas.quest import QuestResponse, UserQuestResponse, QuestProgress
+from app.database import engine, get_db, get_read_db, Quest, UserQuest, upsert_insert
+from app.core.config import settings
+from app.core.responses import dump_models_json
+from app.core.security import get_current_user, get_current_principal, TokenPrincipal
+from app.services.leaderboard import record_experience
+from app.services.live_updates import notify_reward
+from app.services.rewards import credit_reward
+from app.services.quest_catalog import quest_catalog_cache, invalidate_quest_catalog, etag_matches
+from app.services.mistakes import review_quests
+from app.services.progress_buffer import progress_buffer, buffer_enabled
+from app.services.quest_assignment import assignment_period
+from app.schemas.quest import QuestResponse, UserQuestResponse, QuestProgress, QuestCreate, ReviewQuestResponse
 
 router = APIRouter()
 
@@ -15,80 +25,121 @@ async def get_quests(
     subject: str = None,
     difficulty: str = None,
     quest_type: str = None,
-    db: AsyncSession = Depends(get_db)
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """获取任务列表"""
-    query = select(Quest).where(Quest.is_active == True)
-    
-    if subject:
-        query = query.where(Quest.subject == subject)
-    if difficulty:
-        query = query.where(Quest.difficulty == difficulty)
-    if quest_type:
-        query = query.where(Quest.quest_type == quest_type)
+    """获取任务列表（带 ETag，命中 If-None-Match 时返回 304）"""
+    key = (subject, difficulty, quest_type)
+    cached = quest_catalog_cache.get(key)
     
-    result = await db.execute(query)
-    quests = result.scalars().all()
+    if cached is None:
+        query = select(Quest).where(Quest.is_active == True)
+        
+        if subject:
+            query = query.where(Quest.subject == subject)
+        if difficulty:
+            query = query.where(Quest.difficulty == difficulty)
+        if quest_type:
+            query = query.where(Quest.quest_type == quest_type)
+        
+        result = await db.execute(query.order_by(Quest.id))
+        quests = result.scalars().all()
+        
+        body = dump_models_json(QuestResponse, quests)
+        # 任务刚变更时副本可能尚未同步，此时副本结果只用于本次响应
+        store = db.bind is engine or not quest_catalog_cache.invalidated_within(settings.replica_max_lag)
+        cached = (quest_catalog_cache.put(key, body, store=store), body)
     
-    return [
-        QuestResponse(
-            id=quest.id,
-            title=quest.title,
-            description=quest.description,
-            subject=quest.subject,
-            difficulty=quest.difficulty,
-            experience_reward=quest.experience_reward,
-            gold_reward=quest.gold_reward,
-            deadline=quest.deadline,
-            quest_type=quest.quest_type,
-            created_at=quest.created_at
+    etag, body = cached
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@router.post("/", response_model=QuestResponse)
+async def create_quest(
+    quest_data: QuestCreate,
+    principal: TokenPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
+):
+    """创建任务（教师）"""
+    if principal.role != "teacher":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="只有教师可以创建任务"
         )
-        for quest in quests
-    ]
+    
+    quest = Quest(**quest_data.model_dump())
+    db.add(quest)
+    await db.commit()
+    await db.refresh(quest)
+    invalidate_quest_catalog()
+    
+    return quest
 
 @router.get("/user", response_model=List[UserQuestResponse])
 async def get_user_quests(
+    response: Response,
+    completed: Optional[bool] = None,
+    subject: str = None,
+    quest_type: str = None,
+    cursor: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=200),
     current_user_id: int = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """获取用户的任务列表"""
-    query = select(UserQuest).where(UserQuest.user_id == current_user_id)
-    result = await db.execute(query)
+    """获取用户的任务列表（按记录ID倒序的游标分页，下一页游标见 X-Next-Cursor 响应头）"""
+    # 单条 JOIN 查询同时加载任务详情
+    query = (
+        select(UserQuest)
+        .join(UserQuest.quest)
+        .options(contains_eager(UserQuest.quest))
+        .where(UserQuest.user_id == current_user_id)
+    )
+    
+    if completed is not None:
+        query = query.where(UserQuest.is_completed == completed)
+    if subject:
+        query = query.where(Quest.subject == subject)
+    if quest_type:
+        query = query.where(Quest.quest_type == quest_type)
+    if cursor is not None:
+        query = query.where(UserQuest.id < cursor)
+    
+    # 多取一条用于判断是否还有下一页
+    result = await db.execute(query.order_by(UserQuest.id.desc()).limit(limit + 1))
     user_quests = result.scalars().all()
     
-    quest_responses = []
-    for user_quest in user_quests:
-        # 获取任务详情
-        quest_result = await db.execute(select(Quest).where(Quest.id == user_quest.quest_id))
-        quest = quest_result.scalar_one_or_none()
-        
-        if quest:
-            quest_responses.append(UserQuestResponse(
-                id=user_quest.id,
-                quest_id=user_quest.quest_id,
-                user_id=user_quest.user_id,
-                is_completed=user_quest.is_completed,
-                progress=user_quest.progress,
-                score=user_quest.score,
-                time_spent=user_quest.time_spent,
-                attempts=user_quest.attempts,
-                completed_at=user_quest.completed_at,
-                created_at=user_quest.created_at,
-                quest=QuestResponse(
-                    id=quest.id,
-                    title=quest.title,
-                    description=quest.description,
-                    subject=quest.subject,
-                    difficulty=quest.difficulty,
-                    experience_reward=quest.experience_reward,
-                    gold_reward=quest.gold_reward,
-                    deadline=quest.deadline,
-                    quest_type=quest.quest_type,
-                    created_at=quest.created_at
-                )
-            ))
+    if len(user_quests) > limit:
+        user_quests = user_quests[:limit]
+        response.headers["X-Next-Cursor"] = str(user_quests[-1].id)
+    
+    # 叠加尚未写回的缓冲进度（本会话不提交，只影响本次响应）
+    pending = progress_buffer.peek(current_user_id) if buffer_enabled() else None
+    if pending:
+        for user_quest in user_quests:
+            for field, value in pending.get(user_quest.quest_id, {}).items():
+                setattr(user_quest, field, value)
     
-    return quest_responses
+    return user_quests
+
+@router.get("/review", response_model=List[ReviewQuestResponse])
+async def get_review_quests(
+    subject: str = None,
+    limit: int = Query(10, ge=1, le=50),
+    current_user_id: int = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """错题复习：按薄弱程度推荐覆盖错题知识点的任务"""
+    picked = await review_quests(db, current_user_id, limit=limit, subject=subject)
+    return [
+        ReviewQuestResponse(
+            **QuestResponse.model_validate(quest).model_dump(),
+            mistake_count=point["count"],
+            last_mistake_at=point["last_seen"],
+        )
+        for quest, point in picked
+    ]
 
 @router.post("/start/{quest_id}")
 async def start_quest(
@@ -98,41 +149,36 @@ async def start_quest(
 ):
     """开始任务"""
     # 检查任务是否存在
-    quest_result = await db.execute(select(Quest).where(Quest.id == quest_id))
-    quest = quest_result.scalar_one_or_none()
+    quest_result = await db.execute(select(Quest.quest_type).where(Quest.id == quest_id))
+    quest_type = quest_result.first()
     
-    if not quest:
+    if quest_type is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="任务不存在"
         )
     
-    # 检查用户是否已经有这个任务的记录
-    existing_result = await db.execute(
-        select(UserQuest).where(
-            and_(UserQuest.user_id == current_user_id, UserQuest.quest_id == quest_id)
-        )
-    )
-    existing_user_quest = existing_result.scalar_one_or_none()
-    
-    if existing_user_quest:
-        # 更新尝试次数
-        existing_user_quest.attempts += 1
-        await db.commit()
-        return {"message": "任务已开始", "user_quest_id": existing_user_quest.id}
-    
-    # 创建新的用户任务记录
-    new_user_quest = UserQuest(
+    # 按 (user_id, quest_id) 唯一索引 upsert：首次开始创建记录，再次开始累加尝试次数。
+    # 每日/每周任务记下当期，派发时不会把本期已完成的记录当作上一期重置
+    stmt = upsert_insert(db, UserQuest).values(
         user_id=current_user_id,
         quest_id=quest_id,
-        attempts=1
+        attempts=1,
+        assigned_on=assignment_period(quest_type[0])
     )
-    
-    db.add(new_user_quest)
+    result = await db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["user_id", "quest_id"],
+            set_={
+                "attempts": UserQuest.attempts + 1,
+                "assigned_on": func.coalesce(UserQuest.assigned_on, stmt.excluded.assigned_on),
+            }
+        ).returning(UserQuest.id)
+    )
+    user_quest_id = result.scalar_one()
     await db.commit()
-    await db.refresh(new_user_quest)
     
-    return {"message": "任务已开始", "user_quest_id": new_user_quest.id}
+    return {"message": "任务已开始", "user_quest_id": user_quest_id}
 
 @router.put("/progress/{quest_id}")
 async def update_quest_progress(
@@ -141,7 +187,37 @@ async def update_quest_progress(
     current_user_id: int = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """更新任务进度"""
+    """更新任务进度（缓冲模式下未完成的进度合并后批量写回，完成仍在请求内同步处理）"""
+    update_data = {}
+    if progress.progress is not None:
+        update_data["progress"] = progress.progress
+    if progress.score is not None:
+        update_data["score"] = progress.score
+    if progress.time_spent is not None:
+        update_data["time_spent"] = progress.time_spent
+    completing = progress.progress is not None and progress.progress >= 100
+    
+    if buffer_enabled():
+        if not completing:
+            user_quest_id = progress_buffer.known_id(current_user_id, quest_id)
+            if user_quest_id is None:
+                result = await db.execute(
+                    select(UserQuest.id).where(UserQuest.user_id == current_user_id, UserQuest.quest_id == quest_id)
+                )
+                user_quest_id = result.scalar_one_or_none()
+                if user_quest_id is None:
+                    raise HTTPException(
+                        status_code=status.HTTP_404_NOT_FOUND,
+                        detail="任务记录不存在"
+                    )
+                progress_buffer.remember(current_user_id, quest_id, user_quest_id)
+            if update_data:
+                progress_buffer.put(current_user_id, quest_id, user_quest_id, update_data)
+            return {"message": "进度已更新", "progress": progress.progress, "completed": False}
+        # 完成前取走缓冲中的进度，与本次上报合并后在同一事务中写入
+        pending = await progress_buffer.take(current_user_id, [quest_id])
+        update_data = {**pending.get(quest_id, {}), **update_data}
+    
     # 查找用户任务记录
     user_quest_result = await db.execute(
         select(UserQuest).where(
@@ -156,43 +232,55 @@ async def update_quest_progress(
             detail="任务记录不存在"
         )
     
-    # 更新进度
-    update_data = {}
-    if progress.progress is not None:
-        update_data["progress"] = progress.progress
-    if progress.score is not None:
-        update_data["score"] = progress.score
-    if progress.time_spent is not None:
-        update_data["time_spent"] = progress.time_spent
+    # 检查是否完成：仅当记录尚未完成时才标记完成并发放奖励，保证奖励只发一次
+    newly_completed = False
+    completed_at = datetime.now(timezone.utc)
+    if completing:
+        result = await db.execute(
+            update(UserQuest)
+            .where(UserQuest.id == user_quest.id, UserQuest.is_completed == False)
+            .values(**update_data, is_completed=True, completed_at=completed_at)
+            .returning(UserQuest.id)
+            .execution_options(synchronize_session=False)
+        )
+        newly_completed = result.first() is not None
     
-    # 检查是否完成
-    if progress.progress and progress.progress >= 100:
-        update_data["is_completed"] = True
-        update_data["completed_at"] = datetime.utcnow()
-        
+    if not newly_completed and update_data:
+        await db.execute(
+            update(UserQuest)
+            .where(UserQuest.id == user_quest.id)
+            .values(**update_data)
+        )
+    
+    quest = None
+    reward = None
+    if newly_completed:
+        # elo 依赖 numpy，按需导入以缩短冷启动
+        from app.services.elo import record_quest_results
+        await record_quest_results(
+            db, current_user_id, [(quest_id, update_data.get("score", user_quest.score))], completed_at
+        )
         # 获取任务奖励
         quest_result = await db.execute(select(Quest).where(Quest.id == quest_id))
         quest = quest_result.scalar_one_or_none()
         
         if quest:
-            # 更新用户经验值和金币
-            user_result = await db.execute(select(User).where(User.id == current_user_id))
-            user = user_result.scalar_one_or_none()
-            
-            if user:
-                user.experience += quest.experience_reward
-                user.gold_coins += quest.gold_reward
-                
-                # 检查是否升级
-                new_level = (user.experience // 100) + 1
-                if new_level > user.level:
-                    user.level = new_level
-    
-    await db.execute(
-        update(UserQuest)
-        .where(UserQuest.id == user_quest.id)
-        .values(**update_data)
-    )
+            reward = await credit_reward(
+                db,
+                current_user_id,
+                experience=quest.experience_reward,
+                gold=quest.gold_reward,
+                reason=f"完成任务：{quest.title}",
+                quest_id=quest.id,
+                study_subject=quest.subject,
+                study_duration=update_data.get("time_spent", user_quest.time_spent) or 0,
+                study_type="quest",
+            )
+    
     await db.commit()
     
-    return {"message": "进度已更新", "progress": progress.progress} 
\ No newline at end of file
+    if quest:
+        await record_experience(current_user_id, quest.subject, quest.experience_reward)
+        await notify_reward(current_user_id, reward, f"完成任务：{quest.title}", quests=[quest])
+    
+    return {"message": "进度已更新", "progress": progress.progress, "completed": newly_completed}
@@ -1,11 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, and_, func
+from sqlalchemy import select
 from typing import List
-from datetime import datetime
+from datetime import timedelta
 
-from app.database import get_db, User, RewardLog
+from app.database import get_db, get_read_db, User, RewardLog, RewardDailyRollup
 from app.core.security import get_current_user
+from app.services.rewards import spend_gold, utc_today
+from app.services.live_updates import notify_balance
 
 router = APIRouter()
 
@@ -13,7 +15,7 @@ router = APIRouter()
 async def get_reward_history(
     current_user_id: int = Depends(get_current_user),
     limit: int = 20,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """获取奖励历史记录"""
     query = select(RewardLog).where(RewardLog.user_id == current_user_id).order_by(RewardLog.created_at.desc())
@@ -48,47 +50,42 @@ async def exchange_game_time(
     # 计算所需金币
     required_gold = hours * 30  # 1小时 = 30金币
     
-    # 获取用户信息
-    user_result = await db.execute(select(User).where(User.id == current_user_id))
-    user = user_result.scalar_one_or_none()
-    
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="用户不存在"
-        )
+    # 原子扣除金币并记录兑换日志
+    remaining_gold = await spend_gold(
+        db,
+        current_user_id,
+        required_gold,
+        reward_type="game_time",
+        quantity=hours,
+        reason=f"兑换游戏时间 {hours} 小时"
+    )
     
-    if user.gold_coins < required_gold:
+    if remaining_gold is None:
+        user_result = await db.execute(select(User.id).where(User.id == current_user_id))
+        if user_result.scalar_one_or_none() is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="用户不存在"
+            )
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="金币不足"
         )
     
-    # 扣除金币
-    user.gold_coins -= required_gold
-    
-    # 记录奖励日志
-    reward_log = RewardLog(
-        user_id=current_user_id,
-        reward_type="game_time",
-        amount=hours,
-        reason=f"兑换游戏时间 {hours} 小时"
-    )
-    
-    db.add(reward_log)
     await db.commit()
+    await notify_balance(current_user_id, gold_coins=remaining_gold)
     
     return {
         "message": f"成功兑换 {hours} 小时游戏时间",
         "gold_spent": required_gold,
-        "remaining_gold": user.gold_coins,
+        "remaining_gold": remaining_gold,
         "game_time_hours": hours
     }
 
 @router.get("/stats")
 async def get_reward_stats(
     current_user_id: int = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """获取奖励统计信息"""
     # 获取用户信息
@@ -101,30 +98,15 @@ async def get_reward_stats(
             detail="用户不存在"
         )
     
-    # 获取今日获得的经验值
-    today = datetime.utcnow().date()
-    today_rewards = await db.execute(
-        select(RewardLog).where(
-            and_(
-                RewardLog.user_id == current_user_id,
-                RewardLog.reward_type == "experience",
-                func.date(RewardLog.created_at) == today
-            )
+    # 今日汇总：直接读取日汇总表的预计算行
+    result = await db.execute(
+        select(RewardDailyRollup.reward_type, RewardDailyRollup.amount).where(
+            RewardDailyRollup.user_id == current_user_id,
+            RewardDailyRollup.day == utc_today(),
+            RewardDailyRollup.reward_type.in_(["experience", "gold"])
         )
     )
-    today_experience = sum(reward.amount for reward in today_rewards.scalars().all())
-    
-    # 获取今日获得的金币
-    today_gold = await db.execute(
-        select(RewardLog).where(
-            and_(
-                RewardLog.user_id == current_user_id,
-                RewardLog.reward_type == "gold",
-                func.date(RewardLog.created_at) == today
-            )
-        )
-    )
-    today_gold_amount = sum(reward.amount for reward in today_gold.scalars().all())
+    today = dict(result.all())
     
     return {
         "current_level": user.level,
@@ -132,6 +114,34 @@ async def get_reward_stats(
         "current_gold": user.gold_coins,
         "experience_to_next_level": (user.level * 100) - user.experience,
         "level_progress": (user.experience % 100) / 100 * 100,
-        "today_experience_gained": today_experience,
-        "today_gold_gained": today_gold_amount
-    } 
\ No newline at end of file
+        "today_experience_gained": today.get("experience", 0),
+        "today_gold_gained": today.get("gold", 0)
+    }
+
+@router.get("/daily")
+async def get_daily_rewards(
+    days: int = Query(7, ge=1, le=366),
+    current_user_id: int = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """获取最近若干天的每日奖励汇总（用于历史图表与家长报表）"""
+    end = utc_today()
+    start = end - timedelta(days=days - 1)
+    result = await db.execute(
+        select(RewardDailyRollup.day, RewardDailyRollup.reward_type, RewardDailyRollup.amount)
+        .where(
+            RewardDailyRollup.user_id == current_user_id,
+            RewardDailyRollup.day >= start,
+            RewardDailyRollup.day <= end
+        )
+        .order_by(RewardDailyRollup.day)
+    )
+    
+    daily = {}
+    for day, reward_type, amount in result.all():
+        daily.setdefault(day, {})[reward_type] = amount
+    
+    return [
+        {"day": start + timedelta(days=offset), **daily.get(start + timedelta(days=offset), {})}
+        for offset in range(days)
+    ]
@@ -0,0 +1,241 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update
+from sqlalchemy.orm import contains_eager
+from datetime import datetime, timedelta, timezone
+
+from app.database import get_db, User, UserQuest, ClientEvent, upsert_insert
+from app.core.security import get_current_user
+from app.schemas.sync import SyncBatch, SyncBatchResponse, SyncEventResult, PomodoroEvent, ProgressEvent
+from app.services.leaderboard import record_experience
+from app.services.live_updates import notify_reward
+from app.services.progress_buffer import progress_buffer, buffer_enabled
+from app.services.rewards import credit_reward, pomodoro_reward, EXPERIENCE_PER_LEVEL, POMODORO_LEVEL_UP_BONUS
+
+router = APIRouter()
+
+# 允许客户端时钟超前服务器的最大偏差
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+@router.post("/events", response_model=SyncBatchResponse)
+async def sync_events(
+    batch: SyncBatch,
+    current_user_id: int = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """批量上报离线期间的番茄钟与任务进度事件（按 client_event_id 去重，单事务应用）"""
+    results = {}
+    now = datetime.now(timezone.utc)
+
+    # 校验：批内重复与未来时间
+    valid = []
+    for event in batch.events:
+        occurred_at = event.occurred_at if event.occurred_at.tzinfo else event.occurred_at.replace(tzinfo=timezone.utc)
+        if event.client_event_id in results:
+            continue
+        if occurred_at > now + MAX_CLOCK_SKEW:
+            results[event.client_event_id] = SyncEventResult(
+                client_event_id=event.client_event_id, status="rejected", detail="事件时间晚于服务器时间"
+            )
+            continue
+        results[event.client_event_id] = None
+        valid.append((occurred_at, event))
+
+    # 一次查询加载所有涉及的用户任务记录
+    quest_ids = {event.quest_id for _, event in valid if isinstance(event, ProgressEvent)}
+    user_quests = {}
+    if quest_ids:
+        result = await db.execute(
+            select(UserQuest)
+            .join(UserQuest.quest)
+            .options(contains_eager(UserQuest.quest))
+            .where(UserQuest.user_id == current_user_id, UserQuest.quest_id.in_(quest_ids))
+        )
+        user_quests = {user_quest.quest_id: user_quest for user_quest in result.scalars().all()}
+
+    accepted = []
+    for occurred_at, event in valid:
+        if isinstance(event, ProgressEvent) and event.quest_id not in user_quests:
+            results[event.client_event_id] = SyncEventResult(
+                client_event_id=event.client_event_id, status="rejected", detail="任务记录不存在"
+            )
+            continue
+        accepted.append((occurred_at, event))
+
+    # 认领事件ID：已存在的即为重复上报
+    claimed = set()
+    if accepted:
+        stmt = upsert_insert(db, ClientEvent).values([
+            {"user_id": current_user_id, "client_event_id": event.client_event_id, "event_type": event.type}
+            for _, event in accepted
+        ])
+        result = await db.execute(
+            stmt.on_conflict_do_nothing(index_elements=["user_id", "client_event_id"])
+            .returning(ClientEvent.client_event_id)
+        )
+        claimed = set(result.scalars().all())
+
+    ledger = []
+    study_records = []
+    subject_experience = {}
+    progress_by_quest = {}
+    # (发生时间, 经验, 番茄钟事件ID 或 None)：按时间重放以计算升级奖励
+    experience_timeline = []
+    has_pomodoro = False
+
+    # 写合并缓冲中尚未写回的在线进度作为起点，离线事件在其上按时间覆盖
+    progress_quests = {event.quest_id for _, event in accepted
+                       if isinstance(event, ProgressEvent) and event.client_event_id in claimed}
+    if progress_quests and buffer_enabled():
+        for quest_id, values in (await progress_buffer.take(current_user_id, progress_quests)).items():
+            progress_by_quest[quest_id] = {"values": values, "completed_by": None, "occurred_at": now}
+
+    for occurred_at, event in sorted(accepted, key=lambda item: item[0]):
+        if event.client_event_id not in claimed:
+            results[event.client_event_id] = SyncEventResult(
+                client_event_id=event.client_event_id, status="duplicate"
+            )
+            continue
+
+        if isinstance(event, PomodoroEvent):
+            experience_gain, gold_gain = pomodoro_reward(event.duration)
+            has_pomodoro = True
+            reason = f"番茄钟学习：{event.subject}"
+            ledger.append({"reward_type": "experience", "amount": experience_gain, "reason": reason, "quest_id": None})
+            ledger.append({"reward_type": "gold", "amount": gold_gain, "reason": reason, "quest_id": None})
+            study_records.append({
+                "subject": event.subject, "duration": event.duration, "study_type": "pomodoro",
+                "quest_id": None, "created_at": occurred_at
+            })
+            subject_experience[event.subject] = subject_experience.get(event.subject, 0) + experience_gain
+            experience_timeline.append((occurred_at, experience_gain, event.client_event_id))
+            results[event.client_event_id] = SyncEventResult(
+                client_event_id=event.client_event_id, status="applied",
+                experience_gained=experience_gain, gold_gained=gold_gain
+            )
+        else:
+            # 同一任务的多次进度按时间顺序合并，只写最终状态
+            state = progress_by_quest.setdefault(event.quest_id, {"values": {}, "completed_by": None, "occurred_at": occurred_at})
+            for field in ("progress", "score", "time_spent"):
+                value = getattr(event, field)
+                if value is not None:
+                    state["values"][field] = value
+            if event.progress is not None and event.progress >= 100 and state["completed_by"] is None:
+                state["completed_by"] = event.client_event_id
+                state["occurred_at"] = occurred_at
+            results[event.client_event_id] = SyncEventResult(
+                client_event_id=event.client_event_id, status="applied"
+            )
+
+    # 标记完成：仅对尚未完成的记录生效，保证任务奖励只发一次
+    completing = {quest_id: state for quest_id, state in progress_by_quest.items() if state["completed_by"]}
+    newly_completed = set()
+    if completing:
+        result = await db.execute(
+            update(UserQuest)
+            .where(
+                UserQuest.id.in_([user_quests[quest_id].id for quest_id in completing]),
+                UserQuest.is_completed == False
+            )
+            .values(is_completed=True, completed_at=now)
+            .returning(UserQuest.quest_id)
+            .execution_options(synchronize_session=False)
+        )
+        newly_completed = set(result.scalars().all())
+        # elo 依赖 numpy，按需导入以缩短冷启动
+        from app.services.elo import record_quest_results
+        await record_quest_results(db, current_user_id, [
+            (quest_id, completing[quest_id]["values"].get("score", user_quests[quest_id].score))
+            for quest_id in sorted(newly_completed)
+        ], now)
+
+    # 进度字段按主键批量更新
+    progress_rows = [
+        {"id": user_quests[quest_id].id, **state["values"]}
+        for quest_id, state in progress_by_quest.items() if state["values"]
+    ]
+    for keys in {tuple(sorted(row)) for row in progress_rows}:
+        await db.execute(
+            update(UserQuest).execution_options(synchronize_session=False),
+            [row for row in progress_rows if tuple(sorted(row)) == keys]
+        )
+
+    for quest_id in newly_completed:
+        state = completing[quest_id]
+        quest = user_quests[quest_id].quest
+        reason = f"完成任务：{quest.title}"
+        ledger.append({"reward_type": "experience", "amount": quest.experience_reward, "reason": reason, "quest_id": quest.id})
+        ledger.append({"reward_type": "gold", "amount": quest.gold_reward, "reason": reason, "quest_id": quest.id})
+        time_spent = state["values"].get("time_spent", user_quests[quest_id].time_spent) or 0
+        if time_spent > 0:
+            study_records.append({
+                "subject": quest.subject, "duration": time_spent, "study_type": "quest",
+                "quest_id": quest.id, "created_at": state["occurred_at"]
+            })
+        subject_experience[quest.subject] = subject_experience.get(quest.subject, 0) + quest.experience_reward
+        experience_timeline.append((state["occurred_at"], quest.experience_reward, None))
+        event_result = results[state["completed_by"]]
+        event_result.experience_gained = quest.experience_reward
+        event_result.gold_gained = quest.gold_reward
+
+    # 升级奖励与逐条调用在线接口一致：只有跨过整百经验的番茄钟各发一次，完成任务不发。
+    # 锁定用户行读取当前经验，按事件时间重放
+    level_up_bonus = 0
+    if has_pomodoro:
+        result = await db.execute(
+            select(User.experience).where(User.id == current_user_id).with_for_update()
+        )
+        running = result.scalar_one_or_none() or 0
+        for _, experience_gain, event_id in sorted(experience_timeline, key=lambda item: item[0]):
+            before, running = running, running + experience_gain
+            if event_id is not None and running // EXPERIENCE_PER_LEVEL > before // EXPERIENCE_PER_LEVEL:
+                ledger.append({"reward_type": "gold", "amount": POMODORO_LEVEL_UP_BONUS,
+                               "reason": f"升级到 {running // EXPERIENCE_PER_LEVEL + 1} 级奖励", "quest_id": None})
+                results[event_id].gold_gained += POMODORO_LEVEL_UP_BONUS
+                level_up_bonus += POMODORO_LEVEL_UP_BONUS
+
+    # 早于热力图汇总水位线的学习记录不会再被汇总，时间截到水位线，时长仍计入
+    if study_records:
+        # heatmap 依赖 numpy，按需导入以缩短冷启动
+        from app.services.heatmap import get_watermark
+        watermark = await get_watermark(db)
+        if watermark is not None:
+            for record in study_records:
+                if record["created_at"] < watermark:
+                    record["created_at"] = watermark
+
+    # 汇总后对用户只做一次原子更新
+    experience_total = sum(entry["amount"] for entry in ledger if entry["reward_type"] == "experience")
+    gold_total = sum(entry["amount"] for entry in ledger if entry["reward_type"] == "gold")
+    reward = None
+    if ledger or study_records:
+        reward = await credit_reward(
+            db,
+            current_user_id,
+            experience=experience_total,
+            gold=gold_total,
+            ledger=ledger,
+            study_records=study_records,
+        )
+        if not reward:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="用户不存在"
+            )
+        reward.level_up_bonus = level_up_bonus
+
+    await db.commit()
+
+    for subject, amount in subject_experience.items():
+        await record_experience(current_user_id, subject, amount)
+    await notify_reward(current_user_id, reward, "离线同步",
+                        quests=[user_quests[quest_id].quest for quest_id in sorted(newly_completed)])
+
+    return SyncBatchResponse(
+        results=[results[event_id] for event_id in results],
+        experience_gained=experience_total,
+        gold_gained=reward.gold_gained if reward else 0,
+        level=reward.level if reward else None,
+        experience=reward.experience if reward else None,
+        gold_coins=reward.gold_coins if reward else None,
+    )
@@ -1,18 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, update
-from typing import List
+from typing import List, Optional
+from datetime import date, datetime, timedelta, timezone
 
-from app.database import get_db, User
+from app.database import get_db, get_read_db, read_session_factory, User, StudentRating
+from app.core.read_routing import bearer_token
 from app.schemas.auth import UserResponse
-from app.core.security import get_current_user
+from app.schemas.quest import MistakeResponse
+from app.services.mistakes import weakest_points
+from app.services.exports import DATASETS, export_media, stream_export
+from app.services.live_updates import EventStreamResponse, encode_event, get_live_hub
+from app.core.config import settings
+from app.core.security import (
+    get_current_user, get_current_principal, authenticate_token, TokenPrincipal,
+    oauth2_scheme, verify_token, create_stream_ticket, token_deadline, EVENT_STREAM_SCOPE,
+)
 
 router = APIRouter()
 
 @router.get("/profile", response_model=UserResponse)
 async def get_user_profile(
     current_user_id: int = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """获取用户个人资料"""
     result = await db.execute(select(User).where(User.id == current_user_id))
@@ -24,18 +35,7 @@ async def get_user_profile(
             detail="用户不存在"
         )
     
-    return UserResponse(
-        id=user.id,
-        username=user.username,
-        email=user.email,
-        role=user.role,
-        nickname=user.nickname,
-        avatar=user.avatar,
-        level=user.level,
-        experience=user.experience,
-        gold_coins=user.gold_coins,
-        created_at=user.created_at
-    )
+    return user
 
 @router.put("/profile", response_model=UserResponse)
 async def update_user_profile(
@@ -68,23 +68,12 @@ async def update_user_profile(
     result = await db.execute(select(User).where(User.id == current_user_id))
     user = result.scalar_one_or_none()
     
-    return UserResponse(
-        id=user.id,
-        username=user.username,
-        email=user.email,
-        role=user.role,
-        nickname=user.nickname,
-        avatar=user.avatar,
-        level=user.level,
-        experience=user.experience,
-        gold_coins=user.gold_coins,
-        created_at=user.created_at
-    )
+    return user
 
 @router.get("/stats")
 async def get_user_stats(
     current_user_id: int = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """获取用户统计信息"""
     result = await db.execute(select(User).where(User.id == current_user_id))
@@ -102,4 +91,157 @@ async def get_user_stats(
         "gold_coins": user.gold_coins,
         "experience_to_next_level": (user.level * 100) - user.experience,
         "level_progress": (user.experience % 100) / 100 * 100
-    } 
\ No newline at end of file
+    } 
+
+async def _resolve_student(db: AsyncSession, principal: TokenPrincipal, student_id: Optional[int]) -> int:
+    """确定要查看的学生：默认本人，家长与教师可以查看学生数据
+
+    已知限制：尚无家长/教师与学生的关联关系，任何家长或教师都可以查看（含导出）任意学生的数据。
+    """
+    target_id = student_id or principal.user_id
+    if target_id != principal.user_id:
+        if principal.role not in ("parent", "teacher"):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="无权查看该学生的数据"
+            )
+        result = await db.execute(select(User.role).where(User.id == target_id))
+        if result.scalar_one_or_none() != "student":
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="学生不存在"
+            )
+    return target_id
+
+@router.get("/heatmap")
+async def get_study_heatmap(
+    student_id: Optional[int] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    tz_offset: int = Query(settings.report_tz_offset_hours, ge=-12, le=14),
+    principal: TokenPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """获取学习时长热力图（日期 × 小时 × 学科，单位分钟）"""
+    target_id = await _resolve_student(db, principal, student_id)
+    
+    local_today = (datetime.now(timezone.utc) + timedelta(hours=tz_offset)).date()
+    end = end or local_today
+    start = start or end - timedelta(days=6)
+    if start > end or (end - start).days + 1 > settings.heatmap_max_days:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"日期范围无效（最多 {settings.heatmap_max_days} 天）"
+        )
+    
+    # numpy 较重，按需导入以缩短冷启动
+    from app.services.heatmap import study_heatmap
+    return await study_heatmap(db, target_id, start, end, tz_offset)
+
+@router.get("/ratings")
+async def get_student_ratings(
+    student_id: Optional[int] = None,
+    principal: TokenPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """获取分学科 Elo 能力评分"""
+    target_id = await _resolve_student(db, principal, student_id)
+    result = await db.execute(
+        select(StudentRating.subject, StudentRating.rating, StudentRating.games)
+        .where(StudentRating.user_id == target_id)
+        .order_by(StudentRating.subject)
+    )
+    return [
+        {"subject": subject, "rating": rating, "games": games}
+        for subject, rating, games in result.all()
+    ]
+
+@router.get("/mistakes", response_model=List[MistakeResponse])
+async def get_mistakes(
+    student_id: Optional[int] = None,
+    subject: str = None,
+    limit: int = Query(10, ge=1, le=100),
+    principal: TokenPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """错题本（怪物图鉴）：出错最多的知识点"""
+    target_id = await _resolve_student(db, principal, student_id)
+    return await weakest_points(db, [target_id], limit=limit, subject=subject)
+
+@router.get("/mistakes/class", response_model=List[MistakeResponse])
+async def get_class_mistakes(
+    student_ids: List[int] = Query(..., max_length=500),
+    subject: str = None,
+    limit: int = Query(10, ge=1, le=100),
+    principal: TokenPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """一组学生（班级）共同的薄弱知识点（教师）"""
+    if principal.role != "teacher":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="只有教师可以查看班级错题"
+        )
+    return await weakest_points(db, sorted(set(student_ids)), limit=limit, subject=subject)
+
+@router.get("/export/{dataset}")
+async def export_history(
+    dataset: str,
+    request: Request,
+    student_id: Optional[int] = None,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    gzip: bool = False,
+    principal: TokenPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """流式导出完整历史（study_records / rewards / quests），格式为 CSV 或 NDJSON，可选 gzip"""
+    if dataset not in DATASETS:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="不支持的导出数据"
+        )
+    target_id = await _resolve_student(db, principal, student_id)
+    
+    media_type, extension = export_media(format, gzip)
+    local_today = (datetime.now(timezone.utc) + timedelta(hours=settings.report_tz_offset_hours)).date()
+    filename = f"{dataset}_{target_id}_{local_today:%Y%m%d}.{extension}"
+    return StreamingResponse(
+        stream_export(dataset, target_id, format, gzip,
+                      session_factory=await read_session_factory(bearer_token(request.headers))),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@router.post("/events/ticket")
+async def create_event_ticket(
+    principal: TokenPrincipal = Depends(get_current_principal),
+    token: str = Depends(oauth2_scheme),
+):
+    """签发实时推送票据：EventSource 无法设置请求头，用短时效票据代替访问令牌放在 URL 中"""
+    return {
+        "ticket": create_stream_ticket(principal.user_id, verify_token(token).get("exp")),
+        "expires_in": settings.live_ticket_seconds,
+    }
+
+@router.get("/events")
+async def user_event_stream(request: Request, ticket: Optional[str] = None):
+    """实时推送（SSE）：余额、升级与任务完成事件；用 Authorization 头或 ?ticket= 认证，访问令牌到期时断开"""
+    token = ticket or bearer_token(request.headers)
+    # 长连接不持有请求级会话：认证与初始余额查询完成后立即归还连接
+    session_factory = await read_session_factory(bearer_token(request.headers))
+    async with session_factory() as db:
+        scope = EVENT_STREAM_SCOPE if ticket else None
+        principal = await authenticate_token(db, token, scope) if token else None
+        if principal is None or not principal.is_active:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="无法验证凭据",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        result = await db.execute(
+            select(User.level, User.experience, User.gold_coins).where(User.id == principal.user_id)
+        )
+        row = result.first()
+    
+    initial = encode_event("balance", {"level": row.level, "experience": row.experience, "gold_coins": row.gold_coins}) if row else b""
+    return EventStreamResponse(await get_live_hub(), principal.user_id, initial, expires_at=token_deadline(token))
@@ -0,0 +1,29 @@
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Optional
+
+class BattleQuestion(BaseModel):
+    prompt: str = Field(..., max_length=500)
+    options: List[str] = Field(..., min_length=2, max_length=6)
+    answer: int = Field(..., ge=0)  # 正确选项下标（不会下发给客户端）
+    knowledge_point: Optional[str] = Field(None, max_length=100)  # 答错时计入错题本
+
+    @model_validator(mode="after")
+    def check_answer(self):
+        if self.answer >= len(self.options):
+            raise ValueError("answer 超出选项范围")
+        return self
+
+class BattleRoomCreate(BaseModel):
+    subject: str
+    quest_id: Optional[int] = None  # 对战所属任务（错题本记录来源）
+    questions: List[BattleQuestion] = Field(..., min_length=1, max_length=50)
+    question_seconds: int = Field(20, ge=5, le=120)
+    max_players: int = Field(3, ge=1, le=3)
+
+class BattleRoomResponse(BaseModel):
+    room_id: str
+    subject: str
+    host_id: int
+    max_players: int
+    question_count: int
+    question_seconds: int
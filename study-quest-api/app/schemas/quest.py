@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
 from datetime import datetime
 
@@ -7,6 +7,7 @@ class QuestResponse(BaseModel):
     title: str
     description: Optional[str] = None
     subject: str
+    knowledge_point: Optional[str] = None
     difficulty: str
     experience_reward: int
     gold_reward: int
@@ -42,8 +43,21 @@ class QuestCreate(BaseModel):
     title: str
     description: Optional[str] = None
     subject: str
+    knowledge_point: Optional[str] = Field(None, max_length=100)
     difficulty: str = "medium"
     experience_reward: int = 0
     gold_reward: int = 0
     deadline: Optional[datetime] = None
-    quest_type: str = "daily" 
\ No newline at end of file
+    quest_type: str = "daily"
+
+class MistakeResponse(BaseModel):
+    subject: str
+    knowledge_point: str
+    count: int
+    last_seen: datetime
+    quest_id: Optional[int] = None
+    students: int = 1
+
+class ReviewQuestResponse(QuestResponse):
+    mistake_count: int
+    last_mistake_at: datetime
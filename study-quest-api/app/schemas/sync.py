@@ -0,0 +1,39 @@
+from pydantic import BaseModel, Field
+from typing import Annotated, List, Literal, Optional, Union
+from datetime import datetime
+
+class PomodoroEvent(BaseModel):
+    type: Literal["pomodoro"]
+    client_event_id: str = Field(..., min_length=1, max_length=64)
+    occurred_at: datetime
+    subject: str = Field(..., min_length=1, max_length=50)
+    duration: int = Field(..., gt=0, le=4 * 60 * 60)  # 秒
+
+class ProgressEvent(BaseModel):
+    type: Literal["progress"]
+    client_event_id: str = Field(..., min_length=1, max_length=64)
+    occurred_at: datetime
+    quest_id: int
+    progress: Optional[float] = Field(None, ge=0, le=100)
+    score: Optional[int] = None
+    time_spent: Optional[int] = Field(None, ge=0)
+
+SyncEvent = Annotated[Union[PomodoroEvent, ProgressEvent], Field(discriminator="type")]
+
+class SyncBatch(BaseModel):
+    events: List[SyncEvent] = Field(..., max_length=500)
+
+class SyncEventResult(BaseModel):
+    client_event_id: str
+    status: str  # applied, duplicate, rejected
+    detail: Optional[str] = None
+    experience_gained: int = 0
+    gold_gained: int = 0
+
+class SyncBatchResponse(BaseModel):
+    results: List[SyncEventResult]
+    experience_gained: int
+    gold_gained: int
+    level: Optional[int] = None
+    experience: Optional[int] = None
+    gold_coins: Optional[int] = None
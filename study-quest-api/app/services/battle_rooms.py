@@ -0,0 +1,519 @@
+"""组队对战房间
+
+房间状态（玩家、题目、得分）只保存在创建房间的 worker 进程内存中，加入、作答与
+计分都不访问数据库；对战结束时一次性结算奖励（credit_reward，study_type="battle"；至少
+BATTLE_MIN_PLAYERS 名玩家作答才发放，且每人每日不超过 BATTLE_DAILY_*_CAP），
+并把答错或超时未答、带知识点的题目批量写入错题本（record_mistakes）。
+
+消息经房间代理（broker）分发：
+
+- MemoryBattleBroker：单进程，事件直接投递到本进程的 WebSocket 连接队列
+- RedisBattleBroker：多 worker，房间事件经 Redis pub/sub 扇出到所有 worker；
+  发往房间的指令（加入、开始、作答、离开）转发给房间所属 worker 处理。
+  每个 worker 只持有一个模式订阅连接，与房间数量无关
+
+发给单个玩家的事件带 "to" 字段，由连接侧过滤。
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+import asyncio
+import json
+import logging
+import time
+import uuid
+
+from app.core.config import settings
+from app.core.redis_client import connect_redis
+from app.core.responses import dump_json
+
+logger = logging.getLogger(__name__)
+
+# 每个连接的待发送事件上限，超出视为慢消费者并断开
+CONNECTION_QUEUE_SIZE = 100
+# 答对基础分与最高速度加分
+CORRECT_POINTS = 100
+SPEED_BONUS_POINTS = 50
+# 对战结算：每答对一题的经验与金币
+BATTLE_EXPERIENCE_PER_CORRECT = 10
+BATTLE_GOLD_PER_CORRECT = 4
+# 题目由房主提交（含答案），至少这么多名不同玩家作答的对战才发放奖励，防止单人刷奖励
+BATTLE_MIN_PLAYERS = 2
+BATTLE_REASON_PREFIX = "组队对战："
+# 对战结束后房间再保留的秒数（供断线重连查看结果）
+FINISHED_ROOM_GRACE = 60
+
+
+@dataclass
+class Player:
+    user_id: int
+    name: str
+    score: int = 0
+    correct: int = 0
+    answered: int = 0
+    connected: bool = True
+
+
+class BattleRoom:
+    def __init__(self, room_id: str, host_id: int, subject: str, questions: List[dict], question_seconds: int, max_players: int,
+                 quest_id: Optional[int] = None):
+        self.room_id = room_id
+        self.host_id = host_id
+        self.subject = subject
+        self.quest_id = quest_id
+        self.questions = questions
+        self.question_seconds = question_seconds
+        self.max_players = max_players
+        self.status = "waiting"  # waiting, running, finished
+        self.players: Dict[int, Player] = {}
+        self.current = -1
+        self.question_started = 0.0
+        self.answered: Set[int] = set()
+        # 待写入错题本的 (user_id, subject, knowledge_point)
+        self.mistakes: List[Tuple[int, str, str]] = []
+        self.started_at = 0.0
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.lock = asyncio.Lock()
+
+    def scoreboard(self) -> dict:
+        players = sorted(self.players.values(), key=lambda player: (-player.score, player.user_id))
+        return {
+            "type": "scoreboard",
+            "team_score": sum(player.score for player in players),
+            "players": [
+                {"user_id": player.user_id, "name": player.name, "score": player.score,
+                 "correct": player.correct, "connected": player.connected}
+                for player in players
+            ],
+        }
+
+    def question_event(self) -> dict:
+        question = self.questions[self.current]
+        elapsed = time.monotonic() - self.question_started
+        return {
+            "type": "question",
+            "index": self.current,
+            "total": len(self.questions),
+            "prompt": question["prompt"],
+            "options": question["options"],
+            "remaining_ms": max(int((self.question_seconds - elapsed) * 1000), 0),
+        }
+
+    def snapshot(self) -> dict:
+        return {
+            "type": "room",
+            "room_id": self.room_id,
+            "subject": self.subject,
+            "host_id": self.host_id,
+            "status": self.status,
+            "max_players": self.max_players,
+            "question_count": len(self.questions),
+            "question_seconds": self.question_seconds,
+            "players": self.scoreboard()["players"],
+        }
+
+
+class MemoryBattleBroker:
+    """单进程代理：房间事件直接放入本进程各连接的队列"""
+
+    def __init__(self):
+        self.manager: Optional["BattleRoomManager"] = None
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    async def start(self, manager: "BattleRoomManager") -> None:
+        self.manager = manager
+
+    async def close(self) -> None:
+        pass
+
+    async def claim(self, room_id: str) -> None:
+        pass
+
+    async def refresh(self, room_id: str) -> None:
+        pass
+
+    async def release(self, room_id: str) -> None:
+        pass
+
+    def subscribe(self, room_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=CONNECTION_QUEUE_SIZE)
+        self._subscribers.setdefault(room_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, room_id: str, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(room_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[room_id]
+
+    def connections(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def _deliver(self, room_id: str, event: dict) -> None:
+        for queue in list(self._subscribers.get(room_id, ())):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # 慢消费者：清空积压并放入 None，连接侧收到后断开
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def publish(self, room_id: str, event: dict) -> None:
+        self._deliver(room_id, event)
+
+    async def send_command(self, room_id: str, command: dict) -> bool:
+        """把指令交给房间所属 worker，房间不存在时返回 False"""
+        return await self.manager.handle(room_id, command)
+
+
+class RedisBattleBroker(MemoryBattleBroker):
+    """多 worker 代理：事件经 battle:room:{id} 频道扇出，指令经 battle:cmd:{worker} 转发给房间所属 worker"""
+
+    def __init__(self, client):
+        super().__init__()
+        self._redis = client
+        self.worker_id = uuid.uuid4().hex
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _owner_key(room_id: str) -> str:
+        return f"battle:owner:{room_id}"
+
+    async def start(self, manager: "BattleRoomManager") -> None:
+        self.manager = manager
+        self._pubsub = self._redis.pubsub()
+        await self._pubsub.psubscribe("battle:room:*")
+        await self._pubsub.subscribe(f"battle:cmd:{self.worker_id}")
+        self._reader = asyncio.create_task(self._read())
+
+    async def close(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._pubsub is not None:
+            await self._pubsub.close()
+        await self._redis.close()
+
+    async def claim(self, room_id: str) -> None:
+        await self._redis.set(self._owner_key(room_id), self.worker_id, ex=settings.battle_room_ttl)
+
+    async def refresh(self, room_id: str) -> None:
+        """延长房间归属的有效期：进行中的对战可能超过 BATTLE_ROOM_TTL，过期后其他 worker 的指令会被丢弃"""
+        await self._redis.expire(self._owner_key(room_id), settings.battle_room_ttl)
+
+    async def release(self, room_id: str) -> None:
+        await self._redis.delete(self._owner_key(room_id))
+
+    async def publish(self, room_id: str, event: dict) -> None:
+        await self._redis.publish(f"battle:room:{room_id}", dump_json(event))
+
+    async def send_command(self, room_id: str, command: dict) -> bool:
+        if room_id in self.manager.rooms:
+            return await self.manager.handle(room_id, command)
+        owner = await self._redis.get(self._owner_key(room_id))
+        if owner is None:
+            return False
+        owner = owner.decode() if isinstance(owner, bytes) else owner
+        await self._redis.publish(f"battle:cmd:{owner}", dump_json({"room_id": room_id, **command}))
+        return True
+
+    async def _read(self) -> None:
+        async for message in self._pubsub.listen():
+            try:
+                if message["type"] == "pmessage":
+                    channel = message["channel"]
+                    channel = channel.decode() if isinstance(channel, bytes) else channel
+                    self._deliver(channel.split(":", 2)[2], json.loads(message["data"]))
+                elif message["type"] == "message":
+                    command = json.loads(message["data"])
+                    await self.manager.handle(command.pop("room_id"), command)
+            except Exception as exc:
+                logger.warning("对战消息处理失败: %s", exc)
+
+
+class BattleRoomManager:
+    """本 worker 持有的房间及其状态机"""
+
+    def __init__(self, broker: MemoryBattleBroker):
+        self.broker = broker
+        self.rooms: Dict[str, BattleRoom] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def stats(self) -> dict:
+        running = sum(1 for room in self.rooms.values() if room.status == "running")
+        return {
+            "backend": type(self.broker).__name__,
+            "rooms": len(self.rooms),
+            "running": running,
+            "connections": self.broker.connections(),
+        }
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _schedule(self, room: BattleRoom, delay: float, coro_fn) -> None:
+        if room.timer is not None:
+            room.timer.cancel()
+        room.timer = asyncio.get_running_loop().call_later(delay, lambda: self._spawn(coro_fn()))
+
+    async def create_room(self, host_id: int, subject: str, questions: List[dict], question_seconds: int, max_players: int,
+                          quest_id: Optional[int] = None) -> BattleRoom:
+        room_id = uuid.uuid4().hex[:8]
+        room = BattleRoom(room_id, host_id, subject, questions, question_seconds, max_players, quest_id)
+        self.rooms[room_id] = room
+        await self.broker.claim(room_id)
+        # 一直没有开始的房间到期回收
+        self._schedule(room, settings.battle_room_ttl, lambda: self._expire(room_id))
+        return room
+
+    async def handle(self, room_id: str, command: dict) -> bool:
+        room = self.rooms.get(room_id)
+        if room is None:
+            return False
+        handler = {
+            "join": self._join,
+            "leave": self._leave,
+            "start": self._start,
+            "answer": self._answer,
+        }.get(command.get("type"))
+        if handler is not None:
+            async with room.lock:
+                await handler(room, command)
+        return True
+
+    async def _error(self, room: BattleRoom, user_id: int, detail: str) -> None:
+        await self.broker.publish(room.room_id, {"type": "error", "to": user_id, "detail": detail})
+
+    async def _join(self, room: BattleRoom, command: dict) -> None:
+        user_id = command["user_id"]
+        player = room.players.get(user_id)
+        if player is not None:
+            # 断线重连
+            player.connected = True
+        elif room.status != "waiting":
+            await self._error(room, user_id, "对战已开始")
+            return
+        elif len(room.players) >= room.max_players:
+            await self._error(room, user_id, "房间已满")
+            return
+        else:
+            room.players[user_id] = Player(user_id=user_id, name=command.get("name") or str(user_id))
+
+        await self.broker.publish(room.room_id, room.snapshot())
+        if room.status == "running":
+            await self.broker.publish(room.room_id, {**room.question_event(), "to": user_id})
+
+    async def _leave(self, room: BattleRoom, command: dict) -> None:
+        user_id = command["user_id"]
+        player = room.players.get(user_id)
+        if player is None or room.status == "finished":
+            return
+        if room.status == "waiting":
+            del room.players[user_id]
+            if not room.players:
+                await self._close(room)
+                return
+            if room.host_id == user_id:
+                room.host_id = next(iter(room.players))
+            await self.broker.publish(room.room_id, room.snapshot())
+            return
+
+        player.connected = False
+        await self.broker.publish(room.room_id, room.scoreboard())
+        if not any(player.connected for player in room.players.values()):
+            await self._finish(room)
+        elif self._all_answered(room):
+            await self._advance(room)
+
+    async def _start(self, room: BattleRoom, command: dict) -> None:
+        if command["user_id"] != room.host_id:
+            await self._error(room, command["user_id"], "只有房主可以开始对战")
+            return
+        if room.status != "waiting":
+            return
+        room.status = "running"
+        room.started_at = time.monotonic()
+        await self.broker.publish(room.room_id, room.snapshot())
+        await self._advance(room)
+
+    async def _answer(self, room: BattleRoom, command: dict) -> None:
+        user_id = command["user_id"]
+        player = room.players.get(user_id)
+        if room.status != "running" or player is None:
+            return
+        if command.get("index") != room.current or user_id in room.answered:
+            return
+
+        room.answered.add(user_id)
+        player.answered += 1
+        question = room.questions[room.current]
+        correct = command.get("choice") == question["answer"]
+        if correct:
+            remaining = max(room.question_seconds - (time.monotonic() - room.question_started), 0)
+            player.correct += 1
+            player.score += CORRECT_POINTS + int(SPEED_BONUS_POINTS * remaining / room.question_seconds)
+        elif question.get("knowledge_point"):
+            room.mistakes.append((user_id, room.subject, question["knowledge_point"]))
+        await self.broker.publish(room.room_id, {"type": "answered", "user_id": user_id, "index": room.current, "correct": correct})
+        await self.broker.publish(room.room_id, room.scoreboard())
+        if self._all_answered(room):
+            await self._advance(room)
+
+    @staticmethod
+    def _all_answered(room: BattleRoom) -> bool:
+        return all(player.user_id in room.answered for player in room.players.values() if player.connected)
+
+    async def _advance(self, room: BattleRoom) -> None:
+        """公布上一题答案并出下一题，题目出完后结束对战"""
+        if room.current >= 0:
+            # 在线但超时未答的玩家同样计入错题本
+            point = room.questions[room.current].get("knowledge_point")
+            if point:
+                room.mistakes.extend(
+                    (player.user_id, room.subject, point)
+                    for player in room.players.values()
+                    if player.connected and player.user_id not in room.answered
+                )
+            await self.broker.publish(room.room_id, {
+                "type": "reveal", "index": room.current, "answer": room.questions[room.current]["answer"],
+            })
+        room.current += 1
+        room.answered = set()
+        if room.current >= len(room.questions):
+            await self._finish(room)
+            return
+        # 每出一题续期归属（单题最长 120 秒，远小于 TTL），结束后的保留期同样在 TTL 之内
+        await self.broker.refresh(room.room_id)
+        room.question_started = time.monotonic()
+        index = room.current
+        self._schedule(room, room.question_seconds, lambda: self._on_timeout(room.room_id, index))
+        await self.broker.publish(room.room_id, room.question_event())
+
+    async def _on_timeout(self, room_id: str, index: int) -> None:
+        room = self.rooms.get(room_id)
+        if room is None:
+            return
+        async with room.lock:
+            if room.status == "running" and room.current == index:
+                await self._advance(room)
+
+    async def _finish(self, room: BattleRoom) -> None:
+        room.status = "finished"
+        if room.timer is not None:
+            room.timer.cancel()
+        rewards = await self._persist(room)
+        await self.broker.publish(room.room_id, {
+            **room.scoreboard(),
+            "type": "finished",
+            "rewards": rewards,
+        })
+        self._schedule(room, FINISHED_ROOM_GRACE, lambda: self._expire(room.room_id))
+
+    async def _persist(self, room: BattleRoom) -> Dict[int, dict]:
+        """对战结束时一次性写入奖励、学习记录与错题本"""
+        from app.database import AsyncSessionLocal
+        from app.services.leaderboard import record_experience
+        from app.services.live_updates import notify_reward
+        from app.services.mistakes import record_mistakes
+        from app.services.rewards import credit_reward, DailyCap
+
+        duration = int(time.monotonic() - room.started_at)
+        rewards = {
+            player.user_id: {
+                "experience": player.correct * BATTLE_EXPERIENCE_PER_CORRECT,
+                "gold": player.correct * BATTLE_GOLD_PER_CORRECT,
+            }
+            for player in room.players.values() if player.answered
+        }
+        if len(rewards) < BATTLE_MIN_PLAYERS:
+            rewards = {}
+        if not rewards and not room.mistakes:
+            return {}
+        daily_cap = DailyCap(BATTLE_REASON_PREFIX, settings.battle_daily_experience_cap, settings.battle_daily_gold_cap)
+        results = {}
+        try:
+            async with AsyncSessionLocal() as db:
+                for player in room.players.values():
+                    if player.user_id not in rewards:
+                        continue
+                    results[player.user_id] = await credit_reward(
+                        db,
+                        player.user_id,
+                        experience=rewards[player.user_id]["experience"],
+                        gold=rewards[player.user_id]["gold"],
+                        reason=f"{BATTLE_REASON_PREFIX}{room.subject}（答对 {player.correct}/{len(room.questions)}）",
+                        study_subject=room.subject,
+                        study_duration=duration,
+                        study_type="battle",
+                        daily_cap=daily_cap,
+                    )
+                await record_mistakes(db, room.mistakes, quest_id=room.quest_id)
+                await db.commit()
+        except Exception as exc:
+            logger.error("对战结果写入失败 room=%s: %s", room.room_id, exc)
+            return {}
+        # 按实际发放（每日上限截断后）的数额回报
+        rewards = {
+            user_id: {"experience": result.experience_gained, "gold": result.gold_gained}
+            for user_id, result in results.items() if result is not None
+        }
+        for user_id, reward in rewards.items():
+            if reward["experience"]:
+                await record_experience(user_id, room.subject, reward["experience"])
+            await notify_reward(user_id, results[user_id], f"{BATTLE_REASON_PREFIX}{room.subject}")
+        return rewards
+
+    async def _expire(self, room_id: str) -> None:
+        room = self.rooms.get(room_id)
+        if room is None:
+            return
+        async with room.lock:
+            if room.status == "running":
+                return
+            await self._close(room)
+
+    async def _close(self, room: BattleRoom) -> None:
+        if room.timer is not None:
+            room.timer.cancel()
+        self.rooms.pop(room.room_id, None)
+        if room.status != "finished":
+            await self.broker.publish(room.room_id, {"type": "closed"})
+        await self.broker.release(room.room_id)
+
+
+_manager: Optional[BattleRoomManager] = None
+_manager_lock = asyncio.Lock()
+
+
+async def get_battle_manager() -> BattleRoomManager:
+    """获取对战房间管理器单例（首次调用时选择代理后端）"""
+    global _manager
+    if _manager is not None:
+        return _manager
+    async with _manager_lock:
+        if _manager is None:
+            backend = settings.battle_backend
+            client = None
+            if backend in ("auto", "redis"):
+                client = await connect_redis("对战房间")
+                if client is None and backend == "redis":
+                    raise RuntimeError("BATTLE_BACKEND=redis 但无法连接 Redis")
+            broker = RedisBattleBroker(client) if client is not None else MemoryBattleBroker()
+            manager = BattleRoomManager(broker)
+            await broker.start(manager)
+            _manager = manager
+    return _manager
+
+
+def battle_stats() -> Optional[dict]:
+    return _manager.stats() if _manager is not None else None
+
+
+async def shutdown_battle_rooms() -> None:
+    global _manager
+    if _manager is not None:
+        await _manager.broker.close()
+        _manager = None
@@ -0,0 +1,36 @@
+"""开发服务器演示数据
+
+main-dev.py 以内存存储（STORAGE_BACKEND=memory）运行正式路由，启动后写入与原模拟数据
+相同的三个演示账号（student / parent / teacher，密码均为 123456）和几个上架任务。
+演示学生账号已存在时跳过，可重复执行。
+"""
+from sqlalchemy import select
+
+from app.core.security import get_password_hash
+from app.database import AsyncSessionLocal, User, Quest
+
+DEMO_PASSWORD = "123456"
+DEMO_USERS = [
+    {"username": "student", "role": "student", "nickname": "学生", "gold_coins": 100},
+    {"username": "parent", "role": "parent", "nickname": "家长", "gold_coins": 0},
+    {"username": "teacher", "role": "teacher", "nickname": "教师", "gold_coins": 0},
+]
+DEMO_QUESTS = [
+    {"title": "数学函数基础", "description": "学习函数概念", "subject": "数学", "knowledge_point": "函数",
+     "difficulty": "easy", "experience_reward": 50, "gold_reward": 10},
+    {"title": "英语阅读理解", "description": "阅读短文练习", "subject": "英语", "knowledge_point": "阅读理解",
+     "difficulty": "medium", "experience_reward": 80, "gold_reward": 15},
+    {"title": "物理力学基础", "description": "牛顿运动定律", "subject": "物理", "knowledge_point": "牛顿运动定律",
+     "difficulty": "medium", "experience_reward": 70, "gold_reward": 12},
+]
+
+
+async def seed_demo_data() -> None:
+    async with AsyncSessionLocal() as db:
+        seeded = await db.scalar(select(User.id).where(User.username == DEMO_USERS[0]["username"]))
+        if seeded is not None:
+            return
+        hashed_password = get_password_hash(DEMO_PASSWORD)
+        db.add_all(User(**user, hashed_password=hashed_password) for user in DEMO_USERS)
+        db.add_all(Quest(**quest) for quest in DEMO_QUESTS)
+        await db.commit()
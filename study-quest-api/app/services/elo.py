@@ -0,0 +1,226 @@
+"""Elo 能力与难度评分
+
+每条任务完成结果（QuestResult，完成时与奖励在同一事务中追加）视为一次"学生 vs 任务"
+的对局：实际得分 S = score / 100
+（未填写成绩按 1 计），预期得分 E = 1 / (1 + 10 ** ((R任务 - R学生) / 400))，
+
+    新评分 = 旧评分 + K * (S - E)
+
+学生评分按学科分别维护，任务评分反向更新。K 值随对局数衰减：新学生、新任务调整快，
+对局多了之后趋于稳定。结果按完成时间分成小批次，批内用 NumPy 同时计算并以
+np.add.at 累加同一学生 / 任务的多次变化。任务对局数达到 MIN_GAMES_FOR_TIER 后，
+按评分分档回写 Quest.difficulty（easy / medium / hard）。
+
+增量模式只处理水位线之后完成的记录；全量模式清空评分后按全部完成结果重放。完成结果
+不随每日/每周派发重置，评分更新与派发的先后顺序无关：
+
+    python -m app.services.elo [--full]
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+import asyncio
+import logging
+import sys
+
+import numpy as np
+from sqlalchemy import select, update, delete, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import Quest, QuestResult, StudentRating, RollupWatermark, upsert_insert
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_NAME = "elo_ratings"
+INITIAL_STUDENT_RATING = 1500.0
+# 尚无评分的任务按静态难度给初始评分
+TIER_RATINGS = {"easy": 1300.0, "medium": 1500.0, "hard": 1700.0}
+# 评分低于 EASY_BELOW 为 easy，不低于 HARD_FROM 为 hard
+EASY_BELOW = 1400.0
+HARD_FROM = 1600.0
+MIN_GAMES_FOR_TIER = 10
+# K 值：(最大, 最小, 衰减对局数)
+STUDENT_K = (40.0, 16.0, 30.0)
+QUEST_K = (24.0, 8.0, 50.0)
+BATCH_SIZE = 2000
+# 只处理完成时间早于 now - COMMIT_LAG 的记录，避免漏掉尚未提交的事务
+COMMIT_LAG = timedelta(minutes=5)
+
+
+def k_factor(games: np.ndarray, k: Tuple[float, float, float]) -> np.ndarray:
+    k_max, k_min, decay = k
+    return k_min + (k_max - k_min) * np.exp(-games / decay)
+
+
+def expected_score(student: np.ndarray, quest: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.power(10.0, (quest - student) / 400.0))
+
+
+def difficulty_tier(rating: float) -> str:
+    if rating < EASY_BELOW:
+        return "easy"
+    if rating >= HARD_FROM:
+        return "hard"
+    return "medium"
+
+
+def apply_results(
+    student_idx: np.ndarray,
+    quest_idx: np.ndarray,
+    outcome: np.ndarray,
+    student_rating: np.ndarray,
+    student_games: np.ndarray,
+    quest_rating: np.ndarray,
+    quest_games: np.ndarray,
+    batch_size: int = BATCH_SIZE,
+) -> None:
+    """按时间顺序分批更新评分（原地修改评分与对局数数组）"""
+    for start in range(0, outcome.size, batch_size):
+        s = student_idx[start:start + batch_size]
+        q = quest_idx[start:start + batch_size]
+        surprise = outcome[start:start + batch_size] - expected_score(student_rating[s], quest_rating[q])
+        student_delta = k_factor(student_games[s], STUDENT_K) * surprise
+        quest_delta = -k_factor(quest_games[q], QUEST_K) * surprise
+        np.add.at(student_rating, s, student_delta)
+        np.add.at(quest_rating, q, quest_delta)
+        np.add.at(student_games, s, 1)
+        np.add.at(quest_games, q, 1)
+
+
+async def record_quest_results(
+    db: AsyncSession,
+    user_id: int,
+    results: Iterable[Tuple[int, Optional[int]]],
+    completed_at: datetime,
+) -> None:
+    """任务完成时追加 (quest_id, score) 对局记录；调用方负责 commit（与完成标记同一事务）"""
+    rows = [
+        {"user_id": user_id, "quest_id": quest_id, "score": score, "completed_at": completed_at}
+        for quest_id, score in results
+    ]
+    if rows:
+        await db.execute(insert(QuestResult), rows)
+
+
+async def _get_watermark(db: AsyncSession) -> Optional[datetime]:
+    result = await db.execute(select(RollupWatermark.through).where(RollupWatermark.name == WATERMARK_NAME))
+    return result.scalar_one_or_none()
+
+
+async def update_ratings(db: AsyncSession, full: bool = False, now: Optional[datetime] = None) -> dict:
+    """处理新的完成结果并写回评分，返回处理统计；调用方无需 commit"""
+    until = (now or datetime.now(timezone.utc)) - COMMIT_LAG
+    watermark = None if full else await _get_watermark(db)
+
+    query = (
+        select(QuestResult.user_id, QuestResult.quest_id, QuestResult.score, Quest.subject)
+        .join(Quest, Quest.id == QuestResult.quest_id)
+        .where(QuestResult.completed_at < until)
+        .order_by(QuestResult.completed_at, QuestResult.id)
+    )
+    if watermark is not None:
+        query = query.where(QuestResult.completed_at >= watermark)
+    rows = (await db.execute(query)).all()
+
+    if full:
+        await db.execute(delete(StudentRating))
+        await db.execute(update(Quest).values(rating=None, rating_games=0))
+
+    stats = {"results": len(rows), "students": 0, "quests": 0, "retiered": 0}
+    if rows:
+        stats.update(await _apply_rows(db, rows, fresh=full))
+
+    marker = upsert_insert(db, RollupWatermark).values(name=WATERMARK_NAME, through=until)
+    await db.execute(marker.on_conflict_do_update(
+        index_elements=["name"],
+        set_={"through": marker.excluded.through},
+    ))
+    await db.commit()
+
+    if stats["retiered"]:
+        from app.services.quest_catalog import invalidate_quest_catalog
+        invalidate_quest_catalog()
+    return stats
+
+
+async def _apply_rows(db: AsyncSession, rows, fresh: bool) -> dict:
+    user_ids, quest_ids, scores, subjects = zip(*rows)
+
+    student_keys: List[Tuple[int, str]] = sorted(set(zip(user_ids, subjects)))
+    student_code = {key: i for i, key in enumerate(student_keys)}
+    quest_keys: List[int] = sorted(set(quest_ids))
+    quest_code = {quest_id: i for i, quest_id in enumerate(quest_keys)}
+
+    student_rating = np.full(len(student_keys), INITIAL_STUDENT_RATING)
+    student_games = np.zeros(len(student_keys))
+    if not fresh:
+        result = await db.execute(
+            select(StudentRating.user_id, StudentRating.subject, StudentRating.rating, StudentRating.games)
+            .where(StudentRating.user_id.in_({user_id for user_id, _ in student_keys}))
+        )
+        for user_id, subject, rating, games in result.all():
+            code = student_code.get((user_id, subject))
+            if code is not None:
+                student_rating[code] = rating
+                student_games[code] = games
+
+    result = await db.execute(
+        select(Quest.id, Quest.difficulty, Quest.rating, Quest.rating_games).where(Quest.id.in_(quest_keys))
+    )
+    quest_rating = np.empty(len(quest_keys))
+    quest_games = np.zeros(len(quest_keys))
+    old_tiers: Dict[int, str] = {}
+    for quest_id, difficulty, rating, games in result.all():
+        code = quest_code[quest_id]
+        quest_rating[code] = rating if rating is not None else TIER_RATINGS.get(difficulty, INITIAL_STUDENT_RATING)
+        quest_games[code] = games or 0
+        old_tiers[quest_id] = difficulty
+
+    outcome = np.fromiter(
+        (1.0 if score is None else min(max(score / 100.0, 0.0), 1.0) for score in scores),
+        dtype=np.float64, count=len(scores),
+    )
+    apply_results(
+        np.fromiter((student_code[key] for key in zip(user_ids, subjects)), dtype=np.int64, count=len(user_ids)),
+        np.fromiter((quest_code[quest_id] for quest_id in quest_ids), dtype=np.int64, count=len(quest_ids)),
+        outcome, student_rating, student_games, quest_rating, quest_games,
+    )
+
+    student_rows = [
+        {"user_id": user_id, "subject": subject, "rating": round(float(student_rating[i]), 2), "games": int(student_games[i])}
+        for i, (user_id, subject) in enumerate(student_keys)
+    ]
+    for start in range(0, len(student_rows), 1000):
+        stmt = upsert_insert(db, StudentRating).values(student_rows[start:start + 1000])
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=["user_id", "subject"],
+            set_={"rating": stmt.excluded.rating, "games": stmt.excluded.games},
+        ))
+
+    quest_rows = []
+    retiered = 0
+    for i, quest_id in enumerate(quest_keys):
+        rating = float(quest_rating[i])
+        tier = old_tiers.get(quest_id)
+        if quest_games[i] >= MIN_GAMES_FOR_TIER and difficulty_tier(rating) != tier:
+            tier = difficulty_tier(rating)
+            retiered += 1
+        quest_rows.append({"id": quest_id, "rating": round(rating, 2), "rating_games": int(quest_games[i]), "difficulty": tier})
+    await db.execute(update(Quest).execution_options(synchronize_session=False), quest_rows)
+
+    return {"students": len(student_keys), "quests": len(quest_keys), "retiered": retiered}
+
+
+async def run_rating_update(full: bool = False) -> dict:
+    """打开独立会话执行一次评分更新"""
+    from app.database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        stats = await update_ratings(db, full=full)
+    if stats["results"]:
+        logger.info("Elo 评分已更新：%s", stats)
+    return stats
+
+
+if __name__ == "__main__":
+    stats = asyncio.run(run_rating_update(full="--full" in sys.argv[1:]))
+    print(f"[elo] {stats}")
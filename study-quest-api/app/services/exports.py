@@ -0,0 +1,129 @@
+"""学习与奖励历史导出
+
+按数据集生成 CSV 或 NDJSON 字节流：查询通过 AsyncSession.stream 以 yield_per 分批拉取
+（PostgreSQL 上为服务端游标），每批行编码后立即输出，内存占用与总行数无关，
+第一批数据在查询扫描完成之前即可发出。可选 gzip 压缩（每批同步刷新，保证边压缩边输出）。
+
+流在响应开始后才执行，因此使用独立会话，而不是请求依赖注入的会话。
+"""
+from datetime import date, datetime
+from typing import AsyncIterator, Tuple
+import csv
+import io
+import zlib
+
+from sqlalchemy import Select, select
+
+from app.core.responses import dump_json
+from app.database import AsyncSessionLocal, Quest, UserQuest, StudyRecord, RewardLog
+
+# 每批从游标拉取的行数
+EXPORT_CHUNK_ROWS = 1000
+# 以这些字符开头的单元格会被 Excel 当作公式执行（任务标题、奖励原因等由用户填写）
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def _study_records(user_id: int) -> Select:
+    return (
+        select(StudyRecord.id, StudyRecord.subject, StudyRecord.duration, StudyRecord.study_type,
+               StudyRecord.quest_id, StudyRecord.created_at)
+        .where(StudyRecord.user_id == user_id)
+        .order_by(StudyRecord.created_at, StudyRecord.id)
+    )
+
+
+def _rewards(user_id: int) -> Select:
+    return (
+        select(RewardLog.id, RewardLog.reward_type, RewardLog.amount, RewardLog.reason,
+               RewardLog.quest_id, RewardLog.created_at)
+        .where(RewardLog.user_id == user_id)
+        .order_by(RewardLog.created_at, RewardLog.id)
+    )
+
+
+def _quests(user_id: int) -> Select:
+    return (
+        select(UserQuest.id, UserQuest.quest_id, Quest.title, Quest.subject, UserQuest.is_completed,
+               UserQuest.progress, UserQuest.score, UserQuest.time_spent, UserQuest.attempts,
+               UserQuest.assigned_on, UserQuest.completed_at, UserQuest.created_at)
+        .join(UserQuest.quest)
+        .where(UserQuest.user_id == user_id)
+        .order_by(UserQuest.id)
+    )
+
+
+DATASETS = {
+    "study_records": _study_records,
+    "rewards": _rewards,
+    "quests": _quests,
+}
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        # 加单引号前缀，防止 CSV 公式注入
+        return "'" + value
+    return value
+
+
+class _CsvEncoder:
+    def __init__(self, columns):
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        # 带 BOM，Excel 打开中文不乱码
+        self.buffer.write("\ufeff")
+        self.writer.writerow(columns)
+
+    def encode(self, rows) -> bytes:
+        for row in rows:
+            self.writer.writerow([_csv_value(value) for value in row])
+        data = self.buffer.getvalue().encode("utf-8")
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+
+class _NdjsonEncoder:
+    def __init__(self, columns):
+        self.columns = list(columns)
+
+    def encode(self, rows) -> bytes:
+        return b"".join(dump_json(dict(zip(self.columns, row))) + b"\n" for row in rows)
+
+
+def export_media(fmt: str, compress: bool) -> Tuple[str, str]:
+    """返回 (Content-Type, 文件扩展名)"""
+    if compress:
+        return "application/gzip", f"{fmt}.gz"
+    return FORMATS[fmt], fmt
+
+
+async def stream_export(dataset: str, user_id: int, fmt: str = "csv", compress: bool = False,
+                        session_factory=AsyncSessionLocal) -> AsyncIterator[bytes]:
+    """逐批输出导出内容（session_factory 可传入只读副本的会话工厂）"""
+    query = DATASETS[dataset](user_id).execution_options(yield_per=EXPORT_CHUNK_ROWS)
+    gzip = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    async with session_factory() as db:
+        result = await db.stream(query)
+        encoder = (_CsvEncoder if fmt == "csv" else _NdjsonEncoder)(result.keys())
+        async for rows in result.partitions():
+            chunk = encoder.encode(rows)
+            if gzip is not None:
+                chunk = gzip.compress(chunk) + gzip.flush(zlib.Z_SYNC_FLUSH)
+            if chunk:
+                yield chunk
+        # 空结果时 CSV 仍输出表头
+        tail = encoder.encode(())
+        if gzip is not None:
+            tail = gzip.compress(tail) + gzip.flush()
+        if tail:
+            yield tail
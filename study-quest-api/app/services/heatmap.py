@@ -0,0 +1,256 @@
+"""学习时长热力图
+
+按 日期 × 小时 × 学科 统计学生的学习时长（分钟精度）。每条 StudyRecord 的
+created_at 是学习结束时间，学习区间 [created_at - duration, created_at] 会按
+与各整点桶的重叠部分拆分计入，分桶用 NumPy 在列式数据上向量化完成。
+
+水位线之前的记录已汇总到 study_hourly_rollup（按 UTC 整点），热力图对这部分
+直接读取汇总行，只对水位线之后的原始记录现场分桶。汇总随每日任务派发调度推进
+（QUEST_SCHEDULER 为 inprocess 或 celery 时），也可手动执行：
+
+    python -m app.services.heatmap [滞后天数]
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional, Sequence
+import asyncio
+import logging
+import sys
+
+import numpy as np
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.database import StudyRecord, StudyHourlyRollup, RollupWatermark, upsert_insert
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_NAME = "study_hourly_rollup"
+HOUR = 3600
+DAY = 24 * HOUR
+# 单次学习最长按 24 小时计，限制分桶循环次数
+MAX_SESSION_SECONDS = DAY
+
+
+def _epoch(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def _midnight_epoch(day: date, tz_offset_hours: int = 0) -> int:
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp()) - tz_offset_hours * HOUR
+
+
+def bin_study_seconds(
+    end_ts: np.ndarray,
+    durations: np.ndarray,
+    codes: np.ndarray,
+    n_codes: int,
+    origin: int,
+    n_hours: int,
+) -> np.ndarray:
+    """把学习区间按整点拆分累加，返回形状为 (n_hours, n_codes) 的秒数矩阵
+
+    origin 为第 0 个小时桶的起点（epoch 秒，需整点对齐），超出 [0, n_hours) 的部分丢弃。
+    """
+    grid = np.zeros(n_hours * n_codes, dtype=np.int64)
+    if end_ts.size == 0:
+        return grid.reshape(n_hours, n_codes)
+
+    durations = np.clip(durations, 0, MAX_SESSION_SECONDS)
+    start_ts = end_ts - durations
+    first_hour = (start_ts - origin) // HOUR
+    last_hour = (end_ts - 1 - origin) // HOUR
+    span = int((last_hour - first_hour).max()) + 1
+
+    # 每轮处理所有记录的第 k 个小时桶
+    for k in range(max(span, 1)):
+        hour = first_hour + k
+        bucket_start = origin + hour * HOUR
+        overlap = np.minimum(end_ts, bucket_start + HOUR) - np.maximum(start_ts, bucket_start)
+        mask = (overlap > 0) & (hour >= 0) & (hour < n_hours)
+        if mask.any():
+            grid += np.bincount(
+                hour[mask] * n_codes + codes[mask],
+                weights=overlap[mask],
+                minlength=grid.size,
+            ).astype(np.int64)
+    return grid.reshape(n_hours, n_codes)
+
+
+async def get_watermark(db: AsyncSession) -> Optional[datetime]:
+    result = await db.execute(select(RollupWatermark.through).where(RollupWatermark.name == WATERMARK_NAME))
+    through = result.scalar_one_or_none()
+    if through is not None and through.tzinfo is None:
+        through = through.replace(tzinfo=timezone.utc)
+    return through
+
+
+async def study_heatmap(
+    db: AsyncSession,
+    user_id: int,
+    start: date,
+    end: date,
+    tz_offset_hours: int = 0,
+) -> dict:
+    """统计 [start, end]（含两端，本地日期）内每天每小时各学科的学习分钟数"""
+    n_days = (end - start).days + 1
+    n_hours = n_days * 24
+    origin = _midnight_epoch(start, tz_offset_hours)
+    range_start = datetime.fromtimestamp(origin, tz=timezone.utc)
+    range_end = range_start + timedelta(days=n_days)
+
+    watermark = await get_watermark(db)
+    raw_from = max(range_start, watermark) if watermark else range_start
+
+    # 汇总部分：水位线之前的整点桶
+    rollup_rows = []
+    if watermark and watermark > range_start:
+        result = await db.execute(
+            select(StudyHourlyRollup.hour_start, StudyHourlyRollup.subject, StudyHourlyRollup.seconds)
+            .where(
+                StudyHourlyRollup.user_id == user_id,
+                StudyHourlyRollup.hour_start >= range_start,
+                StudyHourlyRollup.hour_start < range_end,
+            )
+        )
+        rollup_rows = result.all()
+
+    # 原始部分：水位线之后的记录（结束时间可能晚于区间终点，多取一天后按区间裁剪）
+    result = await db.execute(
+        select(StudyRecord.created_at, StudyRecord.duration, StudyRecord.subject)
+        .where(
+            StudyRecord.user_id == user_id,
+            StudyRecord.created_at >= raw_from,
+            StudyRecord.created_at < range_end + timedelta(seconds=MAX_SESSION_SECONDS),
+        )
+    )
+    raw_rows = result.all()
+
+    subjects: List[str] = sorted({row[2] for row in raw_rows} | {row[1] for row in rollup_rows})
+    n_codes = max(len(subjects), 1)
+    code_of = {subject: i for i, subject in enumerate(subjects)}
+    grid = np.zeros((n_hours, n_codes), dtype=np.int64)
+
+    if raw_rows:
+        created, durations, names = zip(*raw_rows)
+        grid += bin_study_seconds(
+            np.fromiter((_epoch(value) for value in created), dtype=np.int64, count=len(created)),
+            np.asarray(durations, dtype=np.int64),
+            np.fromiter((code_of[name] for name in names), dtype=np.int64, count=len(names)),
+            n_codes, origin, n_hours,
+        )
+
+    if rollup_rows:
+        hours, names, seconds = zip(*rollup_rows)
+        hour_index = (np.fromiter((_epoch(value) for value in hours), dtype=np.int64, count=len(hours)) - origin) // HOUR
+        codes = np.fromiter((code_of[name] for name in names), dtype=np.int64, count=len(names))
+        mask = (hour_index >= 0) & (hour_index < n_hours)
+        grid += np.bincount(
+            hour_index[mask] * n_codes + codes[mask],
+            weights=np.asarray(seconds, dtype=np.int64)[mask],
+            minlength=grid.size,
+        ).astype(np.int64).reshape(n_hours, n_codes)
+
+    cells = []
+    for hour_index, code in zip(*np.nonzero(grid)):
+        cells.append({
+            "day": start + timedelta(days=int(hour_index) // 24),
+            "hour": int(hour_index) % 24,
+            "subject": subjects[code],
+            "minutes": round(int(grid[hour_index, code]) / 60, 1),
+        })
+
+    return {
+        "start": start,
+        "end": end,
+        "tz_offset": tz_offset_hours,
+        "subjects": subjects,
+        "total_minutes": round(int(grid.sum()) / 60, 1),
+        "cells": cells,
+    }
+
+
+async def _rollup_window(db: AsyncSession, window_start: datetime, window_end: datetime) -> int:
+    """把 created_at 落在 [window_start, window_end) 的记录按用户、学科、UTC 整点累加进汇总表"""
+    result = await db.execute(
+        select(StudyRecord.user_id, StudyRecord.subject, StudyRecord.created_at, StudyRecord.duration)
+        .where(StudyRecord.created_at >= window_start, StudyRecord.created_at < window_end)
+    )
+    rows = result.all()
+    if not rows:
+        return 0
+
+    user_ids, names, created, durations = zip(*rows)
+    pairs = list(zip(user_ids, names))
+    keys: Sequence = sorted(set(pairs))
+    code_of = {key: i for i, key in enumerate(keys)}
+
+    # 学习区间最早可能从窗口前一天开始
+    origin = _epoch(window_start) - MAX_SESSION_SECONDS
+    n_hours = (_epoch(window_end) - origin) // HOUR
+    grid = bin_study_seconds(
+        np.fromiter((_epoch(value) for value in created), dtype=np.int64, count=len(created)),
+        np.asarray(durations, dtype=np.int64),
+        np.fromiter((code_of[pair] for pair in pairs), dtype=np.int64, count=len(pairs)),
+        len(keys), origin, n_hours,
+    )
+
+    values = [
+        {
+            "user_id": keys[code][0],
+            "subject": keys[code][1],
+            "hour_start": datetime.fromtimestamp(origin + int(hour) * HOUR, tz=timezone.utc),
+            "seconds": int(grid[hour, code]),
+        }
+        for hour, code in zip(*np.nonzero(grid))
+    ]
+    stmt = upsert_insert(db, StudyHourlyRollup).values(values)
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id", "hour_start", "subject"],
+        set_={"seconds": StudyHourlyRollup.seconds + stmt.excluded.seconds},
+    ))
+    return len(values)
+
+
+async def advance_study_rollup(db: AsyncSession, through: datetime) -> Optional[datetime]:
+    """按天把水位线推进到 through（不含），每天单独提交，可安全重复执行"""
+    watermark = await get_watermark(db)
+    if watermark is None:
+        result = await db.execute(select(func.min(StudyRecord.created_at)))
+        earliest = result.scalar_one_or_none()
+        if earliest is None:
+            return None
+        if earliest.tzinfo is None:
+            earliest = earliest.replace(tzinfo=timezone.utc)
+        watermark = datetime(earliest.year, earliest.month, earliest.day, tzinfo=timezone.utc)
+
+    while watermark < through:
+        window_end = min(watermark + timedelta(days=1), through)
+        await _rollup_window(db, watermark, window_end)
+        stmt = upsert_insert(db, RollupWatermark).values(name=WATERMARK_NAME, through=window_end)
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=["name"],
+            set_={"through": stmt.excluded.through},
+        ))
+        await db.commit()
+        watermark = window_end
+    return watermark
+
+
+async def run_study_rollup(lag_days: Optional[int] = None) -> Optional[datetime]:
+    """打开独立会话，把水位线推进到 UTC 今天零点之前 lag_days 天（默认 HEATMAP_ROLLUP_LAG_DAYS）"""
+    from app.database import AsyncSessionLocal
+
+    lag_days = settings.heatmap_rollup_lag_days if lag_days is None else lag_days
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    async with AsyncSessionLocal() as db:
+        watermark = await advance_study_rollup(db, today - timedelta(days=lag_days))
+    logger.info("学习时长汇总水位线：%s", watermark)
+    return watermark
+
+
+if __name__ == "__main__":
+    watermark = asyncio.run(run_study_rollup(int(sys.argv[1]) if len(sys.argv) > 1 else None))
+    print(f"[heatmap] study rollup watermark: {watermark}")
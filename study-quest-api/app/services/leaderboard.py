@@ -0,0 +1,225 @@
+"""排行榜索引
+
+按学科维护 用户 -> 经验值 的有序集合，支持增量更新、O(log n) 排名查询以及
+"我的排名 + 前后邻居" 查询。优先使用 Redis 有序集合，Redis 不可用时回退到
+进程内的有序结构。
+
+全量重建（从 User / StudyRecord / RewardLog 汇总）是一个批处理任务：
+
+    python -m app.services.leaderboard
+"""
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import logging
+
+from sqlalchemy import select, func, distinct
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.redis_client import connect_redis
+from app.database import User, Quest, StudyRecord, RewardLog
+
+logger = logging.getLogger(__name__)
+
+# 全学科总榜
+GLOBAL_BOARD = "all"
+
+Entry = Tuple[int, int]  # (user_id, score)
+
+
+class MemoryLeaderboard:
+    """进程内有序集合：按 (-score, user_id) 排序的列表 + 分数字典"""
+
+    def __init__(self):
+        self._keys: Dict[str, List[Tuple[int, int]]] = {}
+        self._scores: Dict[str, Dict[int, int]] = {}
+
+    async def is_built(self, board: str) -> bool:
+        return board in self._keys
+
+    async def incr(self, board: str, user_id: int, amount: int) -> Optional[int]:
+        if board not in self._keys:
+            # 尚未加载的榜单由 ensure_board 从数据库完整加载，这里无需累加
+            return None
+        keys, scores = self._keys[board], self._scores[board]
+        old = scores.get(user_id)
+        if old is not None:
+            del keys[bisect_left(keys, (-old, user_id))]
+        new = (old or 0) + amount
+        scores[user_id] = new
+        insort(keys, (-new, user_id))
+        return new
+
+    async def replace(self, board: str, entries: Dict[int, int]) -> None:
+        self._keys[board] = sorted((-score, user_id) for user_id, score in entries.items())
+        self._scores[board] = dict(entries)
+
+    async def remove(self, user_id: int) -> None:
+        for board, scores in self._scores.items():
+            score = scores.pop(user_id, None)
+            if score is not None:
+                keys = self._keys[board]
+                del keys[bisect_left(keys, (-score, user_id))]
+
+    async def top(self, board: str, limit: int, offset: int = 0) -> List[Entry]:
+        keys = self._keys.get(board, [])
+        return [(user_id, -neg) for neg, user_id in keys[offset:offset + limit]]
+
+    async def rank(self, board: str, user_id: int) -> Optional[Tuple[int, int]]:
+        """返回 (0 起始排名, 分数)，不在榜上时返回 None"""
+        score = self._scores.get(board, {}).get(user_id)
+        if score is None:
+            return None
+        return bisect_left(self._keys[board], (-score, user_id)), score
+
+
+class RedisLeaderboard:
+    """基于 Redis 有序集合（ZSET）的排行榜"""
+
+    def __init__(self, client):
+        self._redis = client
+
+    @staticmethod
+    def _key(board: str) -> str:
+        return f"leaderboard:{board}"
+
+    async def is_built(self, board: str) -> bool:
+        return bool(await self._redis.exists(self._key(board) + ":built"))
+
+    async def incr(self, board: str, user_id: int, amount: int) -> int:
+        return int(await self._redis.zincrby(self._key(board), amount, user_id))
+
+    async def replace(self, board: str, entries: Dict[int, int]) -> None:
+        key = self._key(board)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            if entries:
+                pipe.zadd(key, {str(user_id): score for user_id, score in entries.items()})
+            pipe.set(key + ":built", 1)
+            await pipe.execute()
+
+    async def remove(self, user_id: int) -> None:
+        async for key in self._redis.scan_iter(match="leaderboard:*"):
+            key = key.decode() if isinstance(key, bytes) else key
+            if not key.endswith(":built"):
+                await self._redis.zrem(key, user_id)
+
+    async def top(self, board: str, limit: int, offset: int = 0) -> List[Entry]:
+        rows = await self._redis.zrevrange(self._key(board), offset, offset + limit - 1, withscores=True)
+        return [(int(member), int(score)) for member, score in rows]
+
+    async def rank(self, board: str, user_id: int) -> Optional[Tuple[int, int]]:
+        key = self._key(board)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.zrevrank(key, user_id)
+            pipe.zscore(key, user_id)
+            rank, score = await pipe.execute()
+        if rank is None:
+            return None
+        return int(rank), int(score)
+
+
+_index = None
+_index_lock = asyncio.Lock()
+
+
+async def get_leaderboard_index():
+    """获取排行榜索引单例（首次调用时选择后端）"""
+    global _index
+    if _index is not None:
+        return _index
+    async with _index_lock:
+        if _index is None:
+            backend = settings.leaderboard_backend
+            client = None
+            if backend in ("auto", "redis"):
+                client = await connect_redis("排行榜")
+                if client is None and backend == "redis":
+                    raise RuntimeError("LEADERBOARD_BACKEND=redis 但无法连接 Redis")
+            _index = RedisLeaderboard(client) if client is not None else MemoryLeaderboard()
+    return _index
+
+
+async def record_experience(user_id: int, subject: Optional[str], amount: int) -> None:
+    """增量更新总榜与学科榜（应在奖励事务提交后调用）"""
+    if amount <= 0:
+        return
+    try:
+        index = await get_leaderboard_index()
+        await index.incr(GLOBAL_BOARD, user_id, amount)
+        if subject:
+            await index.incr(subject, user_id, amount)
+    except Exception as exc:
+        # 排行榜是派生数据，失败不影响奖励结算，下次重建时会修正
+        logger.warning("排行榜增量更新失败: %s", exc)
+
+
+async def compute_board(db: AsyncSession, board: str) -> Dict[int, int]:
+    """从数据库汇总某个榜单的分数"""
+    if board == GLOBAL_BOARD:
+        result = await db.execute(
+            select(User.id, User.experience).where(User.is_active == True)
+        )
+        return {user_id: experience or 0 for user_id, experience in result.all()}
+
+    scores: Dict[int, int] = {}
+    # 番茄钟：每分钟 1 经验
+    pomodoro = await db.execute(
+        select(StudyRecord.user_id, func.sum(StudyRecord.duration // 60))
+        .join(User, User.id == StudyRecord.user_id)
+        .where(
+            StudyRecord.subject == board,
+            StudyRecord.study_type == "pomodoro",
+            User.is_active == True,
+        )
+        .group_by(StudyRecord.user_id)
+    )
+    for user_id, total in pomodoro.all():
+        scores[user_id] = scores.get(user_id, 0) + int(total or 0)
+    # 任务奖励：按任务所属学科归集
+    quest_rewards = await db.execute(
+        select(RewardLog.user_id, func.sum(RewardLog.amount))
+        .join(Quest, Quest.id == RewardLog.quest_id)
+        .join(User, User.id == RewardLog.user_id)
+        .where(
+            RewardLog.reward_type == "experience",
+            Quest.subject == board,
+            User.is_active == True,
+        )
+        .group_by(RewardLog.user_id)
+    )
+    for user_id, total in quest_rewards.all():
+        scores[user_id] = scores.get(user_id, 0) + int(total or 0)
+    return scores
+
+
+async def ensure_board(db: AsyncSession, board: str) -> None:
+    """榜单尚未建立时（如进程内索引刚启动）从数据库加载"""
+    index = await get_leaderboard_index()
+    if not await index.is_built(board):
+        await index.replace(board, await compute_board(db, board))
+
+
+async def rebuild_all(db: AsyncSession) -> List[str]:
+    """批量重建所有榜单"""
+    index = await get_leaderboard_index()
+    subjects = set()
+    for column in (StudyRecord.subject, Quest.subject):
+        result = await db.execute(select(distinct(column)))
+        subjects.update(subject for subject in result.scalars().all() if subject)
+    boards = [GLOBAL_BOARD, *sorted(subjects)]
+    for board in boards:
+        await index.replace(board, await compute_board(db, board))
+    return boards
+
+
+if __name__ == "__main__":
+    from app.database import AsyncSessionLocal
+
+    async def _main():
+        async with AsyncSessionLocal() as db:
+            boards = await rebuild_all(db)
+        print(f"[leaderboard] rebuilt {len(boards)} boards: {', '.join(boards)}")
+
+    asyncio.run(_main())
@@ -0,0 +1,328 @@
+"""实时推送（Server-Sent Events）
+
+学生端仪表盘通过 GET /api/users/events 订阅自己的余额、升级与任务完成事件，
+取代轮询 /api/users/stats 与 /api/rewards/stats。奖励路径在事务提交后调用
+notify_reward / notify_balance 发布事件。
+
+- MemoryLiveHub：单进程，事件直接放入本进程该用户各连接的队列
+- RedisLiveHub：多 worker，事件经 live:user:{id} 频道发布，每个 worker 只持有一个
+  模式订阅连接，收到后只投递给本进程内存在连接的用户
+
+单个连接只占一个 LiveChannel（有界帧列表 + 一个等待者）和一个等待断开的任务：心跳由
+hub 的一个定时任务统一放入所有空闲连接，不为每个连接创建定时器。事件在发布时编码一次
+为 SSE 帧，多个连接共享。
+
+连接在认证所用访问令牌过期时由服务端发送 expired 事件后断开，客户端需重新取票据再连接。
+"""
+from typing import Dict, List, Optional, Sequence, Set
+import asyncio
+import logging
+import time
+
+from starlette.responses import Response
+
+from app.core.config import settings
+from app.core.redis_client import connect_redis
+from app.core.responses import dump_json
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_FRAME = b": ping\n\n"
+# 断线后客户端重连间隔（毫秒），连接建立时下发
+RETRY_FRAME = b"retry: 5000\n\n"
+
+
+def encode_event(event: str, data: dict) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + dump_json(data) + b"\n\n"
+
+
+class LiveChannel:
+    """单个连接的待发送帧；比 asyncio.Queue（三个 deque 加一个 Event）占用小得多"""
+
+    __slots__ = ("frames", "waiter", "closed")
+
+    def __init__(self):
+        self.frames: List[bytes] = []
+        self.waiter: Optional[asyncio.Future] = None
+        self.closed = False
+
+    def _wake(self) -> None:
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    def push(self, frame: bytes, limit: int) -> bool:
+        """放入一帧，积压达到 limit 时返回 False"""
+        if self.closed:
+            return True
+        if len(self.frames) >= limit:
+            return False
+        self.frames.append(frame)
+        self._wake()
+        return True
+
+    def close(self) -> None:
+        self.closed = True
+        self.frames.clear()
+        self._wake()
+
+    async def next(self) -> Optional[bytes]:
+        """等待下一帧，连接关闭时返回 None"""
+        while not self.frames:
+            if self.closed:
+                return None
+            self.waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self.waiter
+            finally:
+                self.waiter = None
+        return self.frames.pop(0)
+
+
+class MemoryLiveHub:
+    """单进程 hub：user_id -> 本进程内该用户的连接"""
+
+    def __init__(self, queue_size: int, heartbeat_seconds: float):
+        self.queue_size = queue_size
+        self.heartbeat_seconds = heartbeat_seconds
+        self._subscribers: Dict[int, Set[LiveChannel]] = {}
+        self._heartbeat: Optional[asyncio.Task] = None
+        self.published = 0
+        self.dropped = 0
+
+    async def start(self) -> None:
+        self._heartbeat = asyncio.create_task(self._beat())
+
+    async def close(self) -> None:
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+        # 通知所有连接结束
+        for channels in list(self._subscribers.values()):
+            for channel in list(channels):
+                channel.close()
+
+    def subscribe(self, user_id: int) -> LiveChannel:
+        channel = LiveChannel()
+        self._subscribers.setdefault(user_id, set()).add(channel)
+        return channel
+
+    def unsubscribe(self, user_id: int, channel: LiveChannel) -> None:
+        channels = self._subscribers.get(user_id)
+        if channels is not None:
+            channels.discard(channel)
+            if not channels:
+                del self._subscribers[user_id]
+
+    def connections(self) -> int:
+        return sum(len(channels) for channels in self._subscribers.values())
+
+    def _deliver(self, user_id: int, frame: bytes) -> None:
+        for channel in list(self._subscribers.get(user_id, ())):
+            if not channel.push(frame, self.queue_size):
+                # 慢消费者：断开，由客户端重连后重新拉取最新状态
+                self.dropped += 1
+                channel.close()
+
+    async def publish(self, user_id: int, frame: bytes) -> None:
+        self.published += 1
+        self._deliver(user_id, frame)
+
+    async def _beat(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            for channels in list(self._subscribers.values()):
+                for channel in channels:
+                    if not channel.frames:
+                        channel.push(HEARTBEAT_FRAME, self.queue_size)
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self).__name__,
+            "users": len(self._subscribers),
+            "connections": self.connections(),
+            "published": self.published,
+            "dropped": self.dropped,
+        }
+
+
+class RedisLiveHub(MemoryLiveHub):
+    """多 worker hub：事件经 live:user:{id} 频道扇出到所有 worker"""
+
+    def __init__(self, client, queue_size: int, heartbeat_seconds: float):
+        super().__init__(queue_size, heartbeat_seconds)
+        self._redis = client
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        await super().start()
+        self._pubsub = self._redis.pubsub()
+        await self._pubsub.psubscribe("live:user:*")
+        self._reader = asyncio.create_task(self._read())
+
+    async def close(self) -> None:
+        await super().close()
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._pubsub is not None:
+            await self._pubsub.close()
+        await self._redis.close()
+
+    async def publish(self, user_id: int, frame: bytes) -> None:
+        self.published += 1
+        await self._redis.publish(f"live:user:{user_id}", frame)
+
+    async def _read(self) -> None:
+        async for message in self._pubsub.listen():
+            if message["type"] != "pmessage":
+                continue
+            try:
+                channel = message["channel"]
+                channel = channel.decode() if isinstance(channel, bytes) else channel
+                user_id = int(channel.rsplit(":", 1)[1])
+                if user_id in self._subscribers:
+                    data = message["data"]
+                    self._deliver(user_id, data if isinstance(data, bytes) else data.encode())
+            except Exception as exc:
+                logger.warning("实时推送消息处理失败: %s", exc)
+
+
+class EventStreamResponse(Response):
+    """极简 SSE 响应：逐条发送连接中的帧，连接关闭或客户端断开时结束
+
+    不使用 StreamingResponse：后者每个连接额外维护一个任务组与取消域，空闲连接数量大时开销明显。
+    """
+
+    media_type = "text/event-stream"
+
+    def __init__(self, hub: MemoryLiveHub, user_id: int, initial: bytes = b"", expires_at: Optional[float] = None):
+        self.hub = hub
+        self.user_id = user_id
+        self.initial = initial
+        self.expires_at = expires_at
+        self.status_code = 200
+        self.background = None
+
+    async def __call__(self, scope, receive, send):
+        channel = self.hub.subscribe(self.user_id)
+
+        async def watch_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            channel.close()
+
+        expired = False
+
+        def expire():
+            nonlocal expired
+            expired = True
+            channel.close()
+
+        watcher = asyncio.create_task(watch_disconnect())
+        timer = None
+        if self.expires_at is not None:
+            timer = asyncio.get_running_loop().call_later(max(0.0, self.expires_at - time.time()), expire)
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream; charset=utf-8"),
+                    (b"cache-control", b"no-cache"),
+                    # 关闭 Nginx 等反向代理的响应缓冲
+                    (b"x-accel-buffering", b"no"),
+                ],
+            })
+            await send({"type": "http.response.body", "body": RETRY_FRAME + self.initial, "more_body": True})
+            while True:
+                frame = await channel.next()
+                if frame is None:
+                    break
+                await send({"type": "http.response.body", "body": frame, "more_body": True})
+            await send({
+                "type": "http.response.body",
+                "body": encode_event("expired", {}) if expired else b"",
+                "more_body": False,
+            })
+        except OSError:
+            pass
+        finally:
+            watcher.cancel()
+            if timer is not None:
+                timer.cancel()
+            self.hub.unsubscribe(self.user_id, channel)
+
+
+_hub: Optional[MemoryLiveHub] = None
+_hub_lock = asyncio.Lock()
+
+
+async def get_live_hub() -> MemoryLiveHub:
+    """获取实时推送 hub 单例（首次调用时选择后端）"""
+    global _hub
+    if _hub is not None:
+        return _hub
+    async with _hub_lock:
+        if _hub is None:
+            backend = settings.live_backend
+            client = None
+            if backend in ("auto", "redis"):
+                client = await connect_redis("实时推送")
+                if client is None and backend == "redis":
+                    raise RuntimeError("LIVE_BACKEND=redis 但无法连接 Redis")
+            if client is not None:
+                hub = RedisLiveHub(client, settings.live_queue_size, settings.live_heartbeat_seconds)
+            else:
+                hub = MemoryLiveHub(settings.live_queue_size, settings.live_heartbeat_seconds)
+            await hub.start()
+            _hub = hub
+    return _hub
+
+
+async def _publish(user_id: int, frame: bytes) -> None:
+    try:
+        hub = await get_live_hub()
+        await hub.publish(user_id, frame)
+    except Exception as exc:
+        # 推送是尽力而为，失败不影响已提交的结算；客户端重连时会拿到最新余额
+        logger.warning("实时推送发布失败: %s", exc)
+
+
+async def notify_reward(user_id: int, reward, reason: Optional[str] = None, quests: Sequence = ()) -> None:
+    """奖励事务提交后推送余额变化、升级与任务完成事件（reward 为 RewardResult，quests 为本次完成的任务）"""
+    if reward is None:
+        return
+    frames = [encode_event("reward", {
+        "experience_gained": reward.experience_gained,
+        "gold_gained": reward.gold_gained,
+        "reason": reason,
+        "level": reward.level,
+        "experience": reward.experience,
+        "gold_coins": reward.gold_coins,
+    })]
+    if reward.leveled_up:
+        frames.append(encode_event("level_up", {"level": reward.level, "bonus_gold": reward.level_up_bonus}))
+    for quest in quests:
+        frames.append(encode_event("quest_completed", {
+            "quest_id": quest.id,
+            "title": quest.title,
+            "subject": quest.subject,
+            "experience_reward": quest.experience_reward,
+            "gold_reward": quest.gold_reward,
+        }))
+    await _publish(user_id, b"".join(frames))
+
+
+async def notify_balance(user_id: int, **balance) -> None:
+    """余额变化（如兑换扣除金币）后推送最新值"""
+    await _publish(user_id, encode_event("balance", balance))
+
+
+def live_stats() -> Optional[dict]:
+    return _hub.stats() if _hub is not None else None
+
+
+async def shutdown_live_updates() -> None:
+    global _hub
+    if _hub is not None:
+        await _hub.close()
+        _hub = None
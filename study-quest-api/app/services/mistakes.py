@@ -0,0 +1,113 @@
+"""错题本（怪物图鉴）
+
+对战判题时答错或超时未答的题目按 (学生, 学科, 知识点) 记一次错误；一场对战结束时
+与奖励一起批量 upsert（count 累加、last_seen 与 quest_id 取最新），对战过程中不访问数据库。
+
+最薄弱知识点按 count DESC, last_seen DESC 排序，单个学生走 ix_mistakes_user_count 索引；
+多个学生（班级）按知识点汇总。错题复习据此推荐带相同知识点的上架任务。
+"""
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import Quest, Mistake, upsert_insert
+
+# 单条 INSERT 的最大行数
+UPSERT_CHUNK_SIZE = 1000
+
+
+async def record_mistakes(
+    db: AsyncSession,
+    mistakes: Iterable[Tuple[int, str, str]],
+    quest_id: Optional[int] = None,
+    seen_at: Optional[datetime] = None,
+) -> int:
+    """批量累加 (user_id, subject, knowledge_point) 的出错次数，返回写入的行数；调用方负责 commit"""
+    counts = Counter(mistakes)
+    if not counts:
+        return 0
+    seen_at = seen_at or datetime.now(timezone.utc)
+    rows = [
+        {"user_id": user_id, "subject": subject, "knowledge_point": point,
+         "quest_id": quest_id, "count": count, "last_seen": seen_at}
+        for (user_id, subject, point), count in sorted(counts.items())
+    ]
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        stmt = upsert_insert(db, Mistake).values(rows[start:start + UPSERT_CHUNK_SIZE])
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=["user_id", "subject", "knowledge_point"],
+            set_={
+                "count": Mistake.count + stmt.excluded.count,
+                "last_seen": stmt.excluded.last_seen,
+                "quest_id": func.coalesce(stmt.excluded.quest_id, Mistake.quest_id),
+            },
+        ))
+    return len(rows)
+
+
+async def weakest_points(
+    db: AsyncSession,
+    user_ids: Sequence[int],
+    limit: int = 10,
+    subject: Optional[str] = None,
+) -> List[dict]:
+    """一个或多个学生出错最多的知识点"""
+    if len(user_ids) == 1:
+        query = (
+            select(Mistake.subject, Mistake.knowledge_point, Mistake.count, Mistake.last_seen, Mistake.quest_id)
+            .where(Mistake.user_id == user_ids[0])
+            .order_by(Mistake.count.desc(), Mistake.last_seen.desc())
+        )
+        if subject:
+            query = query.where(Mistake.subject == subject)
+        result = await db.execute(query.limit(limit))
+        return [
+            {"subject": row.subject, "knowledge_point": row.knowledge_point, "count": row.count,
+             "last_seen": row.last_seen, "quest_id": row.quest_id, "students": 1}
+            for row in result.all()
+        ]
+
+    total = func.sum(Mistake.count).label("count")
+    last_seen = func.max(Mistake.last_seen).label("last_seen")
+    students = func.count(Mistake.user_id).label("students")
+    query = (
+        select(Mistake.subject, Mistake.knowledge_point, total, last_seen, students)
+        .where(Mistake.user_id.in_(user_ids))
+        .group_by(Mistake.subject, Mistake.knowledge_point)
+        .order_by(total.desc(), last_seen.desc())
+    )
+    if subject:
+        query = query.where(Mistake.subject == subject)
+    result = await db.execute(query.limit(limit))
+    return [
+        {"subject": row.subject, "knowledge_point": row.knowledge_point, "count": row.count,
+         "last_seen": row.last_seen, "quest_id": None, "students": row.students}
+        for row in result.all()
+    ]
+
+
+async def review_quests(db: AsyncSession, user_id: int, limit: int = 10, subject: Optional[str] = None) -> List[Tuple[Quest, dict]]:
+    """按薄弱程度推荐覆盖这些知识点的上架任务，返回 (任务, 对应错题) 列表"""
+    points = await weakest_points(db, [user_id], limit=limit, subject=subject)
+    if not points:
+        return []
+    result = await db.execute(
+        select(Quest).where(
+            Quest.is_active == True,
+            Quest.knowledge_point.in_({point["knowledge_point"] for point in points}),
+        ).order_by(Quest.id)
+    )
+    by_point = {}
+    for quest in result.scalars().all():
+        by_point.setdefault((quest.subject, quest.knowledge_point), []).append(quest)
+
+    picked = []
+    for point in points:
+        for quest in by_point.get((point["subject"], point["knowledge_point"]), ()):
+            picked.append((quest, point))
+            if len(picked) >= limit:
+                return picked
+    return picked
@@ -0,0 +1,201 @@
+"""任务进度写合并缓冲
+
+QuestMap 客户端在活动进行中每隔几秒上报一次进度。缓冲模式下，未完成的进度更新只在
+内存中按 (user_id, quest_id) 保留最新的 progress / score / time_spent，后台按间隔
+（或积压达到上限时）用一条按主键的多行 UPDATE 批量写回；已知存在的任务记录 ID 也缓存
+在进程内，稳定状态下一次进度上报不访问数据库。
+
+完成（progress >= 100）仍在请求内同步处理：先取走该任务的待写值与本次上报合并，
+再走原有的"仅未完成时标记完成 + 发放奖励"路径，奖励只发一次。取走待写值需要持有
+缓冲锁，因此不会与正在进行的批量写回交错覆盖完成状态。
+
+每日/每周派发会重置上一期的记录。批量写回只更新尚未完成、且 assigned_on 不晚于最后一次
+上报当天（本地日期）的记录，积压的上一期进度不会写到刚重置的新一期记录上；派发前也会先写回
+本进程的积压。
+
+持久性（PROGRESS_BUFFER_MODE）：
+
+- off：每次上报直接写库（无服务器部署下的默认值，实例随时可能被冻结）
+- memory：写合并，进程崩溃时最多丢失一个 PROGRESS_FLUSH_INTERVAL 的进度；
+  正常关闭时在 lifespan 中写回全部积压
+- auto（默认）：常驻进程（DB_ENGINE_PROFILE=persistent）为 memory，否则为 off
+"""
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Iterable, Optional, Tuple
+import asyncio
+import logging
+
+from sqlalchemy import update, bindparam, or_
+
+from app.core.config import settings
+from app.database import UserQuest
+from app.services.quest_assignment import local_today
+
+logger = logging.getLogger(__name__)
+
+PairKey = Tuple[int, int]
+PROGRESS_FIELDS = ("progress", "score", "time_spent")
+
+
+def buffer_enabled() -> bool:
+    mode = settings.progress_buffer_mode
+    if mode == "auto":
+        return settings.db_engine_profile == "persistent"
+    return mode == "memory"
+
+
+class ProgressBuffer:
+    def __init__(self, interval: float, max_pending: int, known_size: int):
+        self.interval = interval
+        self.max_pending = max_pending
+        self.known_size = known_size
+        # (user_id, quest_id) -> (user_quest_id, 待写字段, 最后一次上报的本地日期)
+        self._pending: Dict[PairKey, Tuple[int, dict, date]] = {}
+        # 已确认存在的 (user_id, quest_id) -> user_quest_id（LRU）
+        self._known: "OrderedDict[PairKey, int]" = OrderedDict()
+        self.lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.writes = 0
+        self.flushed_rows = 0
+        self.flushes = 0
+        self.errors = 0
+
+    def known_id(self, user_id: int, quest_id: int) -> Optional[int]:
+        key = (user_id, quest_id)
+        pending = self._pending.get(key)
+        if pending is not None:
+            return pending[0]
+        user_quest_id = self._known.get(key)
+        if user_quest_id is not None:
+            self._known.move_to_end(key)
+        return user_quest_id
+
+    def remember(self, user_id: int, quest_id: int, user_quest_id: int) -> None:
+        self._known[(user_id, quest_id)] = user_quest_id
+        self._known.move_to_end((user_id, quest_id))
+        while len(self._known) > self.known_size:
+            self._known.popitem(last=False)
+
+    def put(self, user_id: int, quest_id: int, user_quest_id: int, values: dict) -> None:
+        """合并一次进度上报（同步，不访问数据库）"""
+        self.remember(user_id, quest_id, user_quest_id)
+        key = (user_id, quest_id)
+        entry = self._pending.get(key)
+        if entry is None:
+            self._pending[key] = (user_quest_id, dict(values), local_today())
+        else:
+            entry[1].update(values)
+            self._pending[key] = (user_quest_id, entry[1], local_today())
+        self.writes += 1
+        self._ensure_task()
+        if len(self._pending) >= self.max_pending:
+            self._wakeup.set()
+
+    def peek(self, user_id: int, quest_ids: Optional[Iterable[int]] = None) -> Dict[int, dict]:
+        """某用户尚未写回的进度（quest_id -> 字段），供读接口叠加"""
+        wanted = set(quest_ids) if quest_ids is not None else None
+        return {
+            quest_id: dict(values)
+            for (owner, quest_id), (_, values, _) in self._pending.items()
+            if owner == user_id and (wanted is None or quest_id in wanted)
+        }
+
+    async def take(self, user_id: int, quest_ids: Iterable[int]) -> Dict[int, dict]:
+        """取走待写值（由调用方在自己的事务中写入）；会等待进行中的批量写回结束"""
+        async with self.lock:
+            return {
+                quest_id: self._pending.pop((user_id, quest_id))[1]
+                for quest_id in quest_ids if (user_id, quest_id) in self._pending
+            }
+
+    async def flush(self) -> int:
+        """把积压的进度按主键批量写回，返回写入行数"""
+        from app.database import AsyncSessionLocal
+
+        async with self.lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            rows = [
+                {"row_id": user_quest_id, "reported_on": reported_on, **values}
+                for user_quest_id, values, reported_on in batch.values()
+            ]
+            try:
+                async with AsyncSessionLocal() as db:
+                    # 每组字段相同的行一条 executemany UPDATE；已完成或已进入新一期的记录跳过
+                    for keys in {tuple(sorted(row)) for row in rows}:
+                        fields = [key for key in keys if key not in ("row_id", "reported_on")]
+                        await db.execute(
+                            update(UserQuest.__table__)
+                            .where(
+                                UserQuest.__table__.c.id == bindparam("row_id"),
+                                UserQuest.__table__.c.is_completed == False,
+                                or_(
+                                    UserQuest.__table__.c.assigned_on.is_(None),
+                                    UserQuest.__table__.c.assigned_on <= bindparam("reported_on"),
+                                ),
+                            )
+                            .values({field: bindparam(field) for field in fields}),
+                            [row for row in rows if tuple(sorted(row)) == keys],
+                        )
+                    await db.commit()
+            except Exception as exc:
+                # 放回缓冲（期间的新上报更新，保留新值），下个周期重试
+                for key, (user_quest_id, values, reported_on) in batch.items():
+                    newer = self._pending.get(key)
+                    self._pending[key] = (
+                        (user_quest_id, {**values, **newer[1]}, newer[2]) if newer else (user_quest_id, values, reported_on)
+                    )
+                self.errors += 1
+                logger.error("任务进度批量写回失败（%d 行）: %s", len(rows), exc)
+                return 0
+            self.flushes += 1
+            self.flushed_rows += len(rows)
+            return len(rows)
+
+    def _ensure_task(self) -> None:
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def close(self) -> None:
+        """停止后台写回并写回全部积压"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._pending:
+            logger.error("关闭时仍有 %d 条任务进度未能写回", len(self._pending))
+
+    def stats(self) -> dict:
+        return {
+            "enabled": buffer_enabled(),
+            "pending": len(self._pending),
+            "known": len(self._known),
+            "writes": self.writes,
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "errors": self.errors,
+        }
+
+
+progress_buffer = ProgressBuffer(
+    interval=settings.progress_flush_interval,
+    max_pending=settings.progress_buffer_max_pending,
+    known_size=settings.progress_buffer_known_size,
+)
@@ -0,0 +1,200 @@
+"""每日 / 每周任务派发
+
+每天为所有活跃学生派发上架中的每日任务（每周一额外轮换每周任务）。整批派发是一条
+INSERT ... SELECT（学生 × 任务）并以 (user_id, quest_id) 唯一索引做冲突处理：
+
+- 没有记录：插入新的进度行
+- 已有记录且 assigned_on 早于本期（当天 / 当周周一）：重置进度，开始新的一期
+- 本期已派发：不变
+
+- assigned_on 为空（早期手动开始、尚未归属任何一期）：视为本期，只补上 assigned_on，不重置
+
+因此同一天重复执行是幂等的；完成水位线另记在 rollup_watermarks，已派发的日期直接跳过。
+手动开始任务（POST /api/quests/start）时同样写入当期的 assigned_on。
+"日期"按 REPORT_TZ_OFFSET_HOURS 对应的本地时区计算。
+
+调度方式（QUEST_SCHEDULER）：inprocess 在 Web 进程内循环，celery 由 app/tasks.py 的
+beat 定时触发，off 不调度；auto（默认）在常驻进程或内存存储下为 inprocess，无服务器
+部署下为 off（冷启动不应触发派发，改用 Celery 或定时执行下面的命令）。多个 worker 同时
+运行进程内调度时，PostgreSQL 上用 advisory lock 保证同一时刻只有一个执行。也可手动执行：
+
+    python -m app.services.quest_assignment [YYYY-MM-DD]
+"""
+from contextlib import asynccontextmanager
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Optional
+import asyncio
+import logging
+import sys
+
+from sqlalchemy import select, case, func, literal, or_, true
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.database import User, Quest, UserQuest, RollupWatermark, upsert_insert
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_NAME = "quest_assignment"
+# 自动派发的任务类型
+ASSIGNED_QUEST_TYPES = ("daily", "weekly")
+# 进程内调度的 PostgreSQL advisory lock 键
+SCHEDULER_LOCK_KEY = 5_172_001
+
+
+def scheduler_mode() -> str:
+    mode = settings.quest_scheduler
+    if mode == "auto":
+        persistent = settings.db_engine_profile == "persistent" or settings.storage_backend == "memory"
+        return "inprocess" if persistent else "off"
+    return mode
+
+
+def local_today(tz_offset_hours: Optional[int] = None) -> date:
+    offset = settings.report_tz_offset_hours if tz_offset_hours is None else tz_offset_hours
+    return (datetime.now(timezone.utc) + timedelta(hours=offset)).date()
+
+
+def week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def assignment_period(quest_type: Optional[str], day: Optional[date] = None) -> Optional[date]:
+    """任务所属的派发周期（当天 / 当周周一），非自动派发的任务类型返回 None"""
+    if quest_type not in ASSIGNED_QUEST_TYPES:
+        return None
+    day = day or local_today()
+    return week_start(day) if quest_type == "weekly" else day
+
+
+async def _assigned_through(db: AsyncSession) -> Optional[date]:
+    result = await db.execute(select(RollupWatermark.through).where(RollupWatermark.name == WATERMARK_NAME))
+    through = result.scalar_one_or_none()
+    return through.date() if through is not None else None
+
+
+async def assign_quests(db: AsyncSession, day: date, force: bool = False) -> Optional[int]:
+    """为 day 派发每日/每周任务并提交，返回插入或重置的行数；该日已派发时返回 None"""
+    if not force:
+        through = await _assigned_through(db)
+        if through is not None and through >= day:
+            return None
+
+    # 先写回本进程积压的进度，避免上一期的进度在重置后才写回
+    from app.services.progress_buffer import progress_buffer
+    await progress_buffer.flush()
+
+    period = case((Quest.quest_type == "weekly", literal(week_start(day))), else_=literal(day))
+    stmt = upsert_insert(db, UserQuest).from_select(
+        ["user_id", "quest_id", "is_completed", "progress", "time_spent", "attempts", "assigned_on"],
+        select(User.id, Quest.id, literal(False), literal(0.0), literal(0), literal(0), period)
+        .select_from(User)
+        .join(Quest, true())  # 学生 × 任务 的笛卡尔积
+        .where(
+            User.role == "student",
+            User.is_active == True,
+            Quest.is_active == True,
+            Quest.quest_type.in_(ASSIGNED_QUEST_TYPES),
+        )
+    )
+    unassigned = UserQuest.assigned_on.is_(None)
+
+    def reset(column, value):
+        # 尚未归属任何一期的记录视为本期：保留原值，只补 assigned_on
+        return case((unassigned, column), else_=value)
+
+    result = await db.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id", "quest_id"],
+        set_={
+            "is_completed": reset(UserQuest.is_completed, False),
+            "progress": reset(UserQuest.progress, 0.0),
+            "score": reset(UserQuest.score, None),
+            "time_spent": reset(UserQuest.time_spent, 0),
+            "attempts": reset(UserQuest.attempts, 0),
+            "completed_at": reset(UserQuest.completed_at, None),
+            "assigned_on": stmt.excluded.assigned_on,
+            "updated_at": func.now(),
+        },
+        where=or_(UserQuest.assigned_on.is_(None), UserQuest.assigned_on < stmt.excluded.assigned_on),
+    ))
+
+    marker = upsert_insert(db, RollupWatermark).values(
+        name=WATERMARK_NAME, through=datetime.combine(day, time.min, tzinfo=timezone.utc)
+    )
+    await db.execute(marker.on_conflict_do_update(
+        index_elements=["name"],
+        set_={"through": marker.excluded.through},
+        where=RollupWatermark.through < marker.excluded.through,
+    ))
+    await db.commit()
+    return result.rowcount
+
+
+async def run_assignment(day: Optional[date] = None) -> Optional[int]:
+    """打开独立会话派发某天（默认本地今天）的任务"""
+    from app.database import AsyncSessionLocal
+
+    day = day or local_today()
+    started = datetime.now(timezone.utc)
+    async with AsyncSessionLocal() as db:
+        rows = await assign_quests(db, day)
+    if rows is not None:
+        elapsed = (datetime.now(timezone.utc) - started).total_seconds()
+        logger.info("已派发 %s 的每日/每周任务：%d 行，耗时 %.2f 秒", day, rows, elapsed)
+    return rows
+
+
+def seconds_until_next_run(now: Optional[datetime] = None) -> float:
+    """距离下一个本地零点（再延后 1 分钟）的秒数"""
+    offset = timedelta(hours=settings.report_tz_offset_hours)
+    local_now = (now or datetime.now(timezone.utc)) + offset
+    next_run = datetime.combine(local_now.date() + timedelta(days=1), time(0, 1), tzinfo=timezone.utc)
+    return max((next_run - local_now).total_seconds(), 1.0)
+
+
+@asynccontextmanager
+async def scheduler_lock():
+    """PostgreSQL 上尝试获取会话级 advisory lock，得到 False 表示其他 worker 正在执行；其他数据库总是 True"""
+    from app.database import engine
+
+    async with engine.connect() as conn:
+        if conn.dialect.name != "postgresql":
+            yield True
+            return
+        result = await conn.exec_driver_sql(f"SELECT pg_try_advisory_lock({SCHEDULER_LOCK_KEY})")
+        acquired = bool(result.scalar())
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                await conn.exec_driver_sql(f"SELECT pg_advisory_unlock({SCHEDULER_LOCK_KEY})")
+
+
+async def assignment_loop() -> None:
+    """进程内调度：启动时补派当天任务，之后每个本地零点执行一次（同时推进学习时长汇总）"""
+    # elo、heatmap 依赖 numpy，按需导入以缩短冷启动
+    from app.services.elo import run_rating_update
+    from app.services.heatmap import run_study_rollup
+
+    while True:
+        try:
+            async with scheduler_lock() as acquired:
+                if acquired:
+                    # 顺带增量更新 Elo 评分（对局来自 quest_results，不受派发重置影响）
+                    await run_rating_update()
+                    await run_assignment()
+                    await run_study_rollup()
+        except Exception as exc:
+            logger.error("任务派发失败: %s", exc)
+        await asyncio.sleep(seconds_until_next_run())
+
+
+if __name__ == "__main__":
+    async def _main(day: date):
+        from app.database import AsyncSessionLocal
+
+        async with AsyncSessionLocal() as db:
+            rows = await assign_quests(db, day, force=True)
+        print(f"[quests] assigned daily/weekly quests for {day}: {rows} rows")
+
+    asyncio.run(_main(date.fromisoformat(sys.argv[1]) if len(sys.argv) > 1 else local_today()))
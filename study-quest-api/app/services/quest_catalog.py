@@ -0,0 +1,70 @@
+"""任务目录缓存
+
+按 (subject, difficulty, quest_type) 缓存已序列化的任务列表及其强 ETag。查询参数是
+任意字符串，条目数以 QUEST_CATALOG_CACHE_SIZE 为上限，超出时淘汰最久未用的条目。
+任务写入时调用 invalidate_quest_catalog() 清空；多 worker 部署下其他进程的
+缓存依赖 TTL 过期。失效后 REPLICA_MAX_LAG 秒内从只读副本读到的结果可能尚未同步，
+不写入缓存。
+"""
+from collections import OrderedDict
+from typing import Optional, Tuple
+import hashlib
+import time
+
+from app.core.config import settings
+
+CatalogKey = Tuple[Optional[str], Optional[str], Optional[str]]
+
+
+class QuestCatalogCache:
+    def __init__(self, ttl: int, maxsize: int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[CatalogKey, Tuple[str, bytes, float]]" = OrderedDict()
+        self.invalidated_at = float("-inf")
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: CatalogKey) -> Optional[Tuple[str, bytes]]:
+        entry = self._entries.get(key)
+        if entry is None or entry[2] <= time.monotonic():
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0], entry[1]
+
+    def put(self, key: CatalogKey, body: bytes, store: bool = True) -> str:
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        if store:
+            self._entries[key] = (etag, body, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return etag
+
+    def invalidate(self) -> None:
+        self._entries.clear()
+        self.invalidated_at = time.monotonic()
+
+    def invalidated_within(self, seconds: float) -> bool:
+        return time.monotonic() - self.invalidated_at < seconds
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+quest_catalog_cache = QuestCatalogCache(settings.quest_catalog_cache_ttl, settings.quest_catalog_cache_size)
+
+
+def invalidate_quest_catalog() -> None:
+    """任务新增、修改、上下架后调用"""
+    quest_catalog_cache.invalidate()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """判断 If-None-Match 是否命中（支持多个值与 *）"""
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
@@ -0,0 +1,241 @@
+"""奖励结算
+
+经验、金币与升级在一条 UPDATE ... RETURNING 中完成，由数据库在行内累加，
+避免"先读后写"在并发完成时丢失更新；对应的 RewardLog / StudyRecord 在同一
+事务中批量写入，并增量累加到 reward_daily_rollup 日汇总表。调用方负责 commit。
+
+历史数据的日汇总可用批处理任务回填：
+
+    python -m app.services.rewards [天数]
+"""
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import sys
+
+from sqlalchemy import update, insert, delete, select, case, func, literal
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import User, RewardLog, StudyRecord, RewardDailyRollup, upsert_insert
+
+# 每级所需经验
+EXPERIENCE_PER_LEVEL = 100
+# 番茄钟升级额外奖励的金币
+POMODORO_LEVEL_UP_BONUS = 50
+
+
+def pomodoro_reward(duration: int) -> Tuple[int, int]:
+    """番茄钟奖励：每分钟 1 经验、0.4 金币"""
+    minutes = duration // 60
+    return minutes * 1, int(minutes * 0.4)
+
+
+def utc_today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def day_range(day: date) -> Tuple[datetime, datetime]:
+    """某个 UTC 日期对应的半开区间 [start, end)，可直接命中 created_at 索引"""
+    start = datetime.combine(day, time.min, tzinfo=timezone.utc)
+    return start, start + timedelta(days=1)
+
+
+async def bump_daily_rollup(db: AsyncSession, user_id: int, amounts: Dict[str, int]) -> None:
+    """把本次发放的各类奖励累加到当日汇总行（INSERT ... ON CONFLICT DO UPDATE）"""
+    rows = [
+        {"user_id": user_id, "day": utc_today(), "reward_type": reward_type, "amount": amount}
+        for reward_type, amount in amounts.items() if amount
+    ]
+    if not rows:
+        return
+    stmt = upsert_insert(db, RewardDailyRollup).values(rows)
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id", "day", "reward_type"],
+        set_={"amount": RewardDailyRollup.amount + stmt.excluded.amount},
+    ))
+
+
+@dataclass
+class DailyCap:
+    """按奖励日志 reason 前缀统计的每用户每日上限（UTC 日）"""
+    reason_prefix: str
+    experience: int
+    gold: int
+
+
+async def apply_daily_cap(db: AsyncSession, user_id: int, cap: DailyCap, experience: int, gold: int) -> Tuple[int, int]:
+    """锁定用户行，按当日已发放的同类奖励截断本次经验/金币"""
+    await db.execute(select(User.id).where(User.id == user_id).with_for_update())
+    start, end = day_range(utc_today())
+    result = await db.execute(
+        select(RewardLog.reward_type, func.sum(RewardLog.amount))
+        .where(
+            RewardLog.user_id == user_id,
+            RewardLog.created_at >= start,
+            RewardLog.created_at < end,
+            RewardLog.reason.startswith(cap.reason_prefix, autoescape=True),
+        )
+        .group_by(RewardLog.reward_type)
+    )
+    earned = dict(result.all())
+    return (
+        max(0, min(experience, cap.experience - (earned.get("experience") or 0))),
+        max(0, min(gold, cap.gold - (earned.get("gold") or 0))),
+    )
+
+
+@dataclass
+class RewardResult:
+    experience_gained: int
+    gold_gained: int
+    level: int
+    experience: int
+    gold_coins: int
+    leveled_up: bool
+    level_up_bonus: int = 0
+
+
+async def credit_reward(
+    db: AsyncSession,
+    user_id: int,
+    experience: int = 0,
+    gold: int = 0,
+    reason: Optional[str] = None,
+    quest_id: Optional[int] = None,
+    level_up_bonus: int = 0,
+    study_subject: Optional[str] = None,
+    study_duration: int = 0,
+    study_type: str = "pomodoro",
+    ledger: Optional[List[dict]] = None,
+    study_records: Optional[List[dict]] = None,
+    daily_cap: Optional[DailyCap] = None,
+) -> Optional[RewardResult]:
+    """原子地发放经验/金币并记账，用户不存在时返回 None
+
+    批量结算时可通过 ledger / study_records 传入逐条明细（不含 user_id），
+    此时不再按 experience/gold 生成汇总日志；明细金额之和应与 experience/gold 一致。
+    传入 daily_cap 时按当日已发放的同类奖励截断（reason 须以 cap 的前缀开头，不可与 ledger 同用）。
+    """
+    if daily_cap is not None:
+        experience, gold = await apply_daily_cap(db, user_id, daily_cap, experience, gold)
+    new_experience = User.experience + experience
+    new_level = new_experience // EXPERIENCE_PER_LEVEL + 1
+    # 等级由经验推导，跨过整百即视为升级；只依赖经验值，RETURNING 后可在本地复算
+    crossed_level = new_experience // EXPERIENCE_PER_LEVEL > User.experience // EXPERIENCE_PER_LEVEL
+
+    # SET 子句右侧引用的都是更新前的值
+    result = await db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(
+            experience=new_experience,
+            level=case((new_level > User.level, new_level), else_=User.level),
+            gold_coins=User.gold_coins + gold + case((crossed_level, level_up_bonus), else_=0),
+        )
+        .returning(User.level, User.experience, User.gold_coins)
+        .execution_options(synchronize_session=False)
+    )
+    row = result.first()
+    if row is None:
+        return None
+    level, total_experience, total_gold = row
+    did_level_up = (
+        total_experience // EXPERIENCE_PER_LEVEL
+        > (total_experience - experience) // EXPERIENCE_PER_LEVEL
+    )
+    bonus = level_up_bonus if did_level_up else 0
+
+    logs = []
+    if ledger is not None:
+        logs.extend({"user_id": user_id, **entry} for entry in ledger if entry["amount"])
+    else:
+        if experience:
+            logs.append({"user_id": user_id, "reward_type": "experience", "amount": experience,
+                         "reason": reason, "quest_id": quest_id})
+        if gold:
+            logs.append({"user_id": user_id, "reward_type": "gold", "amount": gold,
+                         "reason": reason, "quest_id": quest_id})
+    if bonus:
+        logs.append({"user_id": user_id, "reward_type": "gold", "amount": bonus,
+                     "reason": f"升级到 {level} 级奖励", "quest_id": None})
+    if logs:
+        await db.execute(insert(RewardLog), logs)
+        await bump_daily_rollup(db, user_id, {"experience": experience, "gold": gold + bonus})
+
+    if study_records:
+        await db.execute(insert(StudyRecord), [{"user_id": user_id, **record} for record in study_records])
+    elif study_subject and study_duration > 0:
+        await db.execute(insert(StudyRecord).values(
+            user_id=user_id,
+            subject=study_subject,
+            duration=study_duration,
+            study_type=study_type,
+            quest_id=quest_id,
+        ))
+
+    return RewardResult(
+        experience_gained=experience,
+        gold_gained=gold + bonus,
+        level=level,
+        experience=total_experience,
+        gold_coins=total_gold,
+        leveled_up=bool(did_level_up),
+        level_up_bonus=bonus,
+    )
+
+
+async def spend_gold(
+    db: AsyncSession,
+    user_id: int,
+    amount: int,
+    reward_type: str,
+    quantity: int,
+    reason: Optional[str] = None,
+) -> Optional[int]:
+    """原子地扣除金币并记录兑换，余额不足或用户不存在时返回 None，否则返回剩余金币"""
+    result = await db.execute(
+        update(User)
+        .where(User.id == user_id, User.gold_coins >= amount)
+        .values(gold_coins=User.gold_coins - amount)
+        .returning(User.gold_coins)
+        .execution_options(synchronize_session=False)
+    )
+    remaining = result.scalar_one_or_none()
+    if remaining is None:
+        return None
+
+    await db.execute(insert(RewardLog).values(
+        user_id=user_id,
+        reward_type=reward_type,
+        amount=quantity,
+        reason=reason,
+    ))
+    await bump_daily_rollup(db, user_id, {reward_type: quantity})
+    return remaining
+
+
+async def rebuild_daily_rollup(db: AsyncSession, day: date) -> None:
+    """用奖励日志重算某一天的汇总（单条分组聚合，按半开时间区间过滤）"""
+    start, end = day_range(day)
+    await db.execute(delete(RewardDailyRollup).where(RewardDailyRollup.day == day))
+    await db.execute(insert(RewardDailyRollup).from_select(
+        ["user_id", "day", "reward_type", "amount"],
+        select(RewardLog.user_id, literal(day), RewardLog.reward_type, func.sum(RewardLog.amount))
+        .where(RewardLog.created_at >= start, RewardLog.created_at < end)
+        .group_by(RewardLog.user_id, RewardLog.reward_type)
+    ))
+
+
+if __name__ == "__main__":
+    from app.database import AsyncSessionLocal
+
+    async def _main(days: int):
+        today = utc_today()
+        async with AsyncSessionLocal() as db:
+            for offset in range(days):
+                await rebuild_daily_rollup(db, today - timedelta(days=offset))
+            await db.commit()
+        print(f"[rewards] rebuilt daily rollup for the last {days} days")
+
+    asyncio.run(_main(int(sys.argv[1]) if len(sys.argv) > 1 else 30))
@@ -0,0 +1,72 @@
+"""Celery 定时任务
+
+启动 worker（-B 同时运行 beat 调度）：
+
+    celery -A app.tasks worker -B --loglevel=info
+
+部署了 Celery 时把 Web 进程的 QUEST_SCHEDULER 设为 celery，关闭进程内调度循环。
+"""
+import asyncio
+
+from celery import Celery
+from celery.schedules import crontab
+
+from app.core.config import settings
+
+celery_app = Celery("study_quest", broker=settings.celery_broker_url)
+celery_app.conf.timezone = "UTC"
+celery_app.conf.beat_schedule = {
+    # 本地零点过 1 分钟派发当天任务
+    "assign-daily-quests": {
+        "task": "app.tasks.assign_daily_quests",
+        "schedule": crontab(hour=(24 - settings.report_tz_offset_hours) % 24, minute=1),
+    },
+    "update-elo-ratings": {
+        "task": "app.tasks.update_elo_ratings",
+        "schedule": crontab(minute=30),
+    },
+    # 汇总按 UTC 整天推进
+    "advance-study-rollup": {
+        "task": "app.tasks.advance_study_rollup",
+        "schedule": crontab(hour=0, minute=10),
+    },
+}
+
+
+async def _run(job):
+    from app.database import engine
+
+    try:
+        return await job()
+    finally:
+        # 每次任务使用新的事件循环，连接不能跨循环复用
+        await engine.dispose()
+
+
+async def _assign_daily_quests():
+    from app.services.elo import run_rating_update
+    from app.services.quest_assignment import run_assignment
+
+    # 顺带增量更新 Elo 评分（对局来自 quest_results，不受派发重置影响）
+    await run_rating_update()
+    return await run_assignment()
+
+
+@celery_app.task(name="app.tasks.assign_daily_quests")
+def assign_daily_quests():
+    return asyncio.run(_run(_assign_daily_quests))
+
+
+@celery_app.task(name="app.tasks.update_elo_ratings")
+def update_elo_ratings():
+    from app.services.elo import run_rating_update
+
+    return asyncio.run(_run(run_rating_update))
+
+
+@celery_app.task(name="app.tasks.advance_study_rollup")
+def advance_study_rollup():
+    from app.services.heatmap import run_study_rollup
+
+    watermark = asyncio.run(_run(run_study_rollup))
+    return watermark.isoformat() if watermark else None
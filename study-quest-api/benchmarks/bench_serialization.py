@@ -0,0 +1,93 @@
+"""序列化基准：对比逐字段构造模型 + jsonable_encoder 与 from_attributes + orjson 的单行开销
+
+用法（在 study-quest-api 目录下）：
+
+    python benchmarks/bench_serialization.py [行数]
+
+输出每种方式在任务列表与排行榜负载上的每行耗时（微秒）。
+"""
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+
+from app.core.responses import dump_json, dump_models_json
+from app.schemas.quest import QuestResponse
+
+
+def make_quests(n):
+    now = datetime.now(timezone.utc)
+    return [
+        SimpleNamespace(
+            id=i, title=f"任务 {i}", description="描述" * 10, subject="数学", difficulty="medium",
+            experience_reward=50, gold_reward=10, deadline=None, quest_type="daily", created_at=now,
+        )
+        for i in range(n)
+    ]
+
+
+def make_leaderboard(n):
+    return [
+        {"rank": i + 1, "user_id": i, "username": f"学生{i}", "level": 5, "experience": 450 - i,
+         "gold_coins": 200, "score": 450 - i}
+        for i in range(n)
+    ]
+
+
+def quests_legacy(quests):
+    # 旧写法：逐字段复制构造模型，再经 jsonable_encoder 与标准库 json 编码
+    models = [
+        QuestResponse(
+            id=q.id, title=q.title, description=q.description, subject=q.subject,
+            difficulty=q.difficulty, experience_reward=q.experience_reward, gold_reward=q.gold_reward,
+            deadline=q.deadline, quest_type=q.quest_type, created_at=q.created_at,
+        )
+        for q in quests
+    ]
+    return json.dumps(jsonable_encoder(models), ensure_ascii=False).encode("utf-8")
+
+
+def quests_fast(quests):
+    return dump_models_json(QuestResponse, quests)
+
+
+def leaderboard_legacy(rows):
+    return json.dumps(jsonable_encoder(rows), ensure_ascii=False).encode("utf-8")
+
+
+def leaderboard_fast(rows):
+    return dump_json(rows)
+
+
+def measure(fn, payload, repeat=20):
+    fn(payload)  # 预热
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(payload)
+        best = min(best, time.perf_counter() - start)
+    return best / len(payload) * 1e6
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    quests = make_quests(rows)
+    leaderboard = make_leaderboard(rows)
+    results = {
+        "rows": rows,
+        "quest_list_legacy_us_per_row": measure(quests_legacy, quests),
+        "quest_list_fast_us_per_row": measure(quests_fast, quests),
+        "leaderboard_legacy_us_per_row": measure(leaderboard_legacy, leaderboard),
+        "leaderboard_fast_us_per_row": measure(leaderboard_fast, leaderboard),
+    }
+    print(json.dumps({key: round(value, 3) if isinstance(value, float) else value for key, value in results.items()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
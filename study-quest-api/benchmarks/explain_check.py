@@ -0,0 +1,169 @@
+"""热点查询执行计划回归检查
+
+在预置数据（与 loadtest.py 相同的学生、任务与历史记录）上对热点查询执行 EXPLAIN，
+任何一条回退为全表顺序扫描时以非零状态退出。SQLite 上的同一检查已在
+tests/test_query_plans.py 中随 pytest 运行；本脚本用于一次性 Postgres 或现有库。
+
+    python benchmarks/explain_check.py                                   # 临时 SQLite
+    python benchmarks/explain_check.py --database-url postgresql+asyncpg://... --drop-existing   # 一次性 Postgres
+
+PostgreSQL 上会先执行 SET enable_seqscan = off：若计划中仍出现 Seq Scan，说明不存在
+可用的索引，与数据量无关。预置数据会清空重建 --database-url 指向的库，须同时传
+--drop-existing；--no-seed 时直接检查已迁移的现有库，不做任何写入。
+"""
+from datetime import datetime, timedelta, timezone
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="热点查询执行计划检查")
+    parser.add_argument("--database-url", default=None, help="默认使用临时 SQLite 文件")
+    parser.add_argument("--students", type=int, default=300)
+    parser.add_argument("--quests", type=int, default=100)
+    parser.add_argument("--history", type=int, default=30)
+    parser.add_argument("--no-seed", action="store_true", help="不重建数据，直接检查现有库")
+    parser.add_argument("--drop-existing", action="store_true",
+                        help="允许清空并重建 --database-url 指向的库")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+def hot_queries():
+    """与路由中的写法保持一致的热点查询"""
+    from sqlalchemy import select
+    from app.database import Quest, UserQuest, RewardLog, StudyRecord, RewardDailyRollup, Mistake
+
+    now = datetime.now(timezone.utc)
+    return {
+        # PUT /api/quests/progress/{quest_id}
+        "user_quest_by_pair": select(UserQuest).where(UserQuest.user_id == 1, UserQuest.quest_id == 1),
+        # GET /api/quests/user
+        "user_quest_list": (
+            select(UserQuest, Quest).join(UserQuest.quest)
+            .where(UserQuest.user_id == 1, UserQuest.is_completed == False)
+            .order_by(UserQuest.id.desc()).limit(21)
+        ),
+        # GET /api/rewards/history
+        "reward_history": (
+            select(RewardLog).where(RewardLog.user_id == 1)
+            .order_by(RewardLog.created_at.desc()).limit(20)
+        ),
+        # GET /api/users/heatmap（水位线之后的原始记录）
+        "study_records_range": (
+            select(StudyRecord.created_at, StudyRecord.duration, StudyRecord.subject)
+            .where(
+                StudyRecord.user_id == 1,
+                StudyRecord.created_at >= now - timedelta(days=7),
+                StudyRecord.created_at < now,
+            )
+        ),
+        # GET /api/rewards/stats
+        "reward_daily_rollup": (
+            select(RewardDailyRollup.reward_type, RewardDailyRollup.amount)
+            .where(RewardDailyRollup.user_id == 1, RewardDailyRollup.day == now.date())
+        ),
+        # GET /api/quests/?subject=
+        "active_quests_by_subject": (
+            select(Quest).where(Quest.is_active == True, Quest.subject == "数学", Quest.quest_type == "daily")
+        ),
+        # GET /api/users/mistakes
+        "weakest_points": (
+            select(Mistake.subject, Mistake.knowledge_point, Mistake.count, Mistake.last_seen)
+            .where(Mistake.user_id == 1)
+            .order_by(Mistake.count.desc(), Mistake.last_seen.desc()).limit(10)
+        ),
+        # GET /api/quests/review（路由中为 IN 列表，这里用单个知识点检查索引）
+        "review_quests_by_point": (
+            select(Quest).where(Quest.is_active == True, Quest.knowledge_point == "知识点1")
+        ),
+    }
+
+
+def sqlite_seq_scans(rows):
+    """EXPLAIN QUERY PLAN 中未使用索引的 SCAN 步骤"""
+    scans = []
+    for row in rows:
+        detail = row[-1]
+        if detail.startswith("SCAN ") and "USING" not in detail:
+            scans.append(detail)
+    return scans
+
+
+def postgres_seq_scans(plan):
+    scans = []
+
+    def walk(node):
+        if node.get("Node Type") == "Seq Scan":
+            scans.append(f"Seq Scan on {node.get('Relation Name')}")
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan[0]["Plan"])
+    return scans
+
+
+async def explain_plans(conn):
+    """在给定连接上 EXPLAIN 全部热点查询，返回 {名称: {ok, seq_scans, plan}}"""
+    results = {}
+    dialect = conn.dialect
+    await conn.exec_driver_sql("ANALYZE")
+    if dialect.name == "postgresql":
+        await conn.exec_driver_sql("SET enable_seqscan = off")
+
+    for name, stmt in hot_queries().items():
+        compiled = stmt.compile(dialect=dialect)
+        params = tuple(compiled.params[key] for key in compiled.positiontup)
+        if dialect.name == "postgresql":
+            result = await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled.string}", params)
+            plan = result.scalar_one()
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            scans = postgres_seq_scans(plan)
+        else:
+            result = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled.string}", params)
+            rows = result.all()
+            plan = [row[-1] for row in rows]
+            scans = sqlite_seq_scans(rows)
+        results[name] = {"ok": not scans, "seq_scans": scans, "plan": plan}
+    return results
+
+
+async def explain_all():
+    from app.database import engine
+
+    async with engine.connect() as conn:
+        results = await explain_plans(conn)
+    await engine.dispose()
+    return results
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="study-quest-explain-")
+    database_url = args.database_url or f"sqlite+aiosqlite:///{os.path.join(workdir, 'explain.db')}"
+    os.environ.update({
+        "DATABASE_URL": database_url,
+        "BCRYPT_ROUNDS": os.environ.get("BCRYPT_ROUNDS", "4"),
+    })
+    sys.path[:0] = [API_DIR, BENCH_DIR]
+
+    if not args.no_seed:
+        from loadtest import seed
+        asyncio.run(seed(args))
+
+    results = asyncio.run(explain_all())
+    failed = [name for name, result in results.items() if not result["ok"]]
+    print(json.dumps({"database": database_url.split("://")[0], "failed": failed, "queries": results},
+                     ensure_ascii=False, indent=2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""端到端压测脚本
+
+在本地 SQLite（aiosqlite）上启动 main:app，预置 N 个学生、任务与历史记录，然后按
+场景并发驱动真实 HTTP 请求，输出各路由的吞吐与 p50/p95/p99 延迟（JSON）。
+
+用法（在 study-quest-api 目录下）：
+
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/loadtest.py --students 500 --scenario mixed --duration 20 --output result.json
+
+场景：login（早高峰登录）、dashboard（学生首页加载）、pomodoro（下课铃番茄钟结算）、
+leaderboard（排行榜读取）、mixed（按权重混合）。也可用 --url 压测已在运行的服务
+（此时需自行保证库中存在 loadtest_* 账号）。预置数据会先清空重建整个库（drop_all），
+因此 --database-url 指向非临时库时必须同时传 --drop-existing，只能用于专门的压测库，
+例如：--seed-only --database-url <压测库> --drop-existing。
+"""
+from datetime import datetime, timedelta, timezone
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = "loadtest-password"
+SUBJECTS = ["数学", "英语", "物理", "语文", "化学"]
+KNOWLEDGE_POINTS = 20
+
+SCENARIOS = {
+    "login": {"login": 1},
+    "dashboard": {"dashboard": 1},
+    "pomodoro": {"pomodoro": 1},
+    "leaderboard": {"leaderboard": 1},
+    "mixed": {"login": 1, "dashboard": 5, "pomodoro": 2, "leaderboard": 2},
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Study Quest API 压测")
+    parser.add_argument("--students", type=int, default=200)
+    parser.add_argument("--quests", type=int, default=50)
+    parser.add_argument("--history", type=int, default=20, help="每个学生的历史学习记录条数")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=15.0, help="压测时长（秒）")
+    parser.add_argument("--database-url", default=None, help="默认使用临时 SQLite 文件")
+    parser.add_argument("--url", default=None, help="压测已在运行的服务，不再自行启动")
+    parser.add_argument("--output", default=None, help="结果写入文件（默认输出到 stdout）")
+    parser.add_argument("--seed-only", action="store_true")
+    parser.add_argument("--drop-existing", action="store_true",
+                        help="允许清空并重建 --database-url 指向的库（预置数据前会 drop_all）")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+async def seed(args):
+    """清空并重建库，批量写入学生、任务、任务进度与历史记录"""
+    if args.database_url and not args.drop_existing:
+        raise SystemExit(f"预置数据会清空 {args.database_url.split('@')[-1]} 的所有表；"
+                         "确认是专门的压测库后加 --drop-existing")
+    from app.database import engine, Base
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        await insert_seed_rows(conn, args)
+    await engine.dispose()
+
+
+async def insert_seed_rows(conn, args):
+    """在已建好表的空库中写入预置数据（args 需含 students / quests / history / seed）"""
+    from sqlalchemy import insert
+    from app.database import User, Quest, UserQuest, StudyRecord, RewardLog, Mistake
+    from app.core.security import get_password_hash
+
+    rng = random.Random(args.seed)
+    hashed = get_password_hash(PASSWORD)
+    now = datetime.now(timezone.utc)
+
+    await conn.execute(insert(User), [
+        {"username": f"loadtest_{i}", "hashed_password": hashed, "role": "student",
+         "nickname": f"学生{i}", "level": 1, "experience": 0, "gold_coins": 100, "is_active": True}
+        for i in range(args.students)
+    ])
+    await conn.execute(insert(Quest), [
+        {"title": f"任务 {i}", "subject": SUBJECTS[i % len(SUBJECTS)], "knowledge_point": f"知识点{i % KNOWLEDGE_POINTS}",
+         "difficulty": rng.choice(["easy", "medium", "hard"]), "experience_reward": rng.randint(10, 80),
+         "gold_reward": rng.randint(5, 20), "quest_type": rng.choice(["daily", "weekly"]), "is_active": True}
+        for i in range(args.quests)
+    ])
+    user_quests, records, logs, mistakes = [], [], [], []
+    for user_id in range(1, args.students + 1):
+        for quest_id in rng.sample(range(1, args.quests + 1), min(5, args.quests)):
+            user_quests.append({"user_id": user_id, "quest_id": quest_id, "progress": rng.uniform(0, 99),
+                                "is_completed": False, "time_spent": rng.randint(0, 1800), "attempts": 1})
+        for point in rng.sample(range(KNOWLEDGE_POINTS), 5):
+            mistakes.append({"user_id": user_id, "subject": rng.choice(SUBJECTS), "knowledge_point": f"知识点{point}",
+                             "count": rng.randint(1, 10), "last_seen": now - timedelta(days=rng.randint(0, 30))})
+        for _ in range(args.history):
+            created = now - timedelta(minutes=rng.randint(0, 60 * 24 * 30))
+            subject = rng.choice(SUBJECTS)
+            records.append({"user_id": user_id, "subject": subject, "duration": 1500,
+                            "study_type": "pomodoro", "created_at": created})
+            logs.append({"user_id": user_id, "reward_type": "experience", "amount": 25,
+                         "reason": f"番茄钟学习：{subject}", "created_at": created})
+    await conn.execute(insert(UserQuest), user_quests)
+    await conn.execute(insert(StudyRecord), records)
+    await conn.execute(insert(RewardLog), logs)
+    await conn.execute(insert(Mistake), mistakes)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_ready(client, base_url, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(f"{base_url}/health")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("服务未能在超时时间内启动")
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+
+    def add(self, route, elapsed, ok):
+        self.samples.setdefault(route, []).append(elapsed)
+        if not ok:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+    def report(self, wall_seconds):
+        routes = {}
+        for route, samples in sorted(self.samples.items()):
+            ordered = sorted(samples)
+
+            def pct(p):
+                return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 2)
+
+            routes[route] = {
+                "requests": len(ordered),
+                "errors": self.errors.get(route, 0),
+                "throughput_rps": round(len(ordered) / wall_seconds, 2),
+                "p50_ms": pct(50),
+                "p95_ms": pct(95),
+                "p99_ms": pct(99),
+                "max_ms": round(ordered[-1] * 1000, 2),
+            }
+        total = sum(len(samples) for samples in self.samples.values())
+        return {
+            "total_requests": total,
+            "total_errors": sum(self.errors.values()),
+            "throughput_rps": round(total / wall_seconds, 2),
+            "routes": routes,
+        }
+
+
+async def call(client, recorder, method, base_url, route, token=None, **kwargs):
+    headers = {"Authorization": f"Bearer {token}"} if token else None
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, base_url + route, headers=headers, **kwargs)
+        ok = response.status_code < 400
+    except Exception:
+        response, ok = None, False
+    recorder.add(f"{method} {route}", time.perf_counter() - started, ok)
+    return response
+
+
+async def login(client, recorder, base_url, username):
+    response = await call(client, recorder, "POST", base_url, "/api/auth/login-json",
+                          json={"username": username, "password": PASSWORD})
+    if response is not None and response.status_code == 200:
+        return response.json()["access_token"]
+    return None
+
+
+async def run_action(action, client, recorder, base_url, rng, tokens, students):
+    username = f"loadtest_{rng.randrange(students)}"
+    if action == "login":
+        tokens[username] = await login(client, recorder, base_url, username) or tokens.get(username)
+        return
+    token = tokens.get(username)
+    if token is None:
+        token = tokens[username] = await login(client, recorder, base_url, username)
+        if token is None:
+            return
+    if action == "dashboard":
+        for route in ("/api/users/profile", "/api/users/stats", "/api/rewards/stats", "/api/quests/user", "/api/quests/"):
+            await call(client, recorder, "GET", base_url, route, token)
+    elif action == "pomodoro":
+        await call(client, recorder, "POST", base_url, "/api/battles/pomodoro-complete", token,
+                   params={"subject": rng.choice(SUBJECTS), "duration": 1500})
+    elif action == "leaderboard":
+        await call(client, recorder, "GET", base_url, "/api/battles/leaderboard", params={"limit": 20})
+        await call(client, recorder, "GET", base_url, "/api/battles/leaderboard/me", token,
+                   params={"subject": rng.choice(SUBJECTS)})
+
+
+async def drive(args, base_url):
+    import httpx
+
+    weights = SCENARIOS[args.scenario]
+    actions, action_weights = list(weights), list(weights.values())
+    recorder = Recorder()
+    tokens = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(timeout=30.0, limits=limits) as client:
+        await wait_until_ready(client, base_url)
+        deadline = time.monotonic() + args.duration
+
+        async def worker(index):
+            rng = random.Random(args.seed + index)
+            while time.monotonic() < deadline:
+                action = rng.choices(actions, action_weights)[0]
+                await run_action(action, client, recorder, base_url, rng, tokens, args.students)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+        wall = time.perf_counter() - started
+
+    return recorder.report(wall)
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="study-quest-loadtest-")
+    database_url = args.database_url or f"sqlite+aiosqlite:///{os.path.join(workdir, 'loadtest.db')}"
+
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": database_url,
+        "DB_SCHEMA_MODE": "off",
+        "BCRYPT_ROUNDS": env.get("BCRYPT_ROUNDS", "4"),
+        "LEADERBOARD_BACKEND": env.get("LEADERBOARD_BACKEND", "memory"),
+    })
+    os.environ.update(env)
+    sys.path.insert(0, API_DIR)
+
+    server = None
+    if args.url is None or args.seed_only:
+        asyncio.run(seed(args))
+    if args.seed_only:
+        print(json.dumps({"seeded": args.students, "database_url": database_url}))
+        return
+
+    base_url = args.url
+    if base_url is None:
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+             "--log-level", "warning", "--no-access-log"],
+            cwd=API_DIR, env=env,
+        )
+    try:
+        report = asyncio.run(drive(args, base_url))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+
+    report = {
+        "scenario": args.scenario,
+        "students": args.students,
+        "concurrency": args.concurrency,
+        "duration_s": args.duration,
+        "database_url": database_url if args.url is None else None,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        **report,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
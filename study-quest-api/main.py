@@ -1,26 +1,35 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+import time
+
+# 冷启动计时起点（进程导入本模块时）
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from contextlib import asynccontextmanager
 import asyncio
-import uvicorn
 from dotenv import load_dotenv
 import os
 
-from app.database import engine, Base
-from app.routers import auth, users, quests, battles, rewards
-from app.core.config import settings
-from app.core.security import verify_token
-
-# 加载环境变量
+# 加载环境变量（须在导入 app.* 之前，数据库等模块在导入时读取配置）
 load_dotenv()
 
-# 安全认证
-security = HTTPBearer()
+from app.database import engine, Base, get_pool_status, get_schema_revision, recent_writers, SCHEMA_REVISION
+from app.routers import auth, users, quests, battles, rewards, sync
+from app.core.config import settings
+from app.core.metrics import MetricsMiddleware, render_metrics
+from app.core.query_profiler import QueryProfilerMiddleware
+from app.core.read_routing import ReadYourWritesMiddleware
+from app.core.responses import DefaultJSONResponse
+from app.core.security import password_pool, token_cache
+from app.services.quest_catalog import quest_catalog_cache
+from app.services.battle_rooms import battle_stats, shutdown_battle_rooms
+from app.services.live_updates import live_stats, shutdown_live_updates
+from app.services.quest_assignment import assignment_loop, scheduler_mode
+from app.services.progress_buffer import progress_buffer
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-	# 启动时创建数据库表，带重试（适配无服务器与冷启动）
+async def create_all_with_retries():
+	"""本地开发用：直接按模型建表，带重试"""
 	retries = int(os.getenv("DB_INIT_RETRIES", "5"))
 	delay_seconds = float(os.getenv("DB_INIT_DELAY", "1.5"))
 	for attempt in range(1, retries + 1):
@@ -35,14 +44,55 @@ async def lifespan(app: FastAPI):
 				print("[startup] giving up database init after retries")
 				raise
 			await asyncio.sleep(delay_seconds)
+
+async def check_schema_revision():
+	"""一次轻量查询核对迁移版本，不一致只告警不阻塞启动"""
+	try:
+		revision = await get_schema_revision()
+	except Exception as exc:
+		print(f"[startup] schema check skipped: {exc}")
+		return
+	if revision != SCHEMA_REVISION:
+		print(f"[startup] schema revision {revision} != {SCHEMA_REVISION}, run `alembic upgrade head`")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+	# 表结构由 Alembic 迁移管理；启动时最多做一次版本核对（DB_SCHEMA_MODE=off 时跳过）
+	# 内存存储每次启动都是空库，总是按模型建表
+	if settings.storage_backend == "memory" or settings.db_schema_mode == "create_all":
+		await create_all_with_retries()
+	elif settings.db_schema_mode == "check":
+		await check_schema_revision()
+	
+	cold_start_ms = round((time.perf_counter() - _import_started) * 1000, 1)
+	app.state.startup = {
+		"cold_start_ms": cold_start_ms,
+		"budget_ms": settings.cold_start_budget_ms,
+		"within_budget": cold_start_ms <= settings.cold_start_budget_ms,
+	}
+	level = "ok" if app.state.startup["within_budget"] else "OVER BUDGET"
+	print(f"[startup] ready in {cold_start_ms} ms (budget {settings.cold_start_budget_ms} ms, {level})")
+	
+	# 每日/每周任务派发（部署 Celery beat 时设 QUEST_SCHEDULER=celery 关闭进程内调度）
+	scheduler = asyncio.create_task(assignment_loop()) if scheduler_mode() == "inprocess" else None
 	yield
+	if scheduler is not None:
+		scheduler.cancel()
+	# 写回缓冲中的任务进度
+	await progress_buffer.close()
+	await shutdown_battle_rooms()
+	await shutdown_live_updates()
+	password_pool.shutdown()
+	# 关闭连接（内存存储随之清空，下次启动重新建表）
+	await engine.dispose()
 
 # 创建FastAPI应用
 app = FastAPI(
 	title="Study Quest API",
 	description="游戏化学习系统后端API",
 	version="1.0.0",
-	lifespan=lifespan
+	lifespan=lifespan,
+	default_response_class=DefaultJSONResponse
 )
 
 # 配置CORS
@@ -61,26 +111,22 @@ app.add_middleware(
 	allow_credentials=True,
 	allow_methods=["*"],
 	allow_headers=["*"],
+	expose_headers=["X-Next-Cursor", "X-DB-Queries"],
 )
 
-# 依赖注入：获取当前用户
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-	try:
-		payload = verify_token(credentials.credentials)
-		user_id = payload.get("sub")
-		if user_id is None:
-			raise HTTPException(
-				status_code=status.HTTP_401_UNAUTHORIZED,
-				detail="无效的认证凭据",
-				headers={"WWW-Authenticate": "Bearer"},
-			)
-		return user_id
-	except Exception:
-		raise HTTPException(
-			status_code=status.HTTP_401_UNAUTHORIZED,
-			detail="无效的认证凭据",
-			headers={"WWW-Authenticate": "Bearer"},
-		)
+# 请求指标：按路由模板统计耗时、状态码、并发数与数据库耗时
+if settings.metrics_enabled:
+	app.add_middleware(MetricsMiddleware)
+
+# SQL 分析：疑似 N+1 时记录告警，可选在响应头输出摘要
+app.add_middleware(
+	QueryProfilerMiddleware,
+	emit_header=settings.query_profiler_header,
+	duplicate_threshold=settings.query_duplicate_threshold,
+)
+
+# 读己之写：写请求成功后短时间内该令牌的只读请求走主库（未配置副本时无影响）
+app.add_middleware(ReadYourWritesMiddleware, writers=recent_writers)
 
 # 包含路由
 app.include_router(auth.router, prefix="/api/auth", tags=["认证"])
@@ -88,6 +134,7 @@ app.include_router(users.router, prefix="/api/users", tags=["用户"])
 app.include_router(quests.router, prefix="/api/quests", tags=["任务"])
 app.include_router(battles.router, prefix="/api/battles", tags=["战斗"])
 app.include_router(rewards.router, prefix="/api/rewards", tags=["奖励"])
+app.include_router(sync.router, prefix="/api/sync", tags=["离线同步"])
 
 @app.get("/")
 async def root():
@@ -95,9 +142,31 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-	return {"status": "healthy", "service": "Study Quest API"}
+	return {
+		"status": "healthy",
+		"service": "Study Quest API",
+		"database": get_pool_status(),
+		"password_hashing": password_pool.stats(),
+		"token_cache": token_cache.stats(),
+		"quest_catalog_cache": quest_catalog_cache.stats(),
+		"battle_rooms": battle_stats(),
+		"progress_buffer": progress_buffer.stats(),
+		"live_updates": live_stats(),
+		"startup": getattr(app.state, "startup", None),
+	}
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=settings.metrics_enabled)
+async def metrics():
+	"""Prometheus 抓取端点"""
+	if not settings.metrics_enabled:
+		return PlainTextResponse("metrics disabled\n", status_code=404)
+	return PlainTextResponse(
+		render_metrics(get_pool_status(), password_pool.stats()),
+		media_type="text/plain; version=0.0.4",
+	)
 
 if __name__ == "__main__":
+	import uvicorn
 	uvicorn.run(
 		"main:app",
 		host="0.0.0.0",
@@ -0,0 +1,145 @@
+"""initial schema
+
+原先由 Base.metadata.create_all 在启动时创建的五张表。由旧版本升级的数据库没有
+alembic_version 表，表却已存在：已存在的表（及其索引）直接跳过，因此部署时的
+`alembic upgrade head` 无需先手动 `alembic stamp 0001`。
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if "users" not in existing:
+        _create_users()
+    if "quests" not in existing:
+        _create_quests()
+    if "user_quests" not in existing:
+        _create_user_quests()
+    if "study_records" not in existing:
+        _create_study_records()
+    if "reward_logs" not in existing:
+        _create_reward_logs()
+
+
+def _create_users() -> None:
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("username", sa.String(length=50), nullable=False),
+        sa.Column("email", sa.String(length=100), nullable=True),
+        sa.Column("hashed_password", sa.String(length=255), nullable=False),
+        sa.Column("role", sa.String(length=20), nullable=False),
+        sa.Column("nickname", sa.String(length=50), nullable=True),
+        sa.Column("avatar", sa.String(length=255), nullable=True),
+        sa.Column("level", sa.Integer(), nullable=True),
+        sa.Column("experience", sa.Integer(), nullable=True),
+        sa.Column("gold_coins", sa.Integer(), nullable=True),
+        sa.Column("is_active", sa.Boolean(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_users_id", "users", ["id"], unique=False)
+    op.create_index("ix_users_username", "users", ["username"], unique=True)
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+
+def _create_quests() -> None:
+    op.create_table(
+        "quests",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("title", sa.String(length=200), nullable=False),
+        sa.Column("description", sa.Text(), nullable=True),
+        sa.Column("subject", sa.String(length=50), nullable=False),
+        sa.Column("difficulty", sa.String(length=20), nullable=True),
+        sa.Column("experience_reward", sa.Integer(), nullable=True),
+        sa.Column("gold_reward", sa.Integer(), nullable=True),
+        sa.Column("deadline", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("quest_type", sa.String(length=20), nullable=True),
+        sa.Column("is_active", sa.Boolean(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_quests_id", "quests", ["id"], unique=False)
+
+
+def _create_user_quests() -> None:
+    op.create_table(
+        "user_quests",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("quest_id", sa.Integer(), nullable=False),
+        sa.Column("is_completed", sa.Boolean(), nullable=True),
+        sa.Column("progress", sa.Float(), nullable=True),
+        sa.Column("score", sa.Integer(), nullable=True),
+        sa.Column("time_spent", sa.Integer(), nullable=True),
+        sa.Column("attempts", sa.Integer(), nullable=True),
+        sa.Column("completed_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(["quest_id"], ["quests.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_user_quests_id", "user_quests", ["id"], unique=False)
+
+
+def _create_study_records() -> None:
+    op.create_table(
+        "study_records",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("subject", sa.String(length=50), nullable=False),
+        sa.Column("duration", sa.Integer(), nullable=False),
+        sa.Column("study_type", sa.String(length=20), nullable=True),
+        sa.Column("quest_id", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.ForeignKeyConstraint(["quest_id"], ["quests.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_study_records_id", "study_records", ["id"], unique=False)
+
+
+def _create_reward_logs() -> None:
+    op.create_table(
+        "reward_logs",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("reward_type", sa.String(length=50), nullable=False),
+        sa.Column("amount", sa.Integer(), nullable=False),
+        sa.Column("reason", sa.String(length=200), nullable=True),
+        sa.Column("quest_id", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.ForeignKeyConstraint(["quest_id"], ["quests.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_reward_logs_id", "reward_logs", ["id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_reward_logs_id", table_name="reward_logs")
+    op.drop_table("reward_logs")
+    op.drop_index("ix_study_records_id", table_name="study_records")
+    op.drop_table("study_records")
+    op.drop_index("ix_user_quests_id", table_name="user_quests")
+    op.drop_table("user_quests")
+    op.drop_index("ix_quests_id", table_name="quests")
+    op.drop_table("quests")
+    op.drop_index("ix_users_email", table_name="users")
+    op.drop_index("ix_users_username", table_name="users")
+    op.drop_index("ix_users_id", table_name="users")
+    op.drop_table("users")
@@ -0,0 +1,74 @@
+"""rollups and client events
+
+奖励日汇总、学习时长小时汇总、汇总水位线与离线事件去重表。
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "reward_daily_rollup",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("reward_type", sa.String(length=50), nullable=False),
+        sa.Column("amount", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("user_id", "day", "reward_type", name="uq_reward_daily_rollup_user_day_type"),
+    )
+    op.create_index("ix_reward_daily_rollup_id", "reward_daily_rollup", ["id"], unique=False)
+
+    op.create_table(
+        "study_hourly_rollup",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("hour_start", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("subject", sa.String(length=50), nullable=False),
+        sa.Column("seconds", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("user_id", "hour_start", "subject", name="uq_study_hourly_rollup_user_hour_subject"),
+    )
+    op.create_index("ix_study_hourly_rollup_id", "study_hourly_rollup", ["id"], unique=False)
+
+    op.create_table(
+        "rollup_watermarks",
+        sa.Column("name", sa.String(length=50), nullable=False),
+        sa.Column("through", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("name"),
+    )
+
+    op.create_table(
+        "client_events",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("client_event_id", sa.String(length=64), nullable=False),
+        sa.Column("event_type", sa.String(length=20), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("user_id", "client_event_id", name="uq_client_events_user_event"),
+    )
+    op.create_index("ix_client_events_id", "client_events", ["id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_client_events_id", table_name="client_events")
+    op.drop_table("client_events")
+    op.drop_table("rollup_watermarks")
+    op.drop_index("ix_study_hourly_rollup_id", table_name="study_hourly_rollup")
+    op.drop_table("study_hourly_rollup")
+    op.drop_index("ix_reward_daily_rollup_id", table_name="reward_daily_rollup")
+    op.drop_table("reward_daily_rollup")
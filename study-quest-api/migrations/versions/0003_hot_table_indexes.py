@@ -0,0 +1,52 @@
+"""hot table indexes
+
+user_quests 的 (user_id, quest_id) 唯一索引，reward_logs / study_records 的
+(user_id, created_at) 复合索引，以及上架任务的部分索引。
+
+建唯一索引前先清理重复的用户任务记录：同一 (user_id, quest_id) 优先保留已完成的，
+其次保留最早创建的一条。
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        DELETE FROM user_quests WHERE id IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY user_id, quest_id
+                    ORDER BY CASE WHEN is_completed THEN 0 ELSE 1 END, id
+                ) AS duplicate_rank
+                FROM user_quests
+            ) ranked
+            WHERE duplicate_rank > 1
+        )
+        """
+    )
+    op.create_index("uq_user_quests_user_quest", "user_quests", ["user_id", "quest_id"], unique=True)
+    op.create_index("ix_reward_logs_user_created", "reward_logs", ["user_id", "created_at"], unique=False)
+    op.create_index("ix_study_records_user_created", "study_records", ["user_id", "created_at"], unique=False)
+    op.create_index(
+        "ix_quests_active_subject_type", "quests", ["subject", "quest_type"], unique=False,
+        postgresql_where=sa.text("is_active = true"),
+        sqlite_where=sa.text("is_active = 1"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_quests_active_subject_type", table_name="quests")
+    op.drop_index("ix_study_records_user_created", table_name="study_records")
+    op.drop_index("ix_reward_logs_user_created", table_name="reward_logs")
+    op.drop_index("uq_user_quests_user_quest", table_name="user_quests")
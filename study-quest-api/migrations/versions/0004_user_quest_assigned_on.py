@@ -0,0 +1,25 @@
+"""user quest assigned_on
+
+user_quests.assigned_on：定时派发每日/每周任务的日期，派发任务据此按天幂等地重置进度。
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("user_quests", sa.Column("assigned_on", sa.Date(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("user_quests") as batch_op:
+        batch_op.drop_column("assigned_on")
@@ -0,0 +1,43 @@
+"""elo ratings
+
+学生分学科能力评分表 student_ratings，以及任务的 Elo 难度评分列。
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("quests", sa.Column("rating", sa.Float(), nullable=True))
+    op.add_column("quests", sa.Column("rating_games", sa.Integer(), nullable=True))
+
+    op.create_table(
+        "student_ratings",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("subject", sa.String(length=50), nullable=False),
+        sa.Column("rating", sa.Float(), nullable=False),
+        sa.Column("games", sa.Integer(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("user_id", "subject", name="uq_student_ratings_user_subject"),
+    )
+    op.create_index("ix_student_ratings_id", "student_ratings", ["id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_student_ratings_id", table_name="student_ratings")
+    op.drop_table("student_ratings")
+    with op.batch_alter_table("quests") as batch_op:
+        batch_op.drop_column("rating_games")
+        batch_op.drop_column("rating")
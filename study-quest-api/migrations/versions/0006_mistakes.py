@@ -0,0 +1,52 @@
+"""mistakes
+
+错题本 mistakes（学生 × 学科 × 知识点的出错次数与最近出错时间），以及任务的知识点列，
+供错题复习按知识点推荐任务。
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("quests", sa.Column("knowledge_point", sa.String(length=100), nullable=True))
+    op.create_index(
+        "ix_quests_active_knowledge_point", "quests", ["knowledge_point"], unique=False,
+        postgresql_where=sa.text("is_active = true"),
+        sqlite_where=sa.text("is_active = 1"),
+    )
+
+    op.create_table(
+        "mistakes",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("subject", sa.String(length=50), nullable=False),
+        sa.Column("knowledge_point", sa.String(length=100), nullable=False),
+        sa.Column("quest_id", sa.Integer(), nullable=True),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.Column("last_seen", sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.ForeignKeyConstraint(["quest_id"], ["quests.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("user_id", "subject", "knowledge_point", name="uq_mistakes_user_subject_point"),
+    )
+    op.create_index("ix_mistakes_id", "mistakes", ["id"], unique=False)
+    op.create_index("ix_mistakes_user_count", "mistakes", ["user_id", "count", "last_seen"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_mistakes_user_count", table_name="mistakes")
+    op.drop_index("ix_mistakes_id", table_name="mistakes")
+    op.drop_table("mistakes")
+    op.drop_index("ix_quests_active_knowledge_point", table_name="quests")
+    with op.batch_alter_table("quests") as batch_op:
+        batch_op.drop_column("knowledge_point")
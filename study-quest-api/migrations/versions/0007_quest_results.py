@@ -0,0 +1,44 @@
+"""quest results
+
+任务完成结果表 quest_results（只追加），Elo 评分改为从这里读取对局，不再依赖会被每日/每周
+派发重置的 user_quests。升级时用现存的已完成记录回填。
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "quest_results",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("quest_id", sa.Integer(), nullable=False),
+        sa.Column("score", sa.Integer(), nullable=True),
+        sa.Column("completed_at", sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.ForeignKeyConstraint(["quest_id"], ["quests.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_quest_results_id", "quest_results", ["id"], unique=False)
+    op.create_index("ix_quest_results_completed", "quest_results", ["completed_at", "id"], unique=False)
+    op.execute(
+        "INSERT INTO quest_results (user_id, quest_id, score, completed_at) "
+        "SELECT user_id, quest_id, score, completed_at FROM user_quests "
+        "WHERE is_completed = true AND completed_at IS NOT NULL ORDER BY completed_at, id"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_quest_results_completed", table_name="quest_results")
+    op.drop_index("ix_quest_results_id", table_name="quest_results")
+    op.drop_table("quest_results")
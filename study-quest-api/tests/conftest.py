@@ -0,0 +1,50 @@
+"""测试夹具：内存存储后端上的真实应用
+
+配置在导入 main 之前通过环境变量设置；每个 TestClient 的生命周期对应一个全新的内存数据库。
+"""
+import os
+
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("QUEST_SCHEDULER", "off")
+os.environ.setdefault("LIVE_BACKEND", "memory")
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from app.core.security import token_cache
+
+
+def login(client: TestClient, username: str, role: str = "student", password: str = "123456") -> dict:
+    """注册并登录，返回带访问令牌的请求头"""
+    response = client.post("/api/auth/register", json={"username": username, "password": password, "role": role})
+    assert response.status_code == 200, response.text
+    response = client.post("/api/auth/login-json", json={"username": username, "password": password})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture
+def client():
+    # 每个测试都是新库，用户 ID 会重复；清空令牌缓存以免沿用上一个测试中同 ID 用户的身份
+    token_cache.clear()
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def student(client) -> dict:
+    return login(client, "student")
+
+
+@pytest.fixture
+def quest_id(client) -> int:
+    teacher = login(client, "teacher", role="teacher")
+    response = client.post(
+        "/api/quests/",
+        json={"title": "口算练习", "subject": "数学", "experience_reward": 30, "gold_reward": 10},
+        headers=teacher,
+    )
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
@@ -0,0 +1,144 @@
+"""对战房间：多 worker 转发（两个 RedisBattleBroker 共用一个进程内的 Redis 替身，键过期按可控时钟计算）与连接认证"""
+from fnmatch import fnmatch
+import asyncio
+import time
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from app.core.config import settings
+from app.core.security import BATTLE_SOCKET_SCOPE, create_stream_ticket
+from app.services.battle_rooms import BattleRoomManager, RedisBattleBroker
+
+
+class FakeRedis:
+    """只实现对战代理用到的命令：set/get/expire/delete/publish 与 pubsub"""
+
+    def __init__(self):
+        self.now = 0.0
+        self._values = {}
+        self._pubsubs = []
+
+    async def set(self, key, value, ex=None):
+        self._values[key] = (value, self.now + ex if ex else None)
+
+    async def get(self, key):
+        value, expires_at = self._values.get(key, (None, None))
+        if expires_at is not None and expires_at <= self.now:
+            del self._values[key]
+            return None
+        return value
+
+    async def expire(self, key, seconds):
+        if await self.get(key) is not None:
+            self._values[key] = (self._values[key][0], self.now + seconds)
+
+    async def delete(self, key):
+        self._values.pop(key, None)
+
+    async def publish(self, channel, data):
+        for pubsub in self._pubsubs:
+            pubsub.deliver(channel, data)
+
+    def pubsub(self):
+        pubsub = FakePubSub()
+        self._pubsubs.append(pubsub)
+        return pubsub
+
+    async def close(self):
+        pass
+
+
+class FakePubSub:
+    def __init__(self):
+        self.patterns = set()
+        self.channels = set()
+        self.queue = asyncio.Queue()
+
+    async def psubscribe(self, pattern):
+        self.patterns.add(pattern)
+
+    async def subscribe(self, channel):
+        self.channels.add(channel)
+
+    def deliver(self, channel, data):
+        if channel in self.channels:
+            self.queue.put_nowait({"type": "message", "channel": channel, "data": data})
+        for pattern in self.patterns:
+            if fnmatch(channel, pattern):
+                self.queue.put_nowait({"type": "pmessage", "channel": channel, "data": data})
+
+    async def listen(self):
+        while True:
+            yield await self.queue.get()
+
+    async def close(self):
+        pass
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_running_room_outlives_owner_ttl():
+    async def scenario():
+        redis = FakeRedis()
+        owner, other = BattleRoomManager(RedisBattleBroker(redis)), BattleRoomManager(RedisBattleBroker(redis))
+        await owner.broker.start(owner)
+        await other.broker.start(other)
+        questions = [{"prompt": f"{n} + 1 = ?", "options": ["1", "2"], "answer": 1} for n in range(3)]
+        room = await owner.create_room(1, "数学", questions, question_seconds=120, max_players=2)
+        try:
+            await owner.handle(room.room_id, {"type": "join", "user_id": 1})
+            assert await other.broker.send_command(room.room_id, {"type": "join", "user_id": 2})
+            await settle()
+
+            redis.now = settings.battle_room_ttl - 60
+            await owner.handle(room.room_id, {"type": "start", "user_id": 1})
+            await owner.handle(room.room_id, {"type": "answer", "user_id": 1, "index": 0, "choice": 1})
+
+            # 超过创建时设置的 TTL：另一 worker 上玩家的作答仍须转发给房间所属 worker
+            redis.now = settings.battle_room_ttl + 60
+            assert await other.broker.send_command(room.room_id, {"type": "answer", "user_id": 2, "index": 0, "choice": 1})
+            await settle()
+            assert room.current == 1
+            assert room.players[2].correct == 1
+        finally:
+            if room.timer is not None:
+                room.timer.cancel()
+            for manager in (owner, other):
+                manager.broker._reader.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_socket_requires_scoped_ticket(client, student):
+    room = client.post(
+        "/api/battles/rooms",
+        json={"subject": "数学", "questions": [{"prompt": "1 + 1 = ?", "options": ["1", "2"], "answer": 1}]},
+        headers=student,
+    ).json()
+    path = f"/api/battles/rooms/{room['room_id']}/ws"
+
+    # 访问令牌不能放在 URL 中
+    with pytest.raises(WebSocketDisconnect) as closed:
+        with client.websocket_connect(f"{path}?ticket={student['Authorization'][7:]}"):
+            pass
+    assert closed.value.code == 4401
+
+    ticket = client.post("/api/battles/ticket", headers=student).json()["ticket"]
+    with client.websocket_connect(f"{path}?ticket={ticket}") as socket:
+        assert socket.receive_json()["type"] == "room"
+
+
+def test_socket_closes_when_token_expires(client, student):
+    room = client.post(
+        "/api/battles/rooms",
+        json={"subject": "数学", "questions": [{"prompt": "1 + 1 = ?", "options": ["1", "2"], "answer": 1}]},
+        headers=student,
+    ).json()
+    ticket = create_stream_ticket(1, int(time.time()) + 1, BATTLE_SOCKET_SCOPE)
+    with client.websocket_connect(f"/api/battles/rooms/{room['room_id']}/ws?ticket={ticket}") as socket:
+        assert socket.receive_json()["type"] == "room"
+        assert socket.receive_json()["type"] == "expired"
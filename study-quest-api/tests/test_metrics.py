@@ -0,0 +1,39 @@
+import asyncio
+
+from app.core.metrics import MetricsMiddleware, REQUESTS_IN_FLIGHT, REQUESTS_TOTAL, UNMATCHED_ROUTE
+
+
+def test_event_stream_recorded_at_handshake():
+    async def scenario():
+        opened, finish = asyncio.Event(), asyncio.Event()
+
+        async def stream_app(scope, receive, send):
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/event-stream; charset=utf-8")],
+            })
+            opened.set()
+            await finish.wait()
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+        async def send(message):
+            pass
+
+        in_flight = REQUESTS_IN_FLIGHT._values.get((), 0)
+        total_key = ("GET", UNMATCHED_ROUTE, "200")
+        total = REQUESTS_TOTAL._values.get(total_key, 0)
+        scope = {"type": "http", "path": "/api/users/events", "method": "GET"}
+        request = asyncio.create_task(MetricsMiddleware(stream_app)(scope, None, send))
+
+        # 连接保持期间不计入并发数，请求在握手时已记一次
+        await opened.wait()
+        assert REQUESTS_IN_FLIGHT._values.get((), 0) == in_flight
+        assert REQUESTS_TOTAL._values.get(total_key, 0) == total + 1
+
+        finish.set()
+        await request
+        assert REQUESTS_IN_FLIGHT._values.get((), 0) == in_flight
+        assert REQUESTS_TOTAL._values.get(total_key, 0) == total + 1
+
+    asyncio.run(scenario())
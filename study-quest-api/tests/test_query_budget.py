@@ -0,0 +1,69 @@
+"""关键路径的 SQL 条数上限：条数不应随任务数或批量事件数增长（防止 N+1 回归）"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.core.query_profiler import assert_max_queries
+from conftest import login
+
+QUEST_COUNT = 5
+
+
+@pytest.fixture
+def quest_ids(client, student) -> list:
+    teacher = login(client, "teacher", role="teacher")
+    ids = []
+    for index in range(QUEST_COUNT):
+        response = client.post(
+            "/api/quests/",
+            json={"title": f"练习 {index}", "subject": "数学", "experience_reward": 10, "gold_reward": 5},
+            headers=teacher,
+        )
+        ids.append(response.json()["id"])
+        client.post(f"/api/quests/start/{ids[-1]}", headers=student)
+    return ids
+
+
+def test_user_quests(client, student, quest_ids):
+    client.put(f"/api/quests/progress/{quest_ids[0]}", json={"progress": 100}, headers=student)
+
+    with assert_max_queries(2):
+        response = client.get("/api/quests/user", headers=student)
+    assert len(response.json()) == QUEST_COUNT
+
+
+def test_pomodoro_complete(client, student):
+    client.get("/api/users/profile", headers=student)
+
+    with assert_max_queries(4):
+        response = client.post(
+            "/api/battles/pomodoro-complete", params={"subject": "数学", "duration": 25 * 60}, headers=student
+        )
+    assert response.status_code == 200
+
+
+def test_sync_events(client, student, quest_ids):
+    now = datetime.now(timezone.utc)
+    events = [
+        {
+            "type": "pomodoro",
+            "client_event_id": f"pomodoro-{index}",
+            "occurred_at": (now - timedelta(minutes=30 * (10 - index))).isoformat(),
+            "subject": "数学",
+            "duration": 25 * 60,
+        }
+        for index in range(10)
+    ] + [
+        {
+            "type": "progress",
+            "client_event_id": f"progress-{quest_id}",
+            "occurred_at": now.isoformat(),
+            "quest_id": quest_id,
+            "progress": 100,
+        }
+        for quest_id in quest_ids
+    ]
+
+    with assert_max_queries(13):
+        response = client.post("/api/sync/events", json={"events": events}, headers=student)
+    assert [result["status"] for result in response.json()["results"]] == ["applied"] * len(events)
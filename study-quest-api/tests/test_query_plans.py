@@ -0,0 +1,22 @@
+"""热点查询执行计划：在预置数据上 EXPLAIN，不允许出现未使用索引的全表扫描
+
+查询与判定复用 benchmarks/explain_check.py，预置数据复用 benchmarks/loadtest.py。
+"""
+from types import SimpleNamespace
+
+from app.database import engine
+from explain_check import explain_plans, hot_queries
+from loadtest import insert_seed_rows
+
+
+def test_hot_queries_use_indexes(client):
+    async def explain():
+        async with engine.begin() as conn:
+            await insert_seed_rows(conn, SimpleNamespace(students=100, quests=50, history=10, seed=42))
+        async with engine.connect() as conn:
+            return await explain_plans(conn)
+
+    results = client.portal.call(explain)
+    assert set(results) == set(hot_queries())
+    scans = {name: result["seq_scans"] for name, result in results.items() if not result["ok"]}
+    assert not scans, scans
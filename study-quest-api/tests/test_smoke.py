@@ -0,0 +1,39 @@
+from conftest import login
+
+
+def test_login(client):
+    headers = login(client, "alice")
+    response = client.get("/api/users/profile", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["username"] == "alice"
+
+    response = client.post("/api/auth/login-json", json={"username": "alice", "password": "wrong"})
+    assert response.status_code == 401
+
+
+def test_quest_start_and_complete(client, student, quest_id):
+    response = client.post(f"/api/quests/start/{quest_id}", headers=student)
+    assert response.status_code == 200
+
+    response = client.put(f"/api/quests/progress/{quest_id}", json={"progress": 100, "score": 90}, headers=student)
+    assert response.status_code == 200
+    assert response.json()["completed"] is True
+
+    # 重复上报完成不再发放奖励
+    response = client.put(f"/api/quests/progress/{quest_id}", json={"progress": 100}, headers=student)
+    assert response.json()["completed"] is False
+
+    quests = client.get("/api/quests/user", headers=student).json()
+    assert [(q["quest_id"], q["is_completed"]) for q in quests] == [(quest_id, True)]
+    profile = client.get("/api/users/profile", headers=student).json()
+    assert profile["experience"] == 30
+
+
+def test_pomodoro_complete(client, student):
+    response = client.post(
+        "/api/battles/pomodoro-complete", params={"subject": "数学", "duration": 25 * 60}, headers=student
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["experience_gained"], body["gold_gained"]) == (25, 10)
+    assert body["total_experience"] == 25